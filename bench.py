@@ -0,0 +1,607 @@
+import contextlib
+import io
+import os
+import time
+from typing import Any
+
+from parser import Parser
+from scanner import Scanner
+from utils import color_print
+
+FIB_SOURCE = """
+def fib(n) {
+    if (n <= 1) {
+        return n;
+    }
+    return fib(n - 1) + fib(n - 2);
+}
+print fib(%d);
+"""
+
+LOOP_SOURCE = """
+var total = 0;
+var i = 0;
+while (i < %d) {
+    total = total + i * 2;
+    i = i + 1;
+}
+print total;
+"""
+
+NESTED_SOURCE = """
+def run(n) {
+    var total = 0;
+    var i = 0;
+    while (i < n) {
+        { var a = 1; { var b = 2; { var c = 3; { var d = 4; {
+            total = total + i;
+        } } } } }
+        i = i + 1;
+    }
+    return total;
+}
+print run(%d);
+"""
+
+CONSTANT_SOURCE = """
+var total = 0;
+var i = 0;
+while (i < %d) {
+    if (60 * 60 * 24 > 1000) {
+        total = total + (2 * 3 + 4) / (8 - 3);
+    }
+    i = i + 1;
+}
+print total;
+"""
+
+INVARIANT_SOURCE = """
+def poly(x, n) {
+    var total = 0;
+    for (var i = 0; i < n; i = i + 1;) {
+        for (var j = 0; j < 10; j = j + 1;) {
+            total = total + (x * x + 3 * x + 1) * j;
+        }
+    }
+    return total;
+}
+print poly(2, %d);
+"""
+
+
+def _time_engine(engine_cls, source: str, optimized: bool = False) -> float:
+    program = Parser(Scanner(source).scan()).parse()
+    if optimized:
+        from optimizer import optimize
+
+        program, _ = optimize(program)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine_cls().interpret(program)
+    return time.perf_counter() - start
+
+
+def _plain_interpreter():
+    from interpreter import Interpreter
+
+    # Memoization would hide the call costs these benchmarks measure.
+    return Interpreter(memoize=False)
+
+
+def _plain_stack_interpreter():
+    from stack_interpreter import StackInterpreter
+
+    return StackInterpreter(memoize=False)
+
+
+def bench_engines():
+    from run import ENGINES
+
+    ENGINES = {
+        **ENGINES,
+        "tree": _plain_interpreter,
+        "stack": _plain_stack_interpreter,
+    }
+    for name, source in (
+        ("fib(20)", FIB_SOURCE % 20),
+        ("loop(100000)", LOOP_SOURCE % 100000),
+        ("nested(20000)", NESTED_SOURCE % 20000),
+    ):
+        print("-" * 80)
+        print(color_print(f"Benchmark {name}", "green"))
+        baseline = None
+        for engine, engine_cls in ENGINES.items():
+            elapsed = _time_engine(engine_cls, source)
+            baseline = baseline or elapsed
+            print(f"{engine:>8}: {elapsed:8.3f}s  ({baseline / elapsed:5.1f}x)")
+
+
+def bench_call_frames():
+    print("-" * 80)
+    print(color_print("Benchmark call cost vs. number of globals (tree)", "green"))
+    for num_globals in (0, 50, 500):
+        decls = "".join(f"var g{idx} = {idx};\n" for idx in range(num_globals))
+        elapsed = _time_engine(_plain_interpreter, decls + FIB_SOURCE % 18)
+        print(f"{num_globals:>5} globals: {elapsed:8.3f}s")
+
+
+class _Return(Exception):
+    def __init__(self, value: Any):
+        self.value = value
+
+
+def _exception_return_interpreter():
+    from interpreter import Interpreter
+
+    class ExceptionReturnInterpreter(Interpreter):
+        """The tree-walker with `return` raising, as before completion signals."""
+
+        def visit_return_stmt(self, stmt):
+            raise _Return(None if stmt.expr is None else self.interpret(stmt.expr))
+
+        def visit_func_call(self, expr):
+            try:
+                return super().visit_func_call(expr)
+            except _Return as ret:
+                return ret.value
+
+    return ExceptionReturnInterpreter(memoize=False)
+
+
+def bench_call_overhead():
+    print("-" * 80)
+    print(color_print("Benchmark call overhead on fib (tree)", "green"))
+    for n in (15, 20):
+        calls = 2 * _fib(n + 1) - 1
+        source = FIB_SOURCE % n
+        raising = min(
+            _time_engine(_exception_return_interpreter, source) for _ in range(3)
+        )
+        elapsed = min(_time_engine(_plain_interpreter, source) for _ in range(3))
+        print(
+            f"fib({n}): {calls:>7} calls  "
+            f"raise: {raising / calls * 1e6:6.2f}us/call  "
+            f"signal: {elapsed / calls * 1e6:6.2f}us/call  "
+            f"({raising / elapsed:4.2f}x)"
+        )
+
+
+def bench_inlining():
+    from interpreter import Interpreter
+
+    source = """
+    def add(a, b) {
+        return a + b;
+    }
+    var total = 0;
+    for (var i = 0; i < %d; i = i + 1;) {
+        total = add(total, i);
+    }
+    print total;
+    """ % 50000
+    print("-" * 80)
+    print(color_print("Benchmark inlining a small helper (tree)", "green"))
+    baseline = _time_engine(lambda: Interpreter(memoize=False, inline=False), source)
+    elapsed = _time_engine(_plain_interpreter, source)
+    print(f"  calls: {baseline:8.3f}s")
+    print(f"inlined: {elapsed:8.3f}s  ({baseline / elapsed:5.1f}x)")
+
+
+def bench_counted_loops():
+    from interpreter import Interpreter
+
+    source = """
+    def sum_to(n) {
+        var total = 0;
+        for (var i = 0; i < n; i = i + 1;) {
+            total = total + i;
+        }
+        return total;
+    }
+    print sum_to(%d);
+    """ % 100000
+    print("-" * 80)
+    print(color_print("Benchmark counted for loops over a range (tree)", "green"))
+    baseline = _time_engine(
+        lambda: Interpreter(memoize=False, counted_loops=False), source
+    )
+    elapsed = _time_engine(_plain_interpreter, source)
+    print(f"generic: {baseline:8.3f}s")
+    print(f"counted: {elapsed:8.3f}s  ({baseline / elapsed:5.1f}x)")
+
+
+def bench_optimizer():
+    from optimizer import optimize
+
+    source = CONSTANT_SOURCE % 20000
+    print("-" * 80)
+    print(color_print("Benchmark AST optimizer on constant-heavy loop (tree)", "green"))
+    _, report = optimize(Parser(Scanner(source).scan()).parse())
+    print(f"report: {report}")
+    baseline = _time_engine(_plain_interpreter, source)
+    elapsed = _time_engine(_plain_interpreter, source, optimized=True)
+    print(f"    plain: {baseline:8.3f}s")
+    print(f"optimized: {elapsed:8.3f}s  ({baseline / elapsed:5.1f}x)")
+
+
+def bench_ir_passes():
+    from ir_interpreter import IRInterpreter
+
+    source = INVARIANT_SOURCE % 10000
+    print("-" * 80)
+    print(color_print("Benchmark IR passes on loop-invariant arithmetic", "green"))
+    baseline = _time_engine(lambda: IRInterpreter(passes=()), source)
+    interpreter = IRInterpreter()
+    elapsed = _time_engine(lambda: interpreter, source)
+    print(f"report: {interpreter.report}")
+    print(f"  no passes: {baseline:8.3f}s")
+    print(f"  optimized: {elapsed:8.3f}s  ({baseline / elapsed:5.1f}x)")
+
+
+def bench_memo():
+    from interpreter import Interpreter
+
+    print("-" * 80)
+    print(color_print("Benchmark memoization of pure functions (tree)", "green"))
+    source = FIB_SOURCE % 20
+    baseline = _time_engine(_plain_interpreter, source)
+    interpreter = None
+
+    def memo_interpreter():
+        nonlocal interpreter
+        interpreter = Interpreter()
+        return interpreter
+
+    elapsed = _time_engine(memo_interpreter, source)
+    print(f"   plain: {baseline:8.3f}s")
+    print(f"memoized: {elapsed:8.3f}s  ({baseline / elapsed:5.1f}x)")
+    print(f"hits={interpreter.memo_hits} misses={interpreter.memo_misses}")
+
+
+def bench_quicken():
+    from interpreter import Interpreter
+
+    print("-" * 80)
+    print(color_print("Benchmark quickened arithmetic (tree)", "green"))
+    source = LOOP_SOURCE % 100000
+    baseline = _time_engine(lambda: Interpreter(memoize=False, quicken=False), source)
+    interpreter = None
+
+    def quick_interpreter():
+        nonlocal interpreter
+        interpreter = Interpreter(memoize=False)
+        return interpreter
+
+    elapsed = _time_engine(quick_interpreter, source)
+    print(f"  generic: {baseline:8.3f}s")
+    print(f"quickened: {elapsed:8.3f}s  ({baseline / elapsed:5.1f}x)")
+    print(
+        f"quickened={interpreter.quickened} deoptimized={interpreter.deoptimized}"
+    )
+
+
+def _count_nodes(node) -> int:
+    from dataclasses import fields
+    from interface import Expr
+
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for f in fields(node):
+            value = getattr(node, f.name)
+            if isinstance(value, Expr):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(item for item in value if isinstance(item, Expr))
+    return count
+
+
+def bench_node_memory():
+    import tracemalloc
+
+    print("-" * 80)
+    print(color_print("Benchmark memory per AST node and token", "green"))
+    source = (FIB_SOURCE % 20) * 2000
+    tracemalloc.start()
+    tokens = Scanner(source).scan()
+    token_bytes, _ = tracemalloc.get_traced_memory()
+    program = Parser(tokens).parse()
+    total_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_nodes = _count_nodes(program)
+    print(f"tokens: {len(tokens):>8}  {token_bytes / len(tokens):6.1f} bytes/token")
+    print(
+        f" nodes: {num_nodes:>8}  "
+        f"{(total_bytes - token_bytes) / num_nodes:6.1f} bytes/node"
+    )
+
+
+def _retained_bytes(build) -> tuple[int, int, float]:
+    """Bytes and GC-tracked objects kept alive by `build()`'s result."""
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    objects = len(gc.get_objects())
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    objects = len(gc.get_objects()) - objects
+    del result
+    return retained, objects, elapsed
+
+
+def bench_flat_ast():
+    from flat_ast import FlatParser
+
+    print("-" * 80)
+    print(color_print("Benchmark object AST vs. flat AST", "green"))
+    source = (FIB_SOURCE % 20) * 2000
+    for name, parser_cls in (("objects", Parser), ("flat", FlatParser)):
+        retained, objects, elapsed = _retained_bytes(
+            lambda: parser_cls(Scanner(source).scan()).parse()
+        )
+        print(
+            f"{name:>8}: {retained / 1024:8.0f} KiB retained  "
+            f"{objects:>7} GC-tracked objects  {elapsed:6.3f}s"
+        )
+
+
+def bench_scanner():
+    from scanner import CharScanner
+
+    print("-" * 80)
+    print(color_print("Benchmark scanner throughput", "green"))
+    source = (FIB_SOURCE % 20 + NESTED_SOURCE % 10) * 2000
+    megabytes = len(source.encode()) / 1e6
+    baseline = None
+    for name, scanner_cls in (("char", CharScanner), ("regex", Scanner)):
+        start = time.perf_counter()
+        scanner_cls(source).scan()
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(
+            f"{name:>6}: {megabytes / elapsed:6.2f} MB/s  "
+            f"({baseline / elapsed:5.1f}x)"
+        )
+
+
+def bench_parser():
+    from parser import DescentParser
+
+    print("-" * 80)
+    print(color_print("Benchmark expression parsing: descent vs. Pratt", "green"))
+    source = (
+        "print (a + 2) * b - c / (d - 1) == e or f(x, y * 2) < -g and h >= 3;\n"
+        "var v = 1 + 2 * 3 - 4 / 5 + (6 - 7) * 8 + f(9) * -10;\n"
+    ) * 5000
+    tokens = Scanner(source).scan()
+    baseline = None
+    for name, parser_cls in (("descent", DescentParser), ("pratt", Parser)):
+        start = time.perf_counter()
+        parser_cls(tokens).parse()
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{name:>8}: {elapsed:6.3f}s  ({baseline / elapsed:5.1f}x)")
+
+
+def bench_streaming():
+    import tracemalloc
+
+    from interpreter import Interpreter
+    from parser import StreamingParser
+
+    print("-" * 80)
+    print(color_print("Benchmark streaming vs. whole-file execution (tree)", "green"))
+    source = "var total = 0;\n" + "total = total + 1;\nprint total;\n" * 10000
+    for name, streaming in (("whole", False), ("stream", True)):
+        stream = io.StringIO(source)
+        tracemalloc.start()
+        start = time.perf_counter()
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            if streaming:
+                tokens = Scanner(stream).tokens()
+                Interpreter().interpret_stream(StreamingParser(tokens).statements())
+            else:
+                Interpreter().interpret(Parser(Scanner(stream.read()).scan()).parse())
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:>6}: {peak / 1024:8.0f} KiB peak  {elapsed:6.3f}s")
+
+
+def bench_mmap_tokens():
+    import tempfile
+
+    from scanner import BufferScanner
+    from source import Source
+
+    print("-" * 80)
+    print(color_print("Benchmark str tokens vs. mmap offset tokens", "green"))
+    text = (FIB_SOURCE % 20 + NESTED_SOURCE % 10) * 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "script.txt")
+        with open(path, "w") as f:
+            f.write(text)
+
+        def read_and_scan():
+            with open(path) as f:
+                return Scanner(f.read()).scan()
+
+        retained, _, elapsed = _retained_bytes(read_and_scan)
+        print(f"   str: {retained / 1024:8.0f} KiB retained  {elapsed:6.3f}s")
+        with Source.open(path) as source:
+            retained, _, elapsed = _retained_bytes(
+                lambda: BufferScanner(source).scan()
+            )
+            print(f"  mmap: {retained / 1024:8.0f} KiB retained  {elapsed:6.3f}s")
+
+
+def bench_program_cache():
+    import tempfile
+
+    from cache import ProgramCache, parse_source
+
+    print("-" * 80)
+    print(color_print("Benchmark startup: cold parse vs. warm cache load", "green"))
+    rules = "".join(
+        f"def rule{idx}(x) {{ if (x > {idx}) {{ return x * 2 + {idx}; }} return x; }}\n"
+        for idx in range(3000)
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ProgramCache(tmp)
+        start = time.perf_counter()
+        parse_source(rules)
+        cold = time.perf_counter() - start
+        cache.get_or_parse(rules)
+        start = time.perf_counter()
+        cache.get_or_parse(rules)
+        warm = time.perf_counter() - start
+        assert cache.hits == 1
+    print(f"cold parse: {cold:8.3f}s")
+    print(f"warm cache: {warm:8.3f}s  ({cold / warm:5.1f}x)")
+
+
+def bench_lazy_parse():
+    from interpreter import Interpreter
+
+    print("-" * 80)
+    print(color_print("Benchmark library startup: eager vs. lazy bodies", "green"))
+    library = "".join(
+        f"def lib{idx}(x, y) {{ var t = x * {idx}; if (t > y) {{ return t - y; }}"
+        f" while (y < t) {{ y = y + {idx + 1}; }} return y; }}\n"
+        for idx in range(500)
+    )
+    source = library + "".join(f"lib{idx}(3, 5);\n" for idx in range(0, 500, 100))
+    tokens = Scanner(source).scan()
+
+    def parse_and_run(lazy: bool):
+        program = Parser(tokens, lazy=lazy).parse()
+        Interpreter().interpret(program)
+        return program
+
+    for lazy in (False, True):
+        retained, objects, elapsed = _retained_bytes(lambda: parse_and_run(lazy))
+        name = "lazy" if lazy else "eager"
+        print(
+            f"{name:>8}: {retained / 1024:8.0f} KiB retained  "
+            f"{objects:>7} GC-tracked objects  {elapsed:6.3f}s"
+        )
+
+
+def bench_incremental():
+    from incremental import Document
+    from resolver import Resolver
+
+    print("-" * 80)
+    print(color_print("Benchmark editing: full re-parse vs. incremental", "green"))
+    for num_funcs in (200, 2000):
+        text = "".join(
+            f"def f{idx}(x) {{\n    var y = x * {idx};\n    return y + 1;\n}}\n"
+            for idx in range(num_funcs)
+        )
+        # Type a new statement into the middle of the file, one key at a time.
+        offset = text.index(f"def f{num_funcs // 2}(")
+        keys = "print f1(2);\n"
+        start = time.perf_counter()
+        edited = text
+        for idx, key in enumerate(keys):
+            edited = edited[: offset + idx] + key + edited[offset + idx :]
+            try:
+                Resolver().resolve(Parser(Scanner(edited).scan()).parse())
+            except (AssertionError, ValueError):
+                # Half-typed statement.
+                pass
+        full = (time.perf_counter() - start) / len(keys)
+        doc = Document(text)
+        start = time.perf_counter()
+        for idx, key in enumerate(keys):
+            doc.edit(offset + idx, 0, key)
+        incremental = (time.perf_counter() - start) / len(keys)
+        assert doc.error is None and doc.text == edited
+        print(
+            f"{len(text) // 1024:>5} KiB: full {full * 1e3:8.2f} ms/key  "
+            f"incremental {incremental * 1e3:6.2f} ms/key  ({full / incremental:5.0f}x)"
+        )
+
+
+def bench_stack_depth():
+    from interpreter import Interpreter
+    from stack_interpreter import StackInterpreter
+
+    print("-" * 80)
+    print(color_print("Benchmark recursion depth: tree vs. stack evaluator", "green"))
+    source = """
+    def down(n) {
+        if (n == 0) {
+            return 0;
+        }
+        return 1 + down(n - 1);
+    }
+    down(%d);
+    """
+
+    def run(engine, depth: int) -> float:
+        program = Parser(Scanner(source % depth).scan()).parse()
+        start = time.perf_counter()
+        engine(memoize=False).interpret(program)
+        return time.perf_counter() - start
+
+    # Deepest non-tail recursion the recursive evaluator survives.
+    lo, hi = 1, 2
+    while True:
+        try:
+            run(Interpreter, hi)
+        except RecursionError:
+            break
+        lo, hi = hi, hi * 2
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        try:
+            run(Interpreter, mid)
+            lo = mid
+        except RecursionError:
+            hi = mid
+    print(f"    tree: max depth {lo}")
+    for factor in (100, 1000):
+        depth = lo * factor
+        print(f"   stack: depth {depth:>8} ({factor}x)  {run(StackInterpreter, depth):6.3f}s")
+
+
+def _fib(n: int) -> int:
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+def main():
+    bench_engines()
+    bench_call_frames()
+    bench_call_overhead()
+    bench_inlining()
+    bench_counted_loops()
+    bench_optimizer()
+    bench_ir_passes()
+    bench_memo()
+    bench_quicken()
+    bench_node_memory()
+    bench_flat_ast()
+    bench_scanner()
+    bench_parser()
+    bench_streaming()
+    bench_mmap_tokens()
+    bench_program_cache()
+    bench_lazy_parse()
+    bench_incremental()
+    bench_stack_depth()
+
+
+if __name__ == "__main__":
+    main()
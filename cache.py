@@ -0,0 +1,217 @@
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+
+from expr import Program
+from optimizer import optimize
+from parser import Parser
+from resolver import Resolver
+from scanner import Scanner
+
+logger = logging.getLogger(__name__)
+
+# Default cap on the total size of a cache directory.
+DEFAULT_CACHE_MAX_BYTES = 64 << 20
+
+# Bumped whenever the on-disk layout changes.
+_FORMAT_VERSION = 1
+_MAGIC = b"TIPC"
+_SUFFIX = ".tipc"
+# What unpickling a truncated, corrupt or concurrently evicted entry raises.
+_LOAD_ERRORS = (pickle.UnpicklingError, EOFError, AttributeError, ImportError, OSError)
+
+# Modules whose code decides what a parsed, resolved and optimized program
+# looks like; editing any of them invalidates every cache entry.
+_FRONT_END_MODULES = (
+    "tok.py",
+    "scanner.py",
+    "interface.py",
+    "expr.py",
+    "parser.py",
+    "resolver.py",
+    "optimizer.py",
+)
+
+_interpreter_version: str | None = None
+
+
+def interpreter_version() -> str:
+    """Hash of the front-end sources, the cache format and the Python version."""
+    global _interpreter_version
+    if _interpreter_version is None:
+        digest = hashlib.sha256(f"{_FORMAT_VERSION}:{sys.version_info[:2]}".encode())
+        root = os.path.dirname(os.path.abspath(__file__))
+        for module in _FRONT_END_MODULES:
+            with open(os.path.join(root, module), "rb") as f:
+                digest.update(f.read())
+        _interpreter_version = digest.hexdigest()[:16]
+    return _interpreter_version
+
+
+class ProgramCache:
+    """
+    Directory of parsed programs, the `.pyc` of this interpreter.
+
+    Entries hold the resolved (and, if requested, optimized) `Program` as a
+    pickle behind a small header, keyed by the sha256 of the source and the
+    `interpreter_version()`. Writes go through a temporary file and
+    `os.replace`, so readers never see a partial entry. When the directory
+    grows past `max_bytes`, the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _key(self, source: str, optimized: bool) -> str:
+        digest = hashlib.sha256(source.encode())
+        digest.update(f":{interpreter_version()}:{int(optimized)}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def load(self, source: str, optimized: bool = False) -> Program | None:
+        key = self._key(source, optimized)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        header = _MAGIC + key.encode()
+        if not data.startswith(header):
+            logger.debug(f"Ignoring corrupt cache entry {path}")
+            return None
+        try:
+            program = pickle.loads(memoryview(data)[len(header) :])
+            # Keeps recently used entries out of eviction.
+            os.utime(path)
+        except _LOAD_ERRORS as exc:
+            logger.debug(f"Dropping unreadable cache entry {path}: {exc!r}")
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return program
+
+    def store(self, source: str, program: Program, optimized: bool = False):
+        key = self._key(source, optimized)
+        data = _MAGIC + key.encode() + pickle.dumps(program, pickle.HIGHEST_PROTOCOL)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def get_or_parse(self, source: str, optimized: bool = False) -> Program:
+        program = self.load(source, optimized)
+        if program is not None:
+            self.hits += 1
+            return program
+        self.misses += 1
+        program = parse_source(source, optimized)
+        self.store(source, program, optimized)
+        return program
+
+
+def parse_source(source: str, optimized: bool = False) -> Program:
+    """Scans, parses, optionally optimizes and resolves `source`."""
+    program = Parser(Scanner(source).scan()).parse()
+    if optimized:
+        program, report = optimize(program)
+        logger.info(f"Optimizer: {report}")
+        for change in report.changes:
+            logger.debug(change)
+    Resolver().resolve(program)
+    return program
+
+
+def test_cache():
+    import contextlib
+    import io
+
+    from interpreter import Interpreter
+
+    print("-" * 80)
+    print("Testing program cache")
+    source = """
+    def fib(n) {
+        if (n <= 1) {
+            return n;
+        }
+        return fib(n - 1) + fib(n - 2);
+    }
+    print fib(10) + 2 * 3;
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ProgramCache(tmp)
+        cold = cache.get_or_parse(source, optimized=True)
+        warm = cache.get_or_parse(source, optimized=True)
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert warm == cold and warm is not cold and warm.resolved
+        # The optimizer flag is part of the key.
+        assert cache.load(source) is None
+
+        outputs = []
+        for program in (cold, warm):
+            buf = io.StringIO()
+            with contextlib.redirect_stdout(buf):
+                Interpreter().interpret(program)
+            outputs.append(buf.getvalue())
+        assert outputs[0] == outputs[1], outputs
+
+        # Least recently used entries go first once the cap is exceeded.
+        size = os.path.getsize(cache._path(cache._key(source, True)))
+        cache = ProgramCache(tmp, max_bytes=size * 2 + size // 2)
+        for idx in range(3):
+            cache.get_or_parse(source + f"print {idx};")
+        entries = [name for name in os.listdir(tmp) if name.endswith(_SUFFIX)]
+        assert len(entries) == 2, entries
+        assert cache.load(source, optimized=True) is None
+        assert not [name for name in os.listdir(tmp) if name.endswith(".tmp")]
+
+        # A truncated entry is a miss: it is dropped and parsed again.
+        cache = ProgramCache(tmp)
+        cache.get_or_parse(source)
+        path = cache._path(cache._key(source, False))
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[: len(data) // 2])
+        assert cache.load(source) is None and not os.path.exists(path)
+        assert cache.get_or_parse(source) == parse_source(source)
+        assert cache.misses == 2 and os.path.exists(path)
+
+
+if __name__ == "__main__":
+    test_cache()
@@ -0,0 +1,528 @@
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from func import FuncBase, NativeFunc, build_native_func_sleep, build_native_func_time
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    STATEMENT_TYPES,
+    UnaryExpr,
+    WhileStmt,
+)
+from interpreter import add_values, check_numbers
+from resolver import Resolver
+from tok import TokenType
+from utils import color_print
+
+# Every compiled node takes the globals table and the scope arrays of the
+# current activation. Expressions return their value. Statements return None
+# on normal completion and a 1-tuple holding the value on `return`.
+Globals = dict[str, Any]
+Scopes = list[list[Any]]
+Closure = Callable[[Globals, Scopes], Any]
+
+
+@dataclass
+class CompiledFunc(FuncBase):
+    body: Closure
+
+
+def _compile_add(left: Closure, right: Closure) -> Closure:
+    def add(g, sc):
+        left_val = left(g, sc)
+        right_val = right(g, sc)
+        if left_val.__class__ is float and right_val.__class__ is float:
+            return left_val + right_val
+        return add_values(left_val, right_val)
+
+    return add
+
+
+def _compile_add_const(left: Closure, right_val: Any) -> Closure:
+    if right_val.__class__ is not float:
+        return _compile_add(left, lambda g, sc: right_val)
+
+    def add_const(g, sc):
+        left_val = left(g, sc)
+        if left_val.__class__ is float:
+            return left_val + right_val
+        return add_values(left_val, right_val)
+
+    return add_const
+
+
+def _compile_sub(left: Closure, right: Closure) -> Closure:
+    def sub(g, sc):
+        left_val = left(g, sc)
+        right_val = right(g, sc)
+        if left_val.__class__ is not float or right_val.__class__ is not float:
+            check_numbers(left_val, right_val)
+        return left_val - right_val
+
+    return sub
+
+
+def _compile_sub_const(left: Closure, right_val: Any) -> Closure:
+    if right_val.__class__ is not float:
+        return _compile_sub(left, lambda g, sc: right_val)
+
+    def sub_const(g, sc):
+        left_val = left(g, sc)
+        if left_val.__class__ is not float:
+            check_numbers(left_val, right_val)
+        return left_val - right_val
+
+    return sub_const
+
+
+def _compile_mul(left: Closure, right: Closure) -> Closure:
+    def mul(g, sc):
+        left_val = left(g, sc)
+        right_val = right(g, sc)
+        if left_val.__class__ is not float or right_val.__class__ is not float:
+            check_numbers(left_val, right_val)
+        return left_val * right_val
+
+    return mul
+
+
+def _compile_div(left: Closure, right: Closure) -> Closure:
+    def div(g, sc):
+        left_val = left(g, sc)
+        right_val = right(g, sc)
+        if left_val.__class__ is not float or right_val.__class__ is not float:
+            check_numbers(left_val, right_val)
+        return left_val / right_val
+
+    return div
+
+
+# Comparisons have no type checks, so each one is a single specialized lambda.
+_COMPARE_OPS: dict[TokenType, Callable[[Closure, Closure], Closure]] = {
+    TokenType.EQUAL_EQUAL: lambda l, r: lambda g, sc: l(g, sc) == r(g, sc),
+    TokenType.BANG_EQUAL: lambda l, r: lambda g, sc: l(g, sc) != r(g, sc),
+    TokenType.GREATER: lambda l, r: lambda g, sc: l(g, sc) > r(g, sc),
+    TokenType.GREATER_EQUAL: lambda l, r: lambda g, sc: l(g, sc) >= r(g, sc),
+    TokenType.LESS: lambda l, r: lambda g, sc: l(g, sc) < r(g, sc),
+    TokenType.LESS_EQUAL: lambda l, r: lambda g, sc: l(g, sc) <= r(g, sc),
+}
+
+_COMPARE_CONST_OPS: dict[TokenType, Callable[[Closure, Any], Closure]] = {
+    TokenType.EQUAL_EQUAL: lambda l, c: lambda g, sc: l(g, sc) == c,
+    TokenType.BANG_EQUAL: lambda l, c: lambda g, sc: l(g, sc) != c,
+    TokenType.GREATER: lambda l, c: lambda g, sc: l(g, sc) > c,
+    TokenType.GREATER_EQUAL: lambda l, c: lambda g, sc: l(g, sc) >= c,
+    TokenType.LESS: lambda l, c: lambda g, sc: l(g, sc) < c,
+    TokenType.LESS_EQUAL: lambda l, c: lambda g, sc: l(g, sc) <= c,
+}
+
+
+def _is_constant(expr: Expr) -> bool:
+    return (
+        isinstance(expr, LiteralExpr)
+        and expr.value.token_type != TokenType.IDENTIFIER
+    )
+
+
+class ClosureCompiler(Visitor):
+    """
+    Turns a resolved AST into a tree of specialized Python closures.
+
+    Each `visit_*` method returns the closure for its node, so dispatch on
+    node and operator type happens once at compile time instead of on every
+    evaluation.
+    """
+
+    def __init__(self, interpreter: "CompiledInterpreter"):
+        self._interpreter = interpreter
+        self._func_depth = 0
+
+    def compile(self, expr: Expr) -> Closure:
+        return self._statement(expr)
+
+    def _statement(self, stmt: Expr) -> Closure:
+        closure = stmt.accept(self)
+        if isinstance(stmt, STATEMENT_TYPES):
+            return closure
+
+        def expr_stmt(g, sc):
+            closure(g, sc)
+
+        return expr_stmt
+
+    def _load(self, name: str, depth: int | None, slot: int | None) -> Closure:
+        if depth is None:
+
+            def get_global(g, sc):
+                if name not in g:
+                    raise ValueError(f"Undefined variable: {name}")
+                return g[name]
+
+            return get_global
+        if depth == 0:
+            return lambda g, sc: sc[-1][slot]
+        index = -1 - depth
+        return lambda g, sc: sc[index][slot]
+
+    ########################################################
+    # Expressions
+    ########################################################
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        token = expr.value
+        if token.token_type == TokenType.IDENTIFIER:
+            return self._load(token.lexeme, expr.depth, expr.slot)
+        value = token.literal
+        return lambda g, sc: value
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        right = expr.right.accept(self)
+        match expr.op.token_type:
+            case TokenType.MINUS:
+
+                def negate(g, sc):
+                    val = right(g, sc)
+                    assert isinstance(val, float), f"UnaryExpr: {val} is not a number"
+                    return -val
+
+                return negate
+            case TokenType.BANG:
+
+                def not_(g, sc):
+                    val = right(g, sc)
+                    assert isinstance(val, bool), f"UnaryExpr: {val} is not a boolean"
+                    return not val
+
+                return not_
+        assert False, f"UnaryExpr: {expr.op.token_type} is not accepted"
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        op = expr.op.token_type
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        right_const = _is_constant(expr.right)
+        right_val = expr.right.value.literal if right_const else None
+
+        match op:
+            case TokenType.AND:
+                return lambda g, sc: right(g, sc) if left(g, sc) else False
+            case TokenType.OR:
+                return lambda g, sc: left(g, sc) or right(g, sc)
+            case TokenType.PLUS:
+                if right_const:
+                    return _compile_add_const(left, right_val)
+                return _compile_add(left, right)
+            case TokenType.MINUS:
+                if right_const:
+                    return _compile_sub_const(left, right_val)
+                return _compile_sub(left, right)
+            case TokenType.STAR:
+                return _compile_mul(left, right)
+            case TokenType.SLASH:
+                return _compile_div(left, right)
+        assert op in _COMPARE_OPS, f"BinaryExpr: {op} is not handled"
+        if right_const:
+            return _COMPARE_CONST_OPS[op](left, right_val)
+        return _COMPARE_OPS[op](left, right)
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        return expr.expr.accept(self)
+
+    def visit_func_call(self, expr: "FuncCall"):
+        func_name = expr.name.lexeme
+        load = self._load(func_name, expr.depth, expr.slot)
+        args = [arg.accept(self) for arg in expr.args]
+        num_args = len(args)
+        interpreter = self._interpreter
+
+        def call(g, sc):
+            func = load(g, sc)
+            if func.__class__ is CompiledFunc:
+                assert num_args == len(
+                    func.params
+                ), f"FuncCall: {func_name} has {num_args} arguments, but {len(func.params)} parameters"
+                res = func.body(g, [[arg(g, sc) for arg in args]])
+                return None if res is None else res[0]
+            assert isinstance(func, FuncBase), f"FuncCall: {func_name} is not a function"
+            assert num_args == len(
+                func.params
+            ), f"FuncCall: {func_name} has {num_args} arguments, but {len(func.params)} parameters"
+            assert isinstance(func, NativeFunc)
+            kwargs = {param: arg(g, sc) for param, arg in zip(func.params, args)}
+            return func.func(interpreter, **kwargs)
+
+        return call
+
+    ########################################################
+    # Statements
+    ########################################################
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        expr = stmt.expr.accept(self)
+
+        def print_stmt(g, sc):
+            str = f"[interpreter] {expr(g, sc)}"
+            str = color_print(str, "yellow")
+            print(str)
+
+        return print_stmt
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        name = stmt.name.lexeme
+        expr = (lambda g, sc: None) if stmt.expr is None else stmt.expr.accept(self)
+        if stmt.slot is None:
+
+            def define_global(g, sc):
+                val = expr(g, sc)
+                assert name not in g, f"Variable already defined: {name}"
+                g[name] = val
+
+            return define_global
+        slot = stmt.slot
+
+        def define_local(g, sc):
+            sc[-1][slot] = expr(g, sc)
+
+        return define_local
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        name = stmt.name.lexeme
+        expr = stmt.expr.accept(self)
+        if stmt.depth is None:
+
+            def assign_global(g, sc):
+                val = expr(g, sc)
+                if name not in g:
+                    raise ValueError(f"Undefined variable: {name}")
+                g[name] = val
+
+            return assign_global
+        index = -1 - stmt.depth
+        slot = stmt.slot
+
+        def assign_local(g, sc):
+            sc[index][slot] = expr(g, sc)
+
+        return assign_local
+
+    def _sequence(self, stmts: list[Closure]) -> Closure:
+        if len(stmts) == 1:
+            return stmts[0]
+
+        def sequence(g, sc):
+            for stmt in stmts:
+                res = stmt(g, sc)
+                if res is not None:
+                    return res
+
+        return sequence
+
+    def visit_block(self, block: "Block"):
+        body = self._sequence([self._statement(stmt) for stmt in block.exprs])
+        num_slots = block.num_slots
+        if not num_slots:
+            # Declares nothing, so the resolver gave it no scope.
+            return body
+
+        def block_(g, sc):
+            sc.append([None] * num_slots)
+            res = body(g, sc)
+            sc.pop()
+            return res
+
+        return block_
+
+    def visit_program(self, program: "Program"):
+        return self._sequence([self._statement(stmt) for stmt in program.exprs])
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        condition = stmt.condition.accept(self)
+        then_branch = self._statement(stmt.then_branch)
+        if stmt.else_branch is None:
+
+            def if_then(g, sc):
+                if condition(g, sc):
+                    return then_branch(g, sc)
+
+            return if_then
+        else_branch = self._statement(stmt.else_branch)
+
+        def if_else(g, sc):
+            if condition(g, sc):
+                return then_branch(g, sc)
+            return else_branch(g, sc)
+
+        return if_else
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        condition = stmt.condition.accept(self)
+        body = self._statement(stmt.body)
+
+        def while_(g, sc):
+            while condition(g, sc):
+                res = body(g, sc)
+                if res is not None:
+                    return res
+
+        return while_
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        init = self._statement(stmt.init)
+        condition = stmt.condition.accept(self)
+        body = self._statement(stmt.body)
+        update = self._statement(stmt.update)
+
+        def for_(g, sc):
+            init(g, sc)
+            while condition(g, sc):
+                res = body(g, sc)
+                if res is not None:
+                    return res
+                update(g, sc)
+
+        return for_
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        self._func_depth += 1
+        body = self._statement(stmt.body)
+        self._func_depth -= 1
+        func = CompiledFunc(
+            name=stmt.name.lexeme,
+            params=[param.lexeme for param in stmt.params],
+            body=body,
+        )
+        name = func.name
+        if stmt.slot is None:
+
+            def define_global(g, sc):
+                assert name not in g, f"Variable already defined: {name}"
+                g[name] = func
+
+            return define_global
+        slot = stmt.slot
+
+        def define_local(g, sc):
+            sc[-1][slot] = func
+
+        return define_local
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if self._func_depth == 0:
+            raise ValueError("Return outside of a function")
+        if stmt.expr is None:
+            return lambda g, sc: (None,)
+        expr = stmt.expr.accept(self)
+        return lambda g, sc: (expr(g, sc),)
+
+
+class CompiledInterpreter:
+    """
+    Drop-in alternative to `Interpreter`: `interpret()` compiles the program
+    into closures once and then runs them.
+    """
+
+    def __init__(self):
+        self._globals: Globals = {}
+        self._load_native_funcs()
+
+    def _load_native_funcs(self):
+        for native in (build_native_func_time(), build_native_func_sleep()):
+            self._globals[native.name] = native
+
+    def interpret(self, expr: Expr) -> Any:
+        if isinstance(expr, Program) and not expr.resolved:
+            Resolver().resolve(expr)
+        closure = ClosureCompiler(self).compile(expr)
+        return closure(self._globals, [])
+
+
+def test_closure_compiler():
+    import contextlib
+    import io
+
+    from interpreter import Interpreter
+    from parser import Parser
+    from scanner import Scanner
+
+    sources = [
+        """
+        var a = 1;
+        var b = 2;
+        print a + b;
+        {
+            var a = 4;
+            print a + b;
+        }
+        print (a + 2) * 3 / 4 - 1;
+        print "con" + "cat";
+        print a > b or a < b;
+        print a > b and a < b;
+        print nil or "fallback";
+        """,
+        """
+        var itr = 0;
+        while (itr < 5) {
+            var sq = itr * itr;
+            if sq > 4 {
+                print sq;
+            } else {
+                print -sq;
+            }
+            itr = itr + 1;
+        }
+        for (var i = 0; i < 3; i = i + 1;) {
+            print i == 1;
+        }
+        """,
+        """
+        var g = 10;
+        def fib(n) {
+            if (n <= 1) {
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+        def touch() {
+            g = 20;
+            return g;
+        }
+        def add(a, b) {
+            return a + b;
+        }
+        def mix(fn1, a, b) {
+            print fn1(a, b);
+        }
+        print fib(15);
+        print touch();
+        print g;
+        mix(add, 1, 2);
+        """,
+    ]
+
+    for source in sources:
+        print("-" * 80)
+        print(f"Testing source: {source}")
+        outputs = []
+        for engine in (Interpreter, CompiledInterpreter):
+            program = Parser(Scanner(source).scan()).parse()
+            buf = io.StringIO()
+            with contextlib.redirect_stdout(buf):
+                engine().interpret(program)
+            outputs.append(buf.getvalue())
+        print(outputs[1], end="")
+        assert outputs[0] == outputs[1], f"Closure output differs:\n{outputs}"
+
+
+if __name__ == "__main__":
+    test_closure_compiler()
@@ -0,0 +1,403 @@
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any
+
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    STATEMENT_TYPES,
+    UnaryExpr,
+    WhileStmt,
+)
+from tok import TokenType
+
+
+class OpCode(IntEnum):
+    # Every instruction is two slots wide: (opcode, operand).
+    CONST = 0
+    POP = 1
+    GET_LOCAL = 2
+    SET_LOCAL = 3
+    GET_GLOBAL = 4
+    SET_GLOBAL = 5
+    DEFINE_GLOBAL = 6
+    ADD = 7
+    SUBTRACT = 8
+    MULTIPLY = 9
+    DIVIDE = 10
+    NEGATE = 11
+    NOT = 12
+    EQUAL = 13
+    NOT_EQUAL = 14
+    GREATER = 15
+    GREATER_EQUAL = 16
+    LESS = 17
+    LESS_EQUAL = 18
+    JUMP = 19
+    JUMP_IF_FALSE = 20
+    JUMP_IF_TRUE_OR_POP = 21
+    PRINT = 22
+    CALL = 23
+    RETURN = 24
+
+
+BINARY_OPS: dict[TokenType, OpCode] = {
+    TokenType.PLUS: OpCode.ADD,
+    TokenType.MINUS: OpCode.SUBTRACT,
+    TokenType.STAR: OpCode.MULTIPLY,
+    TokenType.SLASH: OpCode.DIVIDE,
+    TokenType.EQUAL_EQUAL: OpCode.EQUAL,
+    TokenType.BANG_EQUAL: OpCode.NOT_EQUAL,
+    TokenType.GREATER: OpCode.GREATER,
+    TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+    TokenType.LESS: OpCode.LESS,
+    TokenType.LESS_EQUAL: OpCode.LESS_EQUAL,
+}
+
+
+@dataclass
+class Chunk:
+    code: list[int] = field(default_factory=list)
+    constants: list[Any] = field(default_factory=list)
+    lines: list[int] = field(default_factory=list)
+    _const_index: dict[tuple[type, str], int] = field(
+        default_factory=dict, repr=False
+    )
+
+    def emit(self, op: OpCode, arg: int = 0, lineno: int = 0) -> int:
+        self.code.append(int(op))
+        self.code.append(arg)
+        self.lines.append(lineno)
+        return len(self.code) - 2
+
+    def patch(self, offset: int, arg: int):
+        self.code[offset + 1] = arg
+
+    def add_constant(self, value: Any) -> int:
+        # Scalars are deduplicated, functions are not.
+        key = None
+        if value is None or isinstance(value, bool | float | str):
+            # repr() keeps 0.0 and -0.0 apart.
+            key = (type(value), repr(value))
+            if key in self._const_index:
+                return self._const_index[key]
+        self.constants.append(value)
+        if key is not None:
+            self._const_index[key] = len(self.constants) - 1
+        return len(self.constants) - 1
+
+
+@dataclass
+class Function:
+    name: str
+    params: list[str]
+    chunk: Chunk = field(default_factory=Chunk)
+    num_slots: int = 0
+
+
+@dataclass
+class _FuncState:
+    function: Function
+    scopes: list[dict[str, int]]
+    next_slot: int = 0
+
+
+class Compiler(Visitor):
+    """
+    Lowers a Program into bytecode for the stack VM in `vm.py`.
+
+    Top-level declarations live in the globals table and are accessed by name.
+    Everything declared in a block or function body gets a fixed slot in the
+    frame, so the VM never searches scopes at runtime.
+    """
+
+    def __init__(self):
+        self._state: _FuncState | None = None
+        self._lineno = 0
+
+    def compile(self, expr: Expr) -> Function:
+        script = Function(name="<script>", params=[])
+        self._state = _FuncState(function=script, scopes=[])
+        self._statement(expr)
+        self._emit(OpCode.CONST, self._chunk().add_constant(None))
+        self._emit(OpCode.RETURN)
+        return script
+
+    def _chunk(self) -> Chunk:
+        return self._state.function.chunk
+
+    def _emit(self, op: OpCode, arg: int = 0) -> int:
+        return self._chunk().emit(op, arg, self._lineno)
+
+    def _emit_jump(self, op: OpCode) -> int:
+        return self._emit(op, -1)
+
+    def _patch_jump(self, offset: int):
+        self._chunk().patch(offset, len(self._chunk().code))
+
+    def _statement(self, stmt: Expr):
+        stmt.accept(self)
+        if not isinstance(stmt, STATEMENT_TYPES):
+            self._emit(OpCode.POP)
+
+    ########################################################
+    # Scopes
+    ########################################################
+    def _begin_scope(self):
+        self._state.scopes.append({})
+
+    def _end_scope(self):
+        scope = self._state.scopes.pop()
+        self._state.next_slot -= len(scope)
+
+    def _declare_local(self, name: str) -> int:
+        state = self._state
+        scope = state.scopes[-1]
+        if name in scope:
+            raise ValueError(f"Variable already defined: {name}")
+        slot = state.next_slot
+        scope[name] = slot
+        state.next_slot += 1
+        state.function.num_slots = max(state.function.num_slots, state.next_slot)
+        return slot
+
+    def _resolve_local(self, name: str) -> int | None:
+        for scope in reversed(self._state.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def _load(self, name: str):
+        slot = self._resolve_local(name)
+        if slot is not None:
+            self._emit(OpCode.GET_LOCAL, slot)
+        else:
+            self._emit(OpCode.GET_GLOBAL, self._chunk().add_constant(name))
+
+    def _define(self, name: str):
+        if self._state.scopes:
+            self._emit(OpCode.SET_LOCAL, self._declare_local(name))
+        else:
+            self._emit(OpCode.DEFINE_GLOBAL, self._chunk().add_constant(name))
+
+    ########################################################
+    # Expressions
+    ########################################################
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        token = expr.value
+        self._lineno = token.lineno
+        if token.token_type == TokenType.IDENTIFIER:
+            self._load(token.lexeme)
+        else:
+            self._emit(OpCode.CONST, self._chunk().add_constant(token.literal))
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        expr.right.accept(self)
+        self._lineno = expr.op.lineno
+        match expr.op.token_type:
+            case TokenType.MINUS:
+                self._emit(OpCode.NEGATE)
+            case TokenType.BANG:
+                self._emit(OpCode.NOT)
+            case _:
+                assert False, f"UnaryExpr: {expr.op.token_type} is not accepted"
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        op = expr.op.token_type
+        if op == TokenType.AND:
+            # `a and b` yields b when a is truthy, otherwise False.
+            expr.left.accept(self)
+            false_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+            expr.right.accept(self)
+            end_jump = self._emit_jump(OpCode.JUMP)
+            self._patch_jump(false_jump)
+            self._emit(OpCode.CONST, self._chunk().add_constant(False))
+            self._patch_jump(end_jump)
+            return
+        if op == TokenType.OR:
+            expr.left.accept(self)
+            end_jump = self._emit_jump(OpCode.JUMP_IF_TRUE_OR_POP)
+            expr.right.accept(self)
+            self._patch_jump(end_jump)
+            return
+        assert op in BINARY_OPS, f"BinaryExpr: {op} is not handled"
+        expr.left.accept(self)
+        expr.right.accept(self)
+        self._lineno = expr.op.lineno
+        self._emit(BINARY_OPS[op])
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        expr.expr.accept(self)
+
+    def visit_func_call(self, expr: "FuncCall"):
+        self._lineno = expr.name.lineno
+        self._load(expr.name.lexeme)
+        for arg in expr.args:
+            arg.accept(self)
+        self._emit(OpCode.CALL, len(expr.args))
+
+    ########################################################
+    # Statements
+    ########################################################
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        stmt.expr.accept(self)
+        self._emit(OpCode.PRINT)
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        self._lineno = stmt.name.lineno
+        if stmt.expr is None:
+            self._emit(OpCode.CONST, self._chunk().add_constant(None))
+        else:
+            stmt.expr.accept(self)
+        self._define(stmt.name.lexeme)
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        stmt.expr.accept(self)
+        self._lineno = stmt.name.lineno
+        name = stmt.name.lexeme
+        slot = self._resolve_local(name)
+        if slot is not None:
+            self._emit(OpCode.SET_LOCAL, slot)
+        else:
+            self._emit(OpCode.SET_GLOBAL, self._chunk().add_constant(name))
+
+    def visit_block(self, block: "Block"):
+        self._begin_scope()
+        for stmt in block.exprs:
+            self._statement(stmt)
+        self._end_scope()
+
+    def visit_program(self, program: "Program"):
+        for stmt in program.exprs:
+            self._statement(stmt)
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        stmt.condition.accept(self)
+        else_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+        self._statement(stmt.then_branch)
+        if stmt.else_branch is None:
+            self._patch_jump(else_jump)
+            return
+        end_jump = self._emit_jump(OpCode.JUMP)
+        self._patch_jump(else_jump)
+        self._statement(stmt.else_branch)
+        self._patch_jump(end_jump)
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        loop_start = len(self._chunk().code)
+        stmt.condition.accept(self)
+        exit_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+        self._statement(stmt.body)
+        self._emit(OpCode.JUMP, loop_start)
+        self._patch_jump(exit_jump)
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        # The loop variable lives in the enclosing scope, as in the tree-walker.
+        self._statement(stmt.init)
+        loop_start = len(self._chunk().code)
+        stmt.condition.accept(self)
+        exit_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+        self._statement(stmt.body)
+        self._statement(stmt.update)
+        self._emit(OpCode.JUMP, loop_start)
+        self._patch_jump(exit_jump)
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        self._lineno = stmt.name.lineno
+        params = [param.lexeme for param in stmt.params]
+        function = Function(name=stmt.name.lexeme, params=params)
+
+        # Functions do not capture their enclosing scopes: the body only sees
+        # its own locals and the globals.
+        enclosing = self._state
+        self._state = _FuncState(function=function, scopes=[{}])
+        for param in params:
+            self._declare_local(param)
+        self._statement(stmt.body)
+        self._emit(OpCode.CONST, self._chunk().add_constant(None))
+        self._emit(OpCode.RETURN)
+        self._state = enclosing
+
+        self._emit(OpCode.CONST, self._chunk().add_constant(function))
+        self._define(function.name)
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if self._state.function.name == "<script>":
+            raise ValueError("Return outside of a function")
+        if stmt.expr is None:
+            self._emit(OpCode.CONST, self._chunk().add_constant(None))
+        else:
+            stmt.expr.accept(self)
+        self._emit(OpCode.RETURN)
+
+
+def disassemble(function: Function) -> str:
+    lines = [f"== {function.name} =="]
+    chunk = function.chunk
+    nested = []
+    for offset in range(0, len(chunk.code), 2):
+        op = OpCode(chunk.code[offset])
+        arg = chunk.code[offset + 1]
+        line = f"{offset:04d} {chunk.lines[offset // 2]:4d} {op.name:<20}"
+        if op in (
+            OpCode.CONST,
+            OpCode.GET_GLOBAL,
+            OpCode.SET_GLOBAL,
+            OpCode.DEFINE_GLOBAL,
+        ):
+            const = chunk.constants[arg]
+            if isinstance(const, Function):
+                nested.append(const)
+                const = f"<fn {const.name}>"
+            line += f"{arg:4d} '{const}'"
+        elif op not in (
+            OpCode.POP,
+            OpCode.RETURN,
+            OpCode.PRINT,
+            OpCode.NEGATE,
+            OpCode.NOT,
+        ) and op not in BINARY_OPS.values():
+            line += f"{arg:4d}"
+        lines.append(line.rstrip())
+    for function in nested:
+        lines.append(disassemble(function))
+    return "\n".join(lines)
+
+
+def test_compiler():
+    from scanner import Scanner
+    from parser import Parser
+
+    source = """
+    var a = 1;
+    {
+        var b = a + 2;
+        print b * 3;
+    }
+    def add(x, y) {
+        return x + y;
+    }
+    print add(a, 2) or "unreachable";
+    """
+    print("-" * 80)
+    print(f"Testing compiler: {source}")
+    program = Parser(Scanner(source).scan()).parse()
+    function = Compiler().compile(program)
+    print(disassemble(function))
+
+
+if __name__ == "__main__":
+    test_compiler()
@@ -0,0 +1,308 @@
+from dataclasses import dataclass
+import math
+from typing import Any
+
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    UnaryExpr,
+    WhileStmt,
+)
+from tok import TokenType
+
+# Floats hold every integer up to here exactly, so counting in ints and
+# converting gives the same values as repeated float additions.
+_MAX_EXACT = float(2**53)
+
+_ASCENDING_OPS = (TokenType.LESS, TokenType.LESS_EQUAL)
+_DESCENDING_OPS = (TokenType.GREATER, TokenType.GREATER_EQUAL)
+
+# A variable as the `for` statement sees it: (depth, slot) for locals, the
+# name for globals.
+VarRef = tuple[int, int] | str
+
+
+@dataclass(frozen=True, slots=True)
+class CountedLoop:
+    """`for (...; var OP bound; var = var + step;)` whose body leaves both alone."""
+
+    var: VarRef
+    op: TokenType
+    # A float literal, or the variable holding the bound.
+    bound: float | VarRef
+    step: int
+
+    def stop(self, bound: Any) -> int | None:
+        """
+        End of the `range()` that visits exactly the values `var OP bound`
+        admits, or None unless `bound` is a number small enough to count to.
+        """
+        if bound.__class__ is not float or not abs(bound) <= _MAX_EXACT:
+            return None
+        match self.op:
+            case TokenType.LESS:
+                return math.ceil(bound)
+            case TokenType.LESS_EQUAL:
+                return math.floor(bound) + 1
+            case TokenType.GREATER:
+                return math.floor(bound)
+            case TokenType.GREATER_EQUAL:
+                return math.ceil(bound) - 1
+        assert False, f"CountedLoop: {self.op} is not a comparison"
+
+
+def exact_int(val: Any) -> int | None:
+    """`val` as an int if it is a float that counting in ints reproduces."""
+    if val.__class__ is float and val.is_integer() and abs(val) <= _MAX_EXACT:
+        return int(val)
+    return None
+
+
+def _var_ref(expr: Expr) -> VarRef | None:
+    if isinstance(expr, LiteralExpr) and expr.value.token_type == TokenType.IDENTIFIER:
+        if expr.depth is None:
+            return expr.value.lexeme
+        return (expr.depth, expr.slot)
+    return None
+
+
+def _number(expr: Expr) -> float | None:
+    if isinstance(expr, LiteralExpr) and expr.value.token_type == TokenType.NUMBER:
+        return expr.value.literal
+    return None
+
+
+class _BodyEffects(Visitor):
+    """
+    What a loop body may do to the variables of its `for` statement: the
+    locals (as seen from the `for`) and globals it assigns, and whether it
+    calls anything, since a callee may assign any global.
+    """
+
+    def __init__(self):
+        self.assigned: set[VarRef] = set()
+        self.calls = False
+        # Block scopes between the `for` statement and the current node.
+        self._depth = 0
+
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        pass
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        expr.right.accept(self)
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        expr.expr.accept(self)
+
+    def visit_func_call(self, expr: "FuncCall"):
+        self.calls = True
+        for arg in expr.args:
+            arg.accept(self)
+
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        stmt.expr.accept(self)
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        if stmt.expr is not None:
+            stmt.expr.accept(self)
+        if stmt.slot is None:
+            self.assigned.add(stmt.name.lexeme)
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        stmt.expr.accept(self)
+        if stmt.depth is None:
+            self.assigned.add(stmt.name.lexeme)
+        elif stmt.depth >= self._depth:
+            self.assigned.add((stmt.depth - self._depth, stmt.slot))
+
+    def visit_block(self, block: "Block"):
+        # Blocks without declarations have no scope of their own.
+        nested = 1 if block.num_slots else 0
+        self._depth += nested
+        for stmt in block.exprs:
+            stmt.accept(self)
+        self._depth -= nested
+
+    def visit_program(self, program: "Program"):
+        for stmt in program.exprs:
+            stmt.accept(self)
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        stmt.condition.accept(self)
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        stmt.condition.accept(self)
+        stmt.body.accept(self)
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        stmt.init.accept(self)
+        stmt.condition.accept(self)
+        stmt.body.accept(self)
+        stmt.update.accept(self)
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        # Functions do not capture locals, and a body only runs when called.
+        if stmt.slot is None:
+            self.assigned.add(stmt.name.lexeme)
+
+    def visit_lazy_body(self, body: "LazyBody"):
+        pass
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if stmt.expr is not None:
+            stmt.expr.accept(self)
+
+
+def match_counted_loop(stmt: ForStmt) -> CountedLoop | None:
+    """
+    Recognizes `for (init; i < bound; i = i + step;)` (or `<=`, or `>`/`>=`
+    counting down with `i = i - step`) where `step` is an integral number
+    literal, `bound` a number literal or a variable, and the body assigns
+    neither `i` nor `bound`. A global `i` or `bound` also rules out calls in
+    the body. Whether the values are integral floats is only known at runtime.
+    """
+    cond = stmt.condition
+    if not isinstance(cond, BinaryExpr):
+        return None
+    op = cond.op.token_type
+    if op not in _ASCENDING_OPS and op not in _DESCENDING_OPS:
+        return None
+    var = _var_ref(cond.left)
+    bound = _number(cond.right)
+    if bound is None:
+        bound = _var_ref(cond.right)
+    if var is None or bound is None:
+        return None
+
+    update = stmt.update
+    if not isinstance(update, AssignStmt):
+        return None
+    target = update.name.lexeme if update.depth is None else (update.depth, update.slot)
+    step_expr = update.expr
+    if target != var or not isinstance(step_expr, BinaryExpr):
+        return None
+    step = _number(step_expr.right)
+    if _var_ref(step_expr.left) != var or step is None:
+        return None
+    step = exact_int(step)
+    if not step:
+        return None
+    if step_expr.op.token_type == TokenType.MINUS:
+        step = -step
+    elif step_expr.op.token_type != TokenType.PLUS:
+        return None
+    if (step > 0) != (op in _ASCENDING_OPS):
+        return None
+
+    effects = _BodyEffects()
+    stmt.body.accept(effects)
+    for ref in (var, bound):
+        if ref in effects.assigned:
+            return None
+        if isinstance(ref, str) and effects.calls:
+            return None
+    return CountedLoop(var=var, op=op, bound=bound, step=step)
+
+
+def test_counted_loop():
+    from parser import Parser
+    from resolver import Resolver
+    from scanner import Scanner
+
+    def loops(source: str) -> list[CountedLoop | None]:
+        program = Resolver().resolve(Parser(Scanner(source).scan()).parse())
+        found = []
+
+        def walk(stmt: Expr):
+            if isinstance(stmt, ForStmt):
+                found.append(match_counted_loop(stmt))
+                walk(stmt.body)
+            elif isinstance(stmt, (Block, Program)):
+                for child in stmt.exprs:
+                    walk(child)
+            elif isinstance(stmt, FuncDecl):
+                walk(stmt.body)
+
+        walk(program)
+        return found
+
+    source = """
+    def f(n) {
+        var total = 0;
+        for (var i = 0; i < n; i = i + 1;) {
+            total = total + i;
+        }
+        for (var j = 10; j >= 0; j = j - 2;) {
+            for (var k = 0; k <= j; k = k + 1;) {
+                total = total + k;
+            }
+        }
+        for (var a = 0; a < n; a = a + 1;) {
+            a = a + 1;
+        }
+        for (var b = 0; b < n; b = b + 1;) {
+            n = n - 1;
+        }
+        for (var c = 0; c < 10; c = c - 1;) {
+            print c;
+        }
+        for (var d = 0; d < 10; d = d + 0.5;) {
+            print d;
+        }
+        return total;
+    }
+    for (var g = 0; g < 3; g = g + 1;) {
+        print g;
+    }
+    for (var h = 0; h < 3; h = h + 1;) {
+        f(h);
+    }
+    """
+    print("-" * 80)
+    print(f"Testing counted-loop recognition: {source}")
+    found = loops(source)
+    assert found[0] == CountedLoop(var=(0, 1), op=TokenType.LESS, bound=(1, 0), step=1)
+    assert found[1] == CountedLoop(
+        var=(0, 2), op=TokenType.GREATER_EQUAL, bound=0.0, step=-2
+    )
+    # `k <= j` from inside the outer loop's body block.
+    assert found[2] == CountedLoop(
+        var=(0, 0), op=TokenType.LESS_EQUAL, bound=(1, 2), step=1
+    )
+    # Assigns its variable, assigns its bound, counts away from the bound,
+    # steps by a fraction, and a global loop variable next to a call.
+    assert found[3:7] == [None, None, None, None], found[3:7]
+    assert found[7] == CountedLoop(var="g", op=TokenType.LESS, bound=3.0, step=1)
+    assert found[8] is None
+
+    assert CountedLoop("i", TokenType.LESS, 3.5, 1).stop(3.5) == 4
+    assert CountedLoop("i", TokenType.LESS_EQUAL, 3.0, 1).stop(3.0) == 4
+    assert CountedLoop("i", TokenType.GREATER, 0.5, -1).stop(0.5) == 0
+    assert CountedLoop("i", TokenType.GREATER_EQUAL, 0.5, -1).stop(0.5) == 0
+    assert CountedLoop("i", TokenType.LESS, "n", 1).stop(float("inf")) is None
+    assert CountedLoop("i", TokenType.LESS, "n", 1).stop("3") is None
+    assert exact_int(3.0) == 3 and exact_int(3.5) is None and exact_int(True) is None
+
+
+if __name__ == "__main__":
+    test_counted_loop()
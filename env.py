@@ -1,52 +1,70 @@
 from __future__ import annotations
-from contextlib import contextmanager
 from dataclasses import dataclass, field
+import itertools
 from typing import Any
 
+from func import FuncBase
+
 LookupTable = dict[str, Any]
+Scope = list[Any]
 
 
 @dataclass
 class Env:
-    lookup_tables: list[LookupTable]
+    """
+    Environment of one function activation (or the top-level script).
+
+    Globals are looked up by name. Block and parameter scopes are plain
+    arrays addressed by the (depth, slot) pairs computed by `Resolver`.
+    """
 
-    @contextmanager
-    def block_scope(self):
-        self.lookup_tables.append(LookupTable())
-        yield
-        self.lookup_tables.pop()
+    globals: LookupTable
+    scopes: list[Scope]
 
     def define(self, name: str, value: Any | None = None):
-        cur_lookup_table = self.lookup_tables[-1]
-        assert name not in cur_lookup_table, f"Variable already defined: {name}"
-        cur_lookup_table[name] = value
+        assert name not in self.globals, f"Variable already defined: {name}"
+        self.globals[name] = value
 
     def assign(self, name: str, value: Any):
-        for lookup_table in reversed(self.lookup_tables):
-            if name in lookup_table:
-                lookup_table[name] = value
-                return
-        raise ValueError(f"Undefined variable: {name}")
+        if name not in self.globals:
+            raise ValueError(f"Undefined variable: {name}")
+        self.globals[name] = value
 
     def get(self, name: str) -> Any:
-        for lookup_table in reversed(self.lookup_tables):
-            if name in lookup_table:
-                return lookup_table[name]
-        raise ValueError(f"Undefined variable: {name}")
+        if name not in self.globals:
+            raise ValueError(f"Undefined variable: {name}")
+        return self.globals[name]
+
+    def define_at(self, slot: int, value: Any | None = None):
+        self.scopes[-1][slot] = value
+
+    def assign_at(self, depth: int, slot: int, value: Any):
+        self.scopes[-1 - depth][slot] = value
+
+    def get_at(self, depth: int, slot: int) -> Any:
+        return self.scopes[-1 - depth][slot]
+
+
+# Upper bound on idle frames kept per arity after a deep recursion unwinds.
+_MAX_POOLED_FRAMES = 256
+
+# Version stamps are unique across all `State`s, so a call-site cache filled
+# by one interpreter never validates against another one's globals.
+_globals_versions = itertools.count()
 
 
 @dataclass
 class State:
     env_list: list[Env] = field(init=False)
+    # Changes whenever a global that holds (or held) a function is rebound;
+    # call sites compare it to the stamp of their cached callee.
+    globals_version: int = field(init=False)
+    _frame_pool: dict[int, list[Env]] = field(init=False)
 
     def __post_init__(self):
-        self.env_list = [Env(lookup_tables=[LookupTable()])]
-
-    @contextmanager
-    def block_scope(self):
-        env = self.env_list[-1]
-        with env.block_scope():
-            yield
+        self.env_list = [Env(globals=LookupTable(), scopes=[])]
+        self.globals_version = next(_globals_versions)
+        self._frame_pool = {}
 
     def define(self, name: str, value: Any | None = None):
         env = self.env_list[-1]
@@ -54,25 +72,45 @@ class State:
 
     def assign(self, name: str, value: Any):
         env = self.env_list[-1]
+        if isinstance(value, FuncBase) or isinstance(env.globals.get(name), FuncBase):
+            self.globals_version = next(_globals_versions)
         env.assign(name, value)
 
     def get(self, name: str) -> Any:
         env = self.env_list[-1]
-        try:
-            return env.get(name)
-        except:
-            breakpoint()
-
-    @contextmanager
-    def func_scope(self, id_args: dict[str, str], val_args: dict[str, Any]):
-        cur_env = self.env_list[-1]
-        cur_global_vars = cur_env.lookup_tables[0]
-        new_env = Env(lookup_tables=[cur_global_vars.copy()])
-        new_env.lookup_tables.append(LookupTable())
-        for new_id, old_id in id_args.items():
-            new_env.define(new_id, cur_env.get(old_id))
-        for k, v in val_args.items():
-            new_env.define(k, v)
-        self.env_list.append(new_env)
-        yield
-        self.env_list.pop()
+        return env.get(name)
+
+    def define_at(self, slot: int, value: Any | None = None):
+        self.env_list[-1].scopes[-1][slot] = value
+
+    def assign_at(self, depth: int, slot: int, value: Any):
+        self.env_list[-1].scopes[-1 - depth][slot] = value
+
+    def get_at(self, depth: int, slot: int) -> Any:
+        return self.env_list[-1].scopes[-1 - depth][slot]
+
+    def new_frame(self, num_params: int) -> Env:
+        """
+        Returns an inactive frame whose parameter scope (`scopes[0]`) has
+        room for `num_params` arguments. Frames share the global table by
+        reference and are recycled through a per-arity pool.
+        """
+        pool = self._frame_pool.get(num_params)
+        if pool:
+            return pool.pop()
+        globals = self.env_list[0].globals
+        return Env(globals=globals, scopes=[[None] * num_params])
+
+    def push_frame(self, frame: Env):
+        self.env_list.append(frame)
+
+    def pop_frame(self):
+        self.release_frame(self.env_list.pop())
+
+    def release_frame(self, frame: Env):
+        """Returns an inactive frame to the pool."""
+        # Block scopes are left behind when a call unwinds early.
+        del frame.scopes[1:]
+        pool = self._frame_pool.setdefault(len(frame.scopes[0]), [])
+        if len(pool) < _MAX_POOLED_FRAMES:
+            pool.append(frame)
@@ -1,40 +1,58 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
 from scanner import Token
-from interface import Expr, Visitor
+from interface import RUNTIME_FIELD, Expr, Visitor
+
+
+def _runtime_field(default: Any) -> Any:
+    """Interpreter cache on a node; not compared, printed or pickled."""
+    return field(default=default, repr=False, compare=False, metadata=RUNTIME_FIELD)
 
 
 ########################################################
 # Basic expressions
 ########################################################
-@dataclass
+@dataclass(slots=True)
 class LiteralExpr(Expr):
     value: Token
+    # Filled in by the resolver for identifiers; depth None means global.
+    depth: int | None = field(default=None, repr=False, compare=False)
+    slot: int | None = field(default=None, repr=False, compare=False)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_literal_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class UnaryExpr(Expr):
     right: Expr
     op: Token
+    # Quickening state kept by the interpreter: the specialized variant this
+    # node was rewritten into, and the operand types it has seen so far
+    # (`quick_count` is -1 once the node stays generic).
+    quick: Any = _runtime_field(None)
+    quick_types: tuple | None = _runtime_field(None)
+    quick_count: int = _runtime_field(0)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_unary_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class BinaryExpr(Expr):
     left: Expr
     right: Expr
     op: Token
+    # Quickening state, as on `UnaryExpr`.
+    quick: Any = _runtime_field(None)
+    quick_types: tuple | None = _runtime_field(None)
+    quick_count: int = _runtime_field(0)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_binary_expr(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class GroupingExpr(Expr):
     expr: Expr
 
@@ -45,7 +63,7 @@ class GroupingExpr(Expr):
 ########################################################
 # Statements
 ########################################################
-@dataclass
+@dataclass(slots=True)
 class PrintStmt(Expr):
     expr: Expr
 
@@ -53,35 +71,42 @@ class PrintStmt(Expr):
         return visitor.visit_print_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class DeclStmt(Expr):
     name: Token
     expr: Expr | None
+    depth: int | None = field(default=None, repr=False, compare=False)
+    slot: int | None = field(default=None, repr=False, compare=False)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_decl_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class AssignStmt(Expr):
     name: Token
     expr: Expr
+    depth: int | None = field(default=None, repr=False, compare=False)
+    slot: int | None = field(default=None, repr=False, compare=False)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_assign_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Block(Expr):
     exprs: list[Expr]
+    # Number of variables declared directly in this block.
+    num_slots: int = field(default=0, repr=False, compare=False)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_block(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Program(Expr):
     exprs: list[Expr]
+    resolved: bool = field(default=False, repr=False, compare=False)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_program(self)
@@ -91,7 +116,7 @@ class Program(Expr):
 # Control flow
 ########################################################
 
-@dataclass
+@dataclass(slots=True)
 class IfStmt(Expr):
     condition: Expr
     then_branch: Expr
@@ -101,7 +126,7 @@ class IfStmt(Expr):
         return visitor.visit_if_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class WhileStmt(Expr):
     condition: Expr
     body: Expr
@@ -109,12 +134,15 @@ class WhileStmt(Expr):
     def accept(self, visitor: Visitor):
         return visitor.visit_while_stmt(self)
 
-@dataclass
+@dataclass(slots=True)
 class ForStmt(Expr):
     init: Expr
     condition: Expr
     update: Expr
     body: Expr
+    # `counted_loop.CountedLoop` once the interpreter has matched the loop,
+    # False if it is not a counted loop, None until it first runs.
+    counted: Any = _runtime_field(None)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_for_stmt(self)
@@ -123,30 +151,98 @@ class ForStmt(Expr):
 # Function
 ########################################################
 
-@dataclass
+@dataclass(slots=True)
 class FuncDecl(Expr):
     name: Token
     params: list[Token]
     body: Expr
+    # Names from `@name` lines above the `def`, e.g. `@memo`.
+    annotations: list[str] = field(default_factory=list)
+    depth: int | None = field(default=None, repr=False, compare=False)
+    slot: int | None = field(default=None, repr=False, compare=False)
+    # Set by `purity.analyze_purity()`.
+    pure: bool = field(default=False, repr=False, compare=False)
+    # Set by `inliner.analyze_inlining()`: what call sites evaluate instead.
+    inline_body: Expr | None = _runtime_field(None)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_func_decl(self)
 
 
-@dataclass
+@dataclass(slots=True)
+class LazyBody(Expr):
+    """
+    Function body that a lazy `Parser` only brace-matched: `start`/`end` are
+    the token indexes of its `{` and `}`. `materialize()` parses and resolves
+    it on first use; visitors that need the body go through it.
+
+    `assigned` holds every name followed by `=` in the body, so analyses can
+    stay conservative about globals it might rebind without parsing it.
+    """
+
+    parser: Any = field(repr=False, compare=False)
+    start: int
+    end: int
+    params: list[Token]
+    assigned: set[str] = field(default_factory=set, repr=False, compare=False)
+    block: Block | None = _runtime_field(None)
+
+    def materialize(self) -> Block:
+        if self.block is None:
+            from resolver import Resolver
+
+            block = self.parser.parse_block_at(self.start)
+            # Bodies resolve from scratch (no captures), so this matches
+            # resolving them as part of the whole program.
+            Resolver().resolve_function_body(self.params, block)
+            self.block = block
+        return self.block
+
+    def accept(self, visitor: Visitor):
+        return visitor.visit_lazy_body(self)
+
+
+@dataclass(slots=True)
 class FuncCall(Expr):
     name: Token # TODO: how to support fn()()
     args: list[Expr] 
+    depth: int | None = field(default=None, repr=False, compare=False)
+    slot: int | None = field(default=None, repr=False, compare=False)
+    # Set by the resolver for `return f(...)` inside a function body.
+    tail: bool = field(default=False, repr=False, compare=False)
+    # Inline cache kept by the interpreter. Global callees are cached with the
+    # `State.globals_version` they were looked up under; local callees (e.g.
+    # a parameter bound to different functions) by identity, up to a few.
+    ic_func: Any = _runtime_field(None)
+    ic_version: int = _runtime_field(-1)
+    ic_callees: dict[int, Any] | None = _runtime_field(None)
+    # The callee's `inline_body` while this site runs it in place of the call,
+    # valid for the `State.globals_version` it was looked up under.
+    inlined: Expr | None = _runtime_field(None)
+    inline_version: int = _runtime_field(-1)
 
     def accept(self, visitor: Visitor):
         return visitor.visit_func_call(self)
 
-@dataclass
+@dataclass(slots=True)
 class ReturnStmt(Expr):
     expr: Expr | None
 
     def accept(self, visitor: Visitor):
         return visitor.visit_return_stmt(self)
-    
-    
-    
+
+
+# Nodes the engines run as statements (they complete without a value).
+STATEMENT_TYPES = (
+    PrintStmt,
+    DeclStmt,
+    AssignStmt,
+    Block,
+    Program,
+    IfStmt,
+    WhileStmt,
+    ForStmt,
+    FuncDecl,
+    ReturnStmt,
+    LazyBody,
+)
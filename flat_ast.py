@@ -0,0 +1,479 @@
+from array import array
+from dataclasses import dataclass
+from enum import IntEnum
+import marshal
+from typing import Any
+
+from func import FuncBase, NativeFunc, build_native_func_sleep, build_native_func_time
+from interpreter import binary_op, unary_op
+from parser import Parser
+from tok import Token, TokenType
+from utils import color_print
+
+# Bumped whenever the encoding changes; `FlatAST.from_bytes` rejects others.
+FORMAT_VERSION = 1
+
+# Marks an absent optional child (e.g. an `if` without `else`).
+NONE = -1
+
+_TOKEN_TYPES = list(TokenType)
+_TOKEN_CODES = {token_type: code for code, token_type in enumerate(_TOKEN_TYPES)}
+
+
+class Kind(IntEnum):
+    """
+    Node kinds of a `FlatAST`. The operand columns `a`-`d` of a row mean:
+
+    LITERAL     a=const
+    NAME        a=name
+    UNARY       a=op b=right
+    BINARY      a=op b=left c=right
+    GROUPING    a=expr
+    PRINT       a=expr
+    DECL        a=name b=expr|NONE
+    ASSIGN      a=name b=expr
+    BLOCK       a=children start b=count
+    PROGRAM     a=children start b=count
+    IF          a=condition b=then c=else|NONE
+    WHILE       a=condition b=body
+    FOR         a=init b=condition c=update d=body
+    FUNC_DECL   a=name b=children start of param names c=count d=body
+    FUNC_CALL   a=name b=children start of args c=count
+    RETURN      a=expr|NONE
+
+    `op` is the index of the operator's `TokenType`; `const` and `name` index
+    `FlatAST.consts` and `FlatAST.names`.
+    """
+
+    LITERAL = 0
+    NAME = 1
+    UNARY = 2
+    BINARY = 3
+    GROUPING = 4
+    PRINT = 5
+    DECL = 6
+    ASSIGN = 7
+    BLOCK = 8
+    PROGRAM = 9
+    IF = 10
+    WHILE = 11
+    FOR = 12
+    FUNC_DECL = 13
+    FUNC_CALL = 14
+    RETURN = 15
+
+
+class FlatAST:
+    """
+    Struct-of-arrays encoding of a program: one row per node across the
+    `kind`, `a`-`d` and `line` columns, variable-length child lists packed
+    into `children`, and deduplicated literal and identifier pools. Nodes
+    reference each other by row index, so a whole program is a handful of
+    arrays instead of one Python object per node and token.
+    """
+
+    def __init__(self):
+        self.kind = array("B")
+        self.a = array("i")
+        self.b = array("i")
+        self.c = array("i")
+        self.d = array("i")
+        self.line = array("i")
+        self.children = array("i")
+        self.consts: list[Any] = []
+        self.names: list[str] = []
+        self.root = NONE
+        self._const_index: dict[tuple, int] = {}
+        self._name_index: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def add(
+        self, kind: Kind, a: int = 0, b: int = 0, c: int = 0, d: int = 0, line: int = 0
+    ) -> int:
+        self.kind.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        self.d.append(d)
+        self.line.append(line)
+        return len(self.kind) - 1
+
+    def add_children(self, items: list[int]) -> int:
+        start = len(self.children)
+        self.children.extend(items)
+        return start
+
+    def const(self, value: Any) -> int:
+        # Keyed like `MemoCache` keys so that `true`/`1` and `0`/`-0` stay apart.
+        key = (value.__class__, repr(value) if value.__class__ is float else value)
+        idx = self._const_index.get(key)
+        if idx is None:
+            idx = self._const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return idx
+
+    def name(self, name: str) -> int:
+        idx = self._name_index.get(name)
+        if idx is None:
+            idx = self._name_index[name] = len(self.names)
+            self.names.append(name)
+        return idx
+
+    def nbytes(self) -> int:
+        """Size of the column data, excluding the constant and name pools."""
+        columns = (self.kind, self.a, self.b, self.c, self.d, self.line, self.children)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def to_bytes(self) -> bytes:
+        columns = (self.kind, self.a, self.b, self.c, self.d, self.line, self.children)
+        return marshal.dumps(
+            (
+                FORMAT_VERSION,
+                self.root,
+                [column.tobytes() for column in columns],
+                self.consts,
+                self.names,
+            )
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "FlatAST":
+        version, root, columns, consts, names = marshal.loads(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported flat AST version: {version}")
+        ast = cls()
+        targets = (ast.kind, ast.a, ast.b, ast.c, ast.d, ast.line, ast.children)
+        for target, raw in zip(targets, columns):
+            target.frombytes(raw)
+        ast.root = root
+        ast.consts = consts
+        ast.names = names
+        ast._const_index = {
+            (v.__class__, repr(v) if v.__class__ is float else v): i
+            for i, v in enumerate(consts)
+        }
+        ast._name_index = {name: idx for idx, name in enumerate(names)}
+        return ast
+
+
+class FlatParser(Parser):
+    """
+    `Parser` that emits `FlatAST` rows instead of `expr.py` objects. The
+    grammar is shared; only the node constructors are replaced, and each
+    returns the row index of the node it added.
+    """
+
+    def __init__(self, tokens: list[Token]) -> None:
+        super().__init__(tokens)
+        self._ast = FlatAST()
+
+    def parse(self) -> FlatAST:
+        self._ast.root = self._program()
+        return self._ast
+
+    def _new_literal(self, value: Token) -> int:
+        ast = self._ast
+        if value.token_type == TokenType.IDENTIFIER:
+            return ast.add(Kind.NAME, ast.name(value.lexeme), line=value.lineno)
+        return ast.add(Kind.LITERAL, ast.const(value.literal), line=value.lineno)
+
+    def _new_unary(self, right: int, op: Token) -> int:
+        code = _TOKEN_CODES[op.token_type]
+        return self._ast.add(Kind.UNARY, code, right, line=op.lineno)
+
+    def _new_binary(self, left: int, right: int, op: Token) -> int:
+        code = _TOKEN_CODES[op.token_type]
+        return self._ast.add(Kind.BINARY, code, left, right, line=op.lineno)
+
+    def _new_grouping(self, expr: int) -> int:
+        return self._ast.add(Kind.GROUPING, expr)
+
+    def _new_print(self, expr: int) -> int:
+        return self._ast.add(Kind.PRINT, expr)
+
+    def _new_decl(self, name: Token, expr: int | None) -> int:
+        expr = NONE if expr is None else expr
+        ast = self._ast
+        return ast.add(Kind.DECL, ast.name(name.lexeme), expr, line=name.lineno)
+
+    def _new_assign(self, name: Token, expr: int) -> int:
+        ast = self._ast
+        return ast.add(Kind.ASSIGN, ast.name(name.lexeme), expr, line=name.lineno)
+
+    def _new_block(self, exprs: list[int]) -> int:
+        return self._ast.add(Kind.BLOCK, self._ast.add_children(exprs), len(exprs))
+
+    def _new_program(self, exprs: list[int]) -> int:
+        return self._ast.add(Kind.PROGRAM, self._ast.add_children(exprs), len(exprs))
+
+    def _new_if(
+        self, condition: int, then_branch: int, else_branch: int | None
+    ) -> int:
+        else_branch = NONE if else_branch is None else else_branch
+        return self._ast.add(Kind.IF, condition, then_branch, else_branch)
+
+    def _new_while(self, condition: int, body: int) -> int:
+        return self._ast.add(Kind.WHILE, condition, body)
+
+    def _new_for(self, init: int, condition: int, update: int, body: int) -> int:
+        return self._ast.add(Kind.FOR, init, condition, update, body)
+
+    def _new_func_decl(
+        self, name: Token, params: list[Token], body: int, annotations: list[str]
+    ) -> int:
+        # Annotations are parsed but ignored; the flat evaluator does not memoize.
+        ast = self._ast
+        start = ast.add_children([ast.name(param.lexeme) for param in params])
+        return ast.add(
+            Kind.FUNC_DECL, ast.name(name.lexeme), start, len(params), body, name.lineno
+        )
+
+    def _new_func_call(self, name: Token, args: list[int]) -> int:
+        ast = self._ast
+        start = ast.add_children(args)
+        return ast.add(
+            Kind.FUNC_CALL, ast.name(name.lexeme), start, len(args), line=name.lineno
+        )
+
+    def _new_return(self, expr: int | None) -> int:
+        return self._ast.add(Kind.RETURN, NONE if expr is None else expr)
+
+
+@dataclass
+class FlatFunc(FuncBase):
+    # Row of the body `Block` in the `FlatAST` the function was declared in.
+    body: int
+
+
+class FlatInterpreter:
+    """
+    Evaluates a `FlatAST` directly from its columns, dispatching on `kind`.
+
+    Scoping follows `Resolver`: a function sees its own parameter and block
+    scopes plus the globals, never its caller's or its definer's locals.
+    Scopes are name-keyed dicts since the flat encoding is not resolved.
+    """
+
+    def __init__(self):
+        self._globals: dict[str, Any] = {}
+        self._scopes: list[dict[str, Any]] = []
+        self._call_depth = 0
+        self._returning = False
+        self._return_value: Any = None
+        self._dispatch = [None] * len(Kind)
+        for kind in Kind:
+            self._dispatch[kind] = getattr(self, f"_eval_{kind.name.lower()}")
+        for native in (build_native_func_time(), build_native_func_sleep()):
+            self._globals[native.name] = native
+
+    def interpret(self, ast: FlatAST) -> Any:
+        self._kind = ast.kind
+        self._a, self._b, self._c, self._d = ast.a, ast.b, ast.c, ast.d
+        self._children = ast.children
+        self._consts = ast.consts
+        self._names = ast.names
+        return self._eval(ast.root)
+
+    def _eval(self, idx: int) -> Any:
+        return self._dispatch[self._kind[idx]](idx)
+
+    def _lookup(self, name: str) -> Any:
+        for scope in reversed(self._scopes):
+            if name in scope:
+                return scope[name]
+        if name not in self._globals:
+            raise ValueError(f"Undefined variable: {name}")
+        return self._globals[name]
+
+    def _define(self, name: str, value: Any):
+        if self._scopes:
+            scope = self._scopes[-1]
+            if name in scope:
+                raise ValueError(f"Variable already defined: {name}")
+            scope[name] = value
+        else:
+            assert name not in self._globals, f"Variable already defined: {name}"
+            self._globals[name] = value
+
+    def _eval_literal(self, idx: int) -> Any:
+        return self._consts[self._a[idx]]
+
+    def _eval_name(self, idx: int) -> Any:
+        return self._lookup(self._names[self._a[idx]])
+
+    def _eval_unary(self, idx: int) -> Any:
+        return unary_op(_TOKEN_TYPES[self._a[idx]], self._eval(self._b[idx]))
+
+    def _eval_binary(self, idx: int) -> Any:
+        op_type = _TOKEN_TYPES[self._a[idx]]
+        left_val = self._eval(self._b[idx])
+        if op_type == TokenType.AND:
+            return self._eval(self._c[idx]) if left_val else False
+        if op_type == TokenType.OR:
+            return left_val if left_val else self._eval(self._c[idx])
+        return binary_op(op_type, left_val, self._eval(self._c[idx]))
+
+    def _eval_grouping(self, idx: int) -> Any:
+        return self._eval(self._a[idx])
+
+    def _eval_print(self, idx: int):
+        val = self._eval(self._a[idx])
+        str = f"[interpreter] {val}"
+        str = color_print(str, "yellow")
+        print(str)
+
+    def _eval_decl(self, idx: int):
+        expr = self._b[idx]
+        val = None if expr == NONE else self._eval(expr)
+        self._define(self._names[self._a[idx]], val)
+
+    def _eval_assign(self, idx: int):
+        val = self._eval(self._b[idx])
+        name = self._names[self._a[idx]]
+        for scope in reversed(self._scopes):
+            if name in scope:
+                scope[name] = val
+                return
+        if name not in self._globals:
+            raise ValueError(f"Undefined variable: {name}")
+        self._globals[name] = val
+
+    def _eval_block(self, idx: int):
+        start = self._a[idx]
+        self._scopes.append({})
+        for child in self._children[start : start + self._b[idx]]:
+            self._eval(child)
+            if self._returning:
+                break
+        self._scopes.pop()
+
+    def _eval_program(self, idx: int):
+        start = self._a[idx]
+        for child in self._children[start : start + self._b[idx]]:
+            self._eval(child)
+
+    def _eval_if(self, idx: int):
+        if self._eval(self._a[idx]):
+            self._eval(self._b[idx])
+        elif self._c[idx] != NONE:
+            self._eval(self._c[idx])
+
+    def _eval_while(self, idx: int):
+        condition, body = self._a[idx], self._b[idx]
+        while self._eval(condition):
+            self._eval(body)
+            if self._returning:
+                break
+
+    def _eval_for(self, idx: int):
+        self._eval(self._a[idx])
+        condition, update, body = self._b[idx], self._c[idx], self._d[idx]
+        while self._eval(condition):
+            self._eval(body)
+            if self._returning:
+                break
+            self._eval(update)
+
+    def _eval_func_decl(self, idx: int):
+        start = self._b[idx]
+        params = [self._names[i] for i in self._children[start : start + self._c[idx]]]
+        name = self._names[self._a[idx]]
+        self._define(name, FlatFunc(name=name, params=params, body=self._d[idx]))
+
+    def _eval_func_call(self, idx: int) -> Any:
+        func_name = self._names[self._a[idx]]
+        func = self._lookup(func_name)
+        start = self._b[idx]
+        arg_rows = self._children[start : start + self._c[idx]]
+        assert isinstance(func, FuncBase), f"FuncCall: {func_name} is not a function"
+        assert len(arg_rows) == len(
+            func.params
+        ), f"FuncCall: {func_name} has {len(arg_rows)} arguments, but {len(func.params)} parameters"
+        args = [self._eval(arg) for arg in arg_rows]
+        if isinstance(func, NativeFunc):
+            return func.func(self, **dict(zip(func.params, args)))
+        caller_scopes = self._scopes
+        self._scopes = [dict(zip(func.params, args))]
+        self._call_depth += 1
+        try:
+            self._eval(func.body)
+        finally:
+            self._call_depth -= 1
+            self._scopes = caller_scopes
+        if not self._returning:
+            return None
+        self._returning = False
+        res, self._return_value = self._return_value, None
+        return res
+
+    def _eval_return(self, idx: int):
+        if self._call_depth == 0:
+            raise ValueError("Return outside of a function")
+        expr = self._a[idx]
+        self._return_value = None if expr == NONE else self._eval(expr)
+        self._returning = True
+
+
+def test_flat_ast():
+    import contextlib
+    import io
+
+    from interpreter import Interpreter
+    from scanner import Scanner
+
+    source = """
+    var a = 1;
+    {
+        var a = 4;
+        print a + 2 * 3;
+    }
+    print (a + 2) * 3 / 4 - 1;
+    print "con" + "cat";
+    print a > 2 or a < 2;
+    print nil or "fallback";
+    def fib(n) {
+        if (n <= 1) {
+            return n;
+        }
+        return fib(n - 1) + fib(n - 2);
+    }
+    def add(a, b) {
+        return a + b;
+    }
+    def mix(fn1, a, b) {
+        def twice(x) {
+            return x * 2;
+        }
+        return twice(fn1(a, b));
+    }
+    for (var i = 0; i < 3; i = i + 1;) {
+        var sq = -i * i;
+        print sq;
+    }
+    print fib(12);
+    print mix(add, 1, 2);
+    """
+    print("-" * 80)
+    print(f"Testing flat AST: {source}")
+    outputs = []
+    tokens = Scanner(source).scan()
+    ast = FlatParser(tokens).parse()
+    print(f"rows={len(ast)} bytes={ast.nbytes()} names={ast.names}")
+    assert ast.kind[ast.root] == Kind.PROGRAM
+    ast = FlatAST.from_bytes(ast.to_bytes())
+    for run in (
+        lambda: Interpreter().interpret(Parser(tokens).parse()),
+        lambda: FlatInterpreter().interpret(ast),
+    ):
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            run()
+        outputs.append(buf.getvalue())
+    print(outputs[1], end="")
+    assert outputs[0] == outputs[1], f"Flat AST output differs:\n{outputs}"
+
+
+if __name__ == "__main__":
+    test_flat_ast()
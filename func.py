@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import time
 from typing import TYPE_CHECKING, Any, Callable
 
@@ -7,6 +7,7 @@ from tok import Token
 
 if TYPE_CHECKING:
     from interpreter import Interpreter
+    from memo import MemoCache
 
 
 @dataclass
@@ -21,6 +22,10 @@ class FuncBase:
 @dataclass
 class Func(FuncBase):
     body: Expr
+    # Result cache for pure or `@memo` functions.
+    cache: "MemoCache | None" = field(default=None, repr=False, compare=False)
+    # Renamed returned expression that call sites may inline (see `inliner.py`).
+    inline_body: Expr | None = field(default=None, repr=False, compare=False)
 
     def __call__(self, interpreter: "Interpreter") -> Any:
         return interpreter.interpret(self.body)
@@ -32,8 +37,8 @@ class NativeFunc(FuncBase):
 
     def __call__(self, interpreter: "Interpreter") -> Any:
         kwargs = {}
-        for param in self.params:
-            kwargs[param] = interpreter._state.get(param)
+        for slot, param in enumerate(self.params):
+            kwargs[param] = interpreter._state.get_at(0, slot)
         return self.func(interpreter, **kwargs)
 
 
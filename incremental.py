@@ -0,0 +1,293 @@
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+import logging
+
+from expr import Expr, Program
+from parser import Parser
+from resolver import Resolver
+from scanner import Scanner
+from tok import Token, TokenType
+
+logger = logging.getLogger(__name__)
+
+
+# What the parser raises on a syntax error.
+_SYNTAX_ERRORS = (AssertionError, ValueError, IndexError)
+
+
+@dataclass(slots=True)
+class _Segment:
+    """
+    One top-level statement: its tokens, their text range and its AST. A
+    run of tokens that does not parse is kept as one segment with `error` set
+    instead of `stmt`, so it is parsed again once an edit reaches it.
+    """
+
+    start: int
+    end: int
+    tokens: list[Token]
+    stmt: Expr | None
+    error: Exception | None = None
+
+
+def _segment_start(segment: _Segment) -> int:
+    return segment.start
+
+
+def _segment_end(segment: _Segment) -> int:
+    return segment.end
+
+
+@dataclass(slots=True)
+class EditStats:
+    rescanned: int  # characters scanned again
+    reparsed: int  # top-level statements parsed from the new text
+    reused: int  # top-level statements kept as they were
+
+
+class Document:
+    """
+    Source text kept scanned, parsed and resolved across edits, for editors
+    that re-run a script on every keystroke.
+
+    The program is split into top-level statements, each remembering its
+    tokens and text range. `edit()` re-scans from the end of the last
+    statement before the edit until the scanner lands exactly on the start of
+    an untouched statement, re-parses just those tokens and splices the new
+    statements into `program`. Every other statement keeps its `expr.py`
+    subtree (and the interpreter caches on it). A `def` is one top-level
+    statement, so an edit inside a function body re-parses that function.
+
+    Scanning and parsing scale with the edit, but positions are absolute:
+    every statement after it gets its offsets shifted and, if the edit adds
+    or removes lines, every token after it gets its line number rewritten.
+    That bookkeeping is O(rest of the file) per edit, so the cost of a key
+    that adds or removes a line grows linearly with the text after it.
+    Half-typed code is expected: tokens that do not parse are kept aside,
+    `error` reports the problem and `program` is only available again once
+    the text parses.
+    """
+
+    def __init__(self, text: str = ""):
+        self.text = ""
+        self._program = Program([], resolved=True)
+        self._segments: list[_Segment] = []
+        self._num_errors = 0
+        self.edit(0, 0, text)
+
+    @property
+    def error(self) -> Exception | None:
+        """The first syntax error in `text`, if any."""
+        if not self._num_errors:
+            return None
+        return next(segment.error for segment in self._segments if segment.error)
+
+    @property
+    def program(self) -> Program:
+        """The parsed and resolved program; raises `text`'s syntax error."""
+        if self._num_errors:
+            raise self.error
+        return self._program
+
+    @property
+    def tokens(self) -> list[Token]:
+        """The token list a full `Scanner.scan()` of `text` would produce."""
+        tokens = [token for segment in self._segments for token in segment.tokens]
+        tokens.append(Token(TokenType.EOF, "", None, self.text.count("\n") + 1))
+        return tokens
+
+    def edit(self, offset: int, removed: int, inserted: str) -> EditStats:
+        """Replaces `removed` characters at `offset` with `inserted`."""
+        text = self.text
+        assert 0 <= offset and offset + removed <= len(text), "Edit out of range"
+        new_text = text[:offset] + inserted + text[offset + removed :]
+        delta = len(inserted) - removed
+        line_delta = inserted.count("\n") - text.count("\n", offset, offset + removed)
+        segments = self._segments
+
+        # Statements touching the edit, including ones that merely abut it:
+        # inserting `x` right after `foo` changes that token.
+        lo = bisect_left(segments, offset, key=_segment_end)
+        hi = bisect_right(segments, offset + removed, key=_segment_start)
+        while True:
+            spans, hi, pos, error = self._rescan(new_text, lo, hi, delta)
+            if lo and spans and spans[0][0].token_type == TokenType.ELSE:
+                # `else` continues the `if` statement before it.
+                lo -= 1
+                continue
+            if error is not None:
+                break
+            try:
+                parsed = _parse_statements(spans, partial_ok=hi < len(segments))
+            except _SYNTAX_ERRORS as exc:
+                error = exc
+                break
+            if parsed is not None:
+                break
+            # The last statement runs on into the next one.
+            hi += 1
+
+        if error is None:
+            new_segments = [
+                _Segment(stmt_spans[0][1], stmt_spans[-1][2], tokens, stmt)
+                for stmt, stmt_spans, tokens in parsed
+            ]
+            resolver = Resolver()
+            for segment in new_segments:
+                resolver.resolve(segment.stmt)
+        else:
+            logger.debug(f"Syntax error after edit at {offset}: {error}")
+            # Anything typed after an unterminated string or a statement cut
+            # off by the end of the text may complete it, so the segment runs
+            # to the end.
+            end = spans[-1][2] if spans and hi < len(segments) else len(new_text)
+            start = spans[0][1] if spans else pos
+            new_segments = [
+                _Segment(start, end, [span[0] for span in spans], None, error)
+            ]
+        for segment in segments[hi:]:
+            segment.start += delta
+            segment.end += delta
+            if line_delta:
+                for token in segment.tokens:
+                    token.lineno += line_delta
+        self._num_errors += sum(segment.error is not None for segment in new_segments)
+        self._num_errors -= sum(segment.error is not None for segment in segments[lo:hi])
+        reused = len(segments) - (hi - lo)
+        segments[lo:hi] = new_segments
+        self._program.exprs[lo:hi] = [segment.stmt for segment in new_segments]
+        self.text = new_text
+        stats = EditStats(
+            rescanned=(spans[-1][2] if spans else pos) - pos,
+            reparsed=len(new_segments),
+            reused=reused,
+        )
+        logger.debug(f"Edit at {offset}: {stats}")
+        return stats
+
+    def _rescan(
+        self, text: str, lo: int, hi: int, delta: int
+    ) -> tuple[list[tuple[Token, int, int]], int, int, Exception | None]:
+        """
+        Scans `text` from the end of statement `lo - 1` up to the shifted start
+        of the first untouched statement at or after `hi`. Statements the new
+        tokens run over (an opened string or comment) count as touched too.
+        """
+        segments = self._segments
+        if lo:
+            pos, lineno = segments[lo - 1].end, segments[lo - 1].tokens[-1].lineno
+        else:
+            pos, lineno = 0, 1
+        spans = []
+        try:
+            for span in Scanner(text).spans(pos, lineno):
+                start = span[1]
+                while hi < len(segments) and segments[hi].start + delta < start:
+                    hi += 1
+                if hi < len(segments) and segments[hi].start + delta == start:
+                    # Same text from here on, so the same tokens: back in sync.
+                    return spans, hi, pos, None
+                spans.append(span)
+        except ValueError as exc:
+            # An unterminated string runs to the end of the text.
+            return spans, len(segments), pos, exc
+        # Ran to the end of the text: everything after the edit was touched.
+        return spans, len(segments), pos, None
+
+
+def _parse_statements(
+    spans: list[tuple[Token, int, int]], partial_ok: bool
+) -> list[tuple[Expr, list[tuple[Token, int, int]], list[Token]]] | None:
+    """
+    Parses re-scanned tokens into top-level statements. Returns None when
+    `partial_ok` and the last statement is cut off by the end of the tokens.
+    """
+    tokens = [span[0] for span in spans]
+    lineno = tokens[-1].lineno if tokens else 1
+    parser = Parser(tokens + [Token(TokenType.EOF, "", None, lineno)])
+    parsed = []
+    try:
+        for stmt, start, end in parser.statement_ranges():
+            parsed.append((stmt, spans[start:end], tokens[start:end]))
+    except _SYNTAX_ERRORS:
+        if partial_ok and parser._cur >= len(tokens):
+            return None
+        raise
+    return parsed
+
+
+def test_incremental():
+    import random
+
+    print("-" * 80)
+    print("Testing incremental re-parsing")
+    text = """var total = 0;
+def add(a, b) {
+    // sum "two" values
+    return a + b;
+}
+if (total < 1) {
+    total = add(total, 2);
+} else {
+    print "big";
+}
+print add(1, 2);
+for (var i = 0; i < 3; i = i + 1;) {
+    total = total + i;
+}
+print total;
+"""
+    doc = Document(text)
+    stmts = list(doc.program.exprs)
+    # Renaming a variable inside the `for` re-parses just that statement.
+    offset = text.index("total + i")
+    stats = doc.edit(offset, len("total"), "0")
+    assert (stats.reparsed, stats.reused) == (1, len(stmts) - 1), stats
+    assert [a is b for a, b in zip(doc.program.exprs, stmts)] == [
+        True, True, True, True, False, True
+    ]
+    # A new line in the first statement shifts the lines of all later ones.
+    doc.edit(len("var"), 0, "\n")
+    assert doc.program.exprs[1] is stmts[1] and doc.program.exprs[-1] is stmts[-1]
+    assert stmts[-1].expr.value.lineno == 16
+    assert doc.tokens == Scanner(doc.text).scan()
+
+    # Typing a statement one key at a time goes through broken states.
+    offset = doc.text.index("print add")
+    for idx, key in enumerate("print add(total, 1);\n"):
+        doc.edit(offset + idx, 0, key)
+        if key == "(":
+            assert doc.error is not None
+    assert doc.error is None and len(doc.program.exprs) == len(stmts) + 1
+    doc.edit(offset, 0, '"')
+    assert isinstance(doc.error, ValueError)
+    doc.edit(offset, 1, "")
+    assert doc.error is None
+
+    # Random edits and their undos, valid or not, must agree with parsing
+    # from scratch.
+    rng = random.Random(0)
+    pieces = ["", " ", "\n", ";", "}", "{", '"', "//", "x", "1"]
+    pieces += ["else ", "if (x) ", "print 5;", "def g() {"]
+    undo = []
+    for _ in range(1000):
+        if undo and rng.random() < 0.5:
+            offset, removed, inserted = undo.pop()
+        else:
+            offset = rng.randrange(len(doc.text) + 1)
+            removed = rng.randrange(min(4, len(doc.text) - offset) + 1)
+            inserted = rng.choice(pieces)
+            undo.append((offset, len(inserted), doc.text[offset : offset + removed]))
+        doc.edit(offset, removed, inserted)
+        try:
+            expected = Resolver().resolve(Parser(Scanner(doc.text).scan()).parse())
+        except _SYNTAX_ERRORS:
+            assert doc.error is not None, doc.text
+            continue
+        assert doc.error is None, (doc.text, doc.error)
+        assert doc.program == expected, doc.text
+        assert doc.tokens == Scanner(doc.text).scan(), doc.text
+
+
+if __name__ == "__main__":
+    test_incremental()
@@ -0,0 +1,232 @@
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    UnaryExpr,
+    WhileStmt,
+)
+from resolver import Resolver
+from tok import Token, TokenType
+
+# Largest returned expression, in nodes, that call sites inline.
+INLINE_MAX_NODES = 16
+
+
+class _NotInlinable(Exception):
+    """The body has something an inlined expression cannot do."""
+
+
+class _InlineCopier(Visitor):
+    """
+    Copies the returned expression of a function with its parameters renamed
+    to `<function>.<param>` and re-resolved to slots of a scope the call site
+    pushes for the arguments (depth 0). Globals stay name lookups. Copies are
+    fresh nodes, so their interpreter caches start empty.
+    """
+
+    def __init__(self, decl: FuncDecl):
+        self._decl = decl
+        self._nodes = 0
+
+    def copy(self, expr: Expr) -> Expr:
+        self._nodes += 1
+        if self._nodes > INLINE_MAX_NODES:
+            raise _NotInlinable(f"more than {INLINE_MAX_NODES} nodes")
+        return expr.accept(self)
+
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        token = expr.value
+        if token.token_type != TokenType.IDENTIFIER or expr.depth is None:
+            return LiteralExpr(token, depth=expr.depth, slot=expr.slot)
+        # The body declares nothing, so every local is a parameter.
+        name = f"{self._decl.name.lexeme}.{self._decl.params[expr.slot].lexeme}"
+        renamed = Token(TokenType.IDENTIFIER, name, None, token.lineno)
+        return LiteralExpr(renamed, depth=0, slot=expr.slot)
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        return UnaryExpr(self.copy(expr.right), expr.op)
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        return BinaryExpr(self.copy(expr.left), self.copy(expr.right), expr.op)
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        return GroupingExpr(self.copy(expr.expr))
+
+    def visit_func_call(self, expr: "FuncCall"):
+        # Leaf functions only: they can never be recursive.
+        raise _NotInlinable("calls a function")
+
+    def _statement(self, stmt: Expr):
+        raise _NotInlinable(f"{type(stmt).__name__} in an expression")
+
+    visit_print_stmt = visit_decl_stmt = visit_assign_stmt = _statement
+    visit_block = visit_program = visit_if_stmt = visit_while_stmt = _statement
+    visit_for_stmt = visit_func_decl = visit_return_stmt = _statement
+    visit_lazy_body = _statement
+
+
+def inline_body(decl: FuncDecl) -> Expr | None:
+    """
+    The expression a call site may evaluate instead of calling `decl`: the
+    body must be a single `return <expr>;` without calls whose expression
+    has at most `INLINE_MAX_NODES` nodes. `@memo` functions keep their cache.
+    """
+    if "memo" in decl.annotations:
+        return None
+    body = decl.body
+    if isinstance(body, LazyBody):
+        # An unparsed body is not worth parsing just to look at it.
+        body = body.block
+    if not isinstance(body, Block) or len(body.exprs) != 1:
+        return None
+    stmt = body.exprs[0]
+    if not isinstance(stmt, ReturnStmt) or stmt.expr is None:
+        return None
+    try:
+        return _InlineCopier(decl).copy(stmt.expr)
+    except _NotInlinable:
+        return None
+
+
+class InlineAnalyzer(Visitor):
+    """Sets `FuncDecl.inline_body` on every function of a resolved program."""
+
+    def __init__(self):
+        self._inlinable: list[FuncDecl] = []
+
+    def analyze(self, program: Expr) -> list[FuncDecl]:
+        if isinstance(program, Program) and not program.resolved:
+            Resolver().resolve(program)
+        program.accept(self)
+        return self._inlinable
+
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        pass
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        pass
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        pass
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        pass
+
+    def visit_func_call(self, expr: "FuncCall"):
+        pass
+
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        pass
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        pass
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        pass
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        pass
+
+    def visit_block(self, block: "Block"):
+        for stmt in block.exprs:
+            stmt.accept(self)
+
+    def visit_program(self, program: "Program"):
+        for stmt in program.exprs:
+            stmt.accept(self)
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        stmt.body.accept(self)
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        stmt.body.accept(self)
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        stmt.inline_body = inline_body(stmt)
+        if stmt.inline_body is not None:
+            self._inlinable.append(stmt)
+        stmt.body.accept(self)
+
+    def visit_lazy_body(self, body: "LazyBody"):
+        if body.block is not None:
+            body.block.accept(self)
+
+
+def analyze_inlining(program: Expr) -> list[FuncDecl]:
+    """Sets `FuncDecl.inline_body` across `program`; returns the inlinable ones."""
+    return InlineAnalyzer().analyze(program)
+
+
+def test_inliner():
+    from parser import Parser
+    from scanner import Scanner
+
+    source = """
+    var scale = 3;
+    def add(a, b) {
+        return a + b;
+    }
+    def scaled(x) {
+        return (x - 1) * scale;
+    }
+    def fib(n) {
+        if (n <= 1) {
+            return n;
+        }
+        return fib(n - 1) + fib(n - 2);
+    }
+    def twice(x) {
+        return add(x, x);
+    }
+    def big(x) {
+        return x + x + x + x + x + x + x + x + x;
+    }
+    @memo
+    def square(x) {
+        return x * x;
+    }
+    {
+        def local(y) {
+            return -y;
+        }
+    }
+    """
+    print("-" * 80)
+    print(f"Testing inlining analysis: {source}")
+    program = Parser(Scanner(source).scan()).parse()
+    inlinable = analyze_inlining(program)
+    names = [decl.name.lexeme for decl in inlinable]
+    assert names == ["add", "scaled", "local"], names
+
+    body = inlinable[0].inline_body
+    assert body.left.value.lexeme == "add.a"
+    assert (body.left.depth, body.left.slot) == (0, 0)
+    assert body.right.value.lexeme == "add.b" and body.right.slot == 1
+    # The original body is untouched; it declares nothing, so it has no scope
+    # and its parameters are at depth 0 too.
+    original = inlinable[0].body.exprs[0].expr
+    assert original.left.value.lexeme == "a" and original.left is not body.left
+    assert original.left.depth == 0
+    scaled = inlinable[1].inline_body
+    assert scaled.right.value.lexeme == "scale" and scaled.right.depth is None
+
+
+if __name__ == "__main__":
+    test_inliner()
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum
 from typing import TYPE_CHECKING
 
@@ -19,23 +19,39 @@ if TYPE_CHECKING:
         ForStmt,
         FuncDecl,
         FuncCall,
+        LazyBody,
         ReturnStmt,
     )
 
-import logging
 import config_logging
 
-logger = logging.getLogger(__name__)
 
+# Field metadata for interpreter caches that are not part of the program.
+RUNTIME_FIELD = {"runtime": True}
+
+_pickled_fields: dict[type, tuple[str, ...]] = {}
 
-@dataclass
-class Expr:
-    def __post_init__(self):
-        logger.debug(f"Constructing {self.__class__.__name__}")
 
+# Nodes are slotted: large generated scripts build hundreds of thousands of
+# them, so they carry no per-instance `__dict__` and no construction logging.
+@dataclass(slots=True)
+class Expr:
     def accept(self, visitor: "Visitor"):
         pass
 
+    def __reduce__(self):
+        # Pickled as a constructor call with positional field values, which is
+        # far smaller than slot-state dicts. Runtime fields come last in
+        # every node and are left at their defaults.
+        cls = self.__class__
+        names = _pickled_fields.get(cls)
+        if names is None:
+            names = tuple(
+                f.name for f in fields(cls) if not f.metadata.get("runtime")
+            )
+            _pickled_fields[cls] = names
+        return cls, tuple(getattr(self, name) for name in names)
+
     def __str__(self) -> str:
         from printer import ExprPrinter
 
@@ -88,3 +104,7 @@ class Visitor:
 
     def visit_return_stmt(self, stmt: "ReturnStmt"):
         pass
+
+    def visit_lazy_body(self, body: "LazyBody"):
+        # Visitors that do not care about laziness see the parsed body.
+        return body.materialize().accept(self)
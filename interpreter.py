@@ -1,6 +1,9 @@
-from typing import Any
-from env import State
+from enum import Enum
+from typing import Any, Iterable
+from env import Env, State
+from counted_loop import exact_int, match_counted_loop
 from func import Func, FuncBase, build_native_func_sleep, build_native_func_time
+from inliner import analyze_inlining
 from interface import Expr, Visitor
 from expr import (
     AssignStmt,
@@ -19,6 +22,10 @@ from expr import (
     WhileStmt,
     ForStmt,
 )
+from memo import DEFAULT_MEMO_MAX_BYTES, MISSING, MemoCache
+from purity import analyze_purity
+from quicken import QUICKEN_THRESHOLD, binary_variant, unary_variant
+from resolver import Resolver
 from tok import TokenType
 import logging
 
@@ -26,10 +33,165 @@ from utils import color_print
 
 logger = logging.getLogger(__name__)
 
+# Callees remembered per local call site before it is treated as megamorphic.
+_MAX_IC_CALLEES = 4
+
+_MATH_OPS = frozenset(
+    (TokenType.PLUS, TokenType.MINUS, TokenType.SLASH, TokenType.STAR)
+)
+_AND_OR_OPS = frozenset((TokenType.AND, TokenType.OR))
+
+
+def unary_op(op_type: TokenType, val: Any) -> Any:
+    match op_type:
+        case TokenType.MINUS:
+            assert isinstance(val, float), f"UnaryExpr: {val} is not a number"
+            return -val
+        case TokenType.BANG:
+            assert isinstance(val, bool), f"UnaryExpr: {val} is not a boolean"
+            return not val
+    assert False, f"UnaryExpr: {op_type} is not accepted"
+
+
+# Checked arithmetic: the slow paths every engine falls back to once its own
+# float fast path does not apply.
+def check_numbers(left_val: Any, right_val: Any):
+    assert isinstance(left_val, float), f"BinaryExpr: {left_val} is not a number"
+    assert isinstance(right_val, float), f"BinaryExpr: {right_val} is not a number"
+
+
+def add_values(left_val: Any, right_val: Any) -> Any:
+    assert type(left_val) == type(
+        right_val
+    ), f"BinaryExpr: {left_val} and {right_val} are not the same type"
+    assert isinstance(
+        left_val, float | str
+    ), f"BinaryExpr: {left_val} is not a number or string"
+    return left_val + right_val
+
+
+def sub_values(left_val: Any, right_val: Any) -> Any:
+    check_numbers(left_val, right_val)
+    return left_val - right_val
+
+
+def mul_values(left_val: Any, right_val: Any) -> Any:
+    check_numbers(left_val, right_val)
+    return left_val * right_val
+
+
+def div_values(left_val: Any, right_val: Any) -> Any:
+    check_numbers(left_val, right_val)
+    return left_val / right_val
+
+
+def _math_op(op_type: TokenType, left_val: Any, right_val: Any) -> Any:
+    match op_type:
+        case TokenType.PLUS:
+            return add_values(left_val, right_val)
+        case TokenType.MINUS:
+            return sub_values(left_val, right_val)
+        case TokenType.SLASH:
+            return div_values(left_val, right_val)
+        case TokenType.STAR:
+            return mul_values(left_val, right_val)
+    assert False, f"BinaryExpr: {op_type} is not handled"
+
+
+def _logic_op(op_type: TokenType, left_val: Any, right_val: Any) -> Any:
+    match op_type:
+        case TokenType.EQUAL_EQUAL:
+            return left_val == right_val
+        case TokenType.BANG_EQUAL:
+            return left_val != right_val
+        case TokenType.GREATER:
+            return left_val > right_val
+        case TokenType.GREATER_EQUAL:
+            return left_val >= right_val
+        case TokenType.LESS:
+            return left_val < right_val
+        case TokenType.LESS_EQUAL:
+            return left_val <= right_val
+        case _:
+            assert False, f"BinaryExpr: {op_type} is not handled"
+
+
+def binary_op(op_type: TokenType, left_val: Any, right_val: Any) -> Any:
+    """Applies an arithmetic or comparison operator with the evaluator's checks."""
+    if op_type in _MATH_OPS:
+        return _math_op(op_type, left_val, right_val)
+    return _logic_op(op_type, left_val, right_val)
+
+
+class Signal(Enum):
+    """
+    Pending non-local control flow. Statements that complete abruptly set
+    `Interpreter._signal` instead of raising; blocks and loops stop as soon as
+    it is set, and the construct that owns the signal consumes it (function
+    calls consume RETURN). `break`/`continue` would add members here and be
+    consumed by the enclosing loop.
+
+    TAIL_CALL is set by `return f(...)` in tail position: the callee and its
+    filled frame are left in `Interpreter._tail_call` and the active call
+    loops on them after its own frame is popped, so tail recursion runs in
+    constant Python stack depth.
+    """
+
+    RETURN = "return"
+    TAIL_CALL = "tail_call"
+
 
 class Interpreter(Visitor):
-    def __init__(self):
+    """
+    Tree-walking evaluator.
+
+    With `memoize` on, functions that `purity.analyze_purity()` proves pure
+    get a `MemoCache` of at most `memo_max_bytes`; `@memo` functions always
+    get one. `memo_hits`/`memo_misses` count lookups across all caches.
+
+    Call sites keep an inline cache of their validated callee;
+    `ic_hits`/`ic_misses` count how often the lookup and checks were skipped.
+
+    With `quicken` on, unary/binary nodes that keep seeing the same operand
+    types rewrite themselves into specialized variants (see `quicken.py`);
+    `quickened`/`deoptimized` count sites that were specialized and sites
+    whose guard later failed.
+
+    With `inline` on, global call sites of small leaf functions (see
+    `inliner.py`) evaluate the callee's renamed returned expression in a
+    scope holding the arguments instead of making a call. The site checks
+    `State.globals_version` first; as that moves whenever any global holding
+    a function is rebound, a stale site then looks its own name up again and
+    only goes back to calling if that name was rebound. `inlined`/`uninlined`
+    count both.
+    """
+
+    def __init__(
+        self,
+        memoize: bool = True,
+        memo_max_bytes: int = DEFAULT_MEMO_MAX_BYTES,
+        quicken: bool = True,
+        inline: bool = True,
+        counted_loops: bool = True,
+    ):
         self._state = State()
+        self._memoize = memoize
+        self._quicken = quicken
+        self._inline = inline
+        self._counted_loops = counted_loops
+        self._memo_max_bytes = memo_max_bytes
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.ic_hits = 0
+        self.ic_misses = 0
+        self.quickened = 0
+        self.deoptimized = 0
+        self.inlined = 0
+        self.uninlined = 0
+        self.counted_loops = 0
+        self._signal: Signal | None = None
+        self._return_value: Any = None
+        self._tail_call: tuple[FuncBase, Env] | None = None
         self._load_native_funcs()
 
     def _load_native_funcs(self):
@@ -39,6 +201,17 @@ class Interpreter(Visitor):
     def interpret(self, expr: Expr) -> Any:
         return expr.accept(self)
 
+    def interpret_stream(self, stmts: Iterable[Expr]):
+        """
+        Resolves and runs top-level statements one at a time as they arrive,
+        e.g. from `StreamingParser.statements()`. Purity analysis needs the
+        whole program, so only `@memo` functions are memoized here.
+        """
+        resolver = Resolver()
+        for stmt in stmts:
+            resolver.resolve(stmt)
+            self.interpret(stmt)
+
     def visit_literal_expr(self, expr: "LiteralExpr"):
         accepted_types = [
             TokenType.NUMBER,
@@ -53,82 +226,21 @@ class Interpreter(Visitor):
             token.token_type in accepted_types
         ), f"LiteralExpr: {token.token_type} is not accepted"
         if token.token_type == TokenType.IDENTIFIER:
-            return self._state.get(token.lexeme)
+            if expr.depth is None:
+                return self._state.get(token.lexeme)
+            return self._state.get_at(expr.depth, expr.slot)
         else:
             return token.literal
 
     def visit_unary_expr(self, expr: "UnaryExpr"):
-        accepted_types = [TokenType.MINUS, TokenType.BANG]
-        token = expr.op
-        assert (
-            token.token_type in accepted_types
-        ), f"UnaryExpr: {token.token_type} is not accepted"
+        quick = expr.quick
+        if quick is not None:
+            return quick(self, expr)
         val = self.interpret(expr.right)
-        match token.token_type:
-            case TokenType.MINUS:
-                assert isinstance(val, float), f"UnaryExpr: {val} is not a number"
-                return -val
-            case TokenType.BANG:
-                assert isinstance(val, bool), f"UnaryExpr: {val} is not a boolean"
-                return not val
-
-    def _handle_math_op(self, expr: "BinaryExpr"):
-        token = expr.op
-        left_val = self.interpret(expr.left)
-        right_val = self.interpret(expr.right)
-        match token.token_type:
-            case TokenType.PLUS:
-                assert type(left_val) == type(
-                    right_val
-                ), f"BinaryExpr: {left_val} and {right_val} are not the same type"
-                assert isinstance(
-                    left_val, float | str
-                ), f"BinaryExpr: {left_val} is not a number or string"
-                return left_val + right_val
-            case TokenType.MINUS:
-                assert isinstance(
-                    left_val, float
-                ), f"BinaryExpr: {left_val} is not a number"
-                assert isinstance(
-                    right_val, float
-                ), f"BinaryExpr: {right_val} is not a number"
-                return left_val - right_val
-            case TokenType.SLASH:
-                assert isinstance(
-                    left_val, float
-                ), f"BinaryExpr: {left_val} is not a number"
-                assert isinstance(
-                    right_val, float
-                ), f"BinaryExpr: {right_val} is not a number"
-                return left_val / right_val
-            case TokenType.STAR:
-                assert isinstance(
-                    left_val, float
-                ), f"BinaryExpr: {left_val} is not a number"
-                assert isinstance(
-                    right_val, float
-                ), f"BinaryExpr: {right_val} is not a number"
-                return left_val * right_val
-        assert False, f"BinaryExpr: {token.token_type} is not handled"
-
-    def _handle_logic_op(self, expr: "BinaryExpr"):
-        left_val = self.interpret(expr.left)
-        right_val = self.interpret(expr.right)
-        match expr.op.token_type:
-            case TokenType.EQUAL_EQUAL:
-                return left_val == right_val
-            case TokenType.BANG_EQUAL:
-                return left_val != right_val
-            case TokenType.GREATER:
-                return left_val > right_val
-            case TokenType.GREATER_EQUAL:
-                return left_val >= right_val
-            case TokenType.LESS:
-                return left_val < right_val
-            case TokenType.LESS_EQUAL:
-                return left_val <= right_val
-            case _:
-                assert False, f"BinaryExpr: {expr.op.token_type} is not handled"
+        res = unary_op(expr.op.token_type, val)
+        if self._quicken and expr.quick_count >= 0:
+            self._profile(expr, (val.__class__,))
+        return res
 
     def _handle_and_or_op(self, expr: "BinaryExpr"):
         op = expr.op
@@ -147,32 +259,55 @@ class Interpreter(Visitor):
         assert False, f"BinaryExpr: {expr.op.token_type} is not handled"
 
     def visit_binary_expr(self, expr: "BinaryExpr"):
-        math_ops = [
-            TokenType.PLUS,
-            TokenType.MINUS,
-            TokenType.SLASH,
-            TokenType.STAR,
-        ]
-        logic_ops = [
-            TokenType.EQUAL_EQUAL,
-            TokenType.BANG_EQUAL,
-            TokenType.GREATER,
-            TokenType.GREATER_EQUAL,
-            TokenType.LESS,
-            TokenType.LESS_EQUAL,
-        ]
-        and_or_ops = [
-            TokenType.AND,
-            TokenType.OR,
-        ]
-
-        if expr.op.token_type in math_ops:
-            return self._handle_math_op(expr)
-        elif expr.op.token_type in logic_ops:
-            return self._handle_logic_op(expr)
-        elif expr.op.token_type in and_or_ops:
+        quick = expr.quick
+        if quick is not None:
+            return quick(self, expr)
+        op_type = expr.op.token_type
+        if op_type in _AND_OR_OPS:
             return self._handle_and_or_op(expr)
-        assert False, f"BinaryExpr: {expr.op.token_type} is not handled"
+        left_val = self.interpret(expr.left)
+        right_val = self.interpret(expr.right)
+        res = binary_op(op_type, left_val, right_val)
+        if self._quicken and expr.quick_count >= 0:
+            self._profile(expr, (left_val.__class__, right_val.__class__))
+        return res
+
+    def _profile(self, expr: "BinaryExpr | UnaryExpr", types: tuple[type, ...]):
+        """
+        Records the operand types of a generic execution and, once a site has
+        seen the same ones `QUICKEN_THRESHOLD` times in a row, rewrites it into
+        the matching specialized variant. Sites without one stop profiling.
+        """
+        if types != expr.quick_types:
+            expr.quick_types = types
+            expr.quick_count = 1
+        else:
+            expr.quick_count += 1
+        if expr.quick_count < QUICKEN_THRESHOLD:
+            return
+        if isinstance(expr, BinaryExpr):
+            variant = binary_variant(expr.op.token_type, *types)
+        else:
+            variant = unary_variant(expr.op.token_type, *types)
+        if variant is None:
+            expr.quick_count = -1
+            return
+        expr.quick = variant
+        self.quickened += 1
+
+    def _deoptimize(self, expr: "BinaryExpr | UnaryExpr"):
+        # A site whose guard failed stays generic from now on.
+        expr.quick = None
+        expr.quick_count = -1
+        self.deoptimized += 1
+
+    def _deoptimize_binary(self, expr: "BinaryExpr", left_val: Any, right_val: Any):
+        self._deoptimize(expr)
+        return binary_op(expr.op.token_type, left_val, right_val)
+
+    def _deoptimize_unary(self, expr: "UnaryExpr", val: Any):
+        self._deoptimize(expr)
+        return unary_op(expr.op.token_type, val)
 
     def visit_grouping_expr(self, expr: "GroupingExpr"):
         return self.interpret(expr.expr)
@@ -188,18 +323,54 @@ class Interpreter(Visitor):
             val = None
         else:
             val = self.interpret(stmt.expr)
-        self._state.define(stmt.name.lexeme, val)
+        if stmt.slot is None:
+            self._state.define(stmt.name.lexeme, val)
+        else:
+            self._state.define_at(stmt.slot, val)
 
     def visit_assign_stmt(self, stmt: "AssignStmt"):
         val = self.interpret(stmt.expr)
-        self._state.assign(stmt.name.lexeme, val)
+        if stmt.depth is None:
+            self._state.assign(stmt.name.lexeme, val)
+        else:
+            self._state.assign_at(stmt.depth, stmt.slot, val)
 
     def visit_block(self, block: "Block"):
-        with self._state.block_scope():
-            for stmt in block.exprs:
-                self.interpret(stmt)
+        if block.num_slots:
+            self._run_block(block, [None] * block.num_slots)
+            return
+        # Declares nothing, so the resolver gave it no scope.
+        for stmt in block.exprs:
+            self.interpret(stmt)
+            if self._signal is not None:
+                break
+
+    def _run_block(self, block: "Block", scope: list[Any]):
+        scopes = self._state.env_list[-1].scopes
+        scopes.append(scope)
+        for stmt in block.exprs:
+            self.interpret(stmt)
+            if self._signal is not None:
+                break
+        scopes.pop()
+
+    def _loop_scope(self, body: Expr) -> list[Any] | None:
+        """
+        The one scope a loop allocates for a body block that declares names;
+        each iteration clears it and pushes it again. None for other bodies,
+        which the loop interprets directly.
+        """
+        if body.__class__ is Block and body.num_slots:
+            return [None] * body.num_slots
+        return None
 
     def visit_program(self, program: "Program"):
+        if not program.resolved:
+            Resolver().resolve(program)
+        if self._memoize:
+            analyze_purity(program)
+        if self._inline:
+            analyze_inlining(program)
         for stmt in program.exprs:
             self.interpret(stmt)
 
@@ -211,50 +382,223 @@ class Interpreter(Visitor):
             self.interpret(stmt.else_branch)
 
     def visit_while_stmt(self, stmt: "WhileStmt"):
+        body = stmt.body
+        scope = self._loop_scope(body)
+        if scope is None:
+            while self.interpret(stmt.condition):
+                self.interpret(body)
+                if self._signal is not None:
+                    break
+            return
+        cleared = scope.copy()
         while self.interpret(stmt.condition):
-            self.interpret(stmt.body)
+            scope[:] = cleared
+            self._run_block(body, scope)
+            if self._signal is not None:
+                break
 
     def visit_for_stmt(self, stmt: "ForStmt"):
         self.interpret(stmt.init)
+        if self._counted_loops:
+            if stmt.counted is None:
+                stmt.counted = match_counted_loop(stmt) or False
+            if stmt.counted and self._run_counted(stmt):
+                return
+        body = stmt.body
+        scope = self._loop_scope(body)
+        if scope is None:
+            while self.interpret(stmt.condition):
+                self.interpret(body)
+                if self._signal is not None:
+                    break
+                self.interpret(stmt.update)
+            return
+        cleared = scope.copy()
         while self.interpret(stmt.condition):
-            self.interpret(stmt.body)
+            scope[:] = cleared
+            self._run_block(body, scope)
+            if self._signal is not None:
+                break
             self.interpret(stmt.update)
 
+    def _run_counted(self, stmt: "ForStmt") -> bool:
+        """
+        Runs a matched counted loop over a Python `range`, writing the loop
+        variable straight into its slot instead of interpreting the condition
+        and update. Returns False, having run nothing, unless the start is an
+        integral number and the bound a number, both small enough to count
+        exactly; the generic loop then reports any type errors.
+        """
+        loop = stmt.counted
+        env = self._state.env_list[-1]
+        var = loop.var
+        if var.__class__ is str:
+            home, key = env.globals, var
+            if key not in home:
+                return False
+        else:
+            home, key = env.scopes[-1 - var[0]], var[1]
+        start = exact_int(home[key])
+        bound = loop.bound
+        if bound.__class__ is str:
+            bound = env.globals.get(bound)
+        elif bound.__class__ is tuple:
+            bound = env.scopes[-1 - bound[0]][bound[1]]
+        stop = loop.stop(bound)
+        if start is None or stop is None:
+            return False
+        self.counted_loops += 1
+        step = loop.step
+        body = stmt.body
+        scope = self._loop_scope(body)
+        cleared = None if scope is None else scope.copy()
+        n = start - step
+        for n in range(start, stop, step):
+            home[key] = float(n)
+            if scope is None:
+                self.interpret(body)
+            else:
+                scope[:] = cleared
+                self._run_block(body, scope)
+            if self._signal is not None:
+                return True
+        # Where the update would have left it when the condition failed.
+        home[key] = float(n + step)
+        return True
+
     def visit_func_decl(self, stmt: "FuncDecl"):
         name = stmt.name.lexeme
         params = [param.lexeme for param in stmt.params]
         body = stmt.body
-        func = Func(name=name, params=params, body=body)
-        self._state.define(name, func)
+        func = Func(name=name, params=params, body=body, inline_body=stmt.inline_body)
+        if "memo" in stmt.annotations or (self._memoize and stmt.pure):
+            func.cache = MemoCache(self._memo_max_bytes)
+        if stmt.slot is None:
+            self._state.define(name, func)
+        else:
+            self._state.define_at(stmt.slot, func)
 
-    def visit_func_call(self, expr: "FuncCall"):
+    def _check_callee(self, expr: "FuncCall", func: Any):
         func_name = expr.name.lexeme
-        func = self._state.get(func_name)
         assert isinstance(func, FuncBase), f"FuncCall: {func_name} is not a function"
         assert len(expr.args) == len(
             func.params
         ), f"FuncCall: {func_name} has {len(expr.args)} arguments, but {len(func.params)} parameters"
-        id_args = {}
-        val_args = {}
-        for param, arg in zip(func.params, expr.args):
-            if (
-                isinstance(arg, LiteralExpr)
-                and arg.value.token_type == TokenType.IDENTIFIER
-            ):
-                id_args[param] = arg.value.lexeme
+
+    def _lookup_callee(self, expr: "FuncCall") -> FuncBase:
+        if expr.depth is None:
+            version = self._state.globals_version
+            if expr.ic_version == version:
+                self.ic_hits += 1
+                return expr.ic_func
+            func = self._state.get(expr.name.lexeme)
+            self._check_callee(expr, func)
+            self.ic_misses += 1
+            expr.ic_func, expr.ic_version = func, version
+            if self._inline and func.__class__ is Func and func.inline_body is not None:
+                expr.inlined, expr.inline_version = func.inline_body, version
+                self.inlined += 1
+            return func
+        func = self._state.get_at(expr.depth, expr.slot)
+        callees = expr.ic_callees
+        if callees is not None and id(func) in callees:
+            self.ic_hits += 1
+            return func
+        self._check_callee(expr, func)
+        self.ic_misses += 1
+        if callees is None:
+            callees = expr.ic_callees = {}
+        if len(callees) < _MAX_IC_CALLEES:
+            # Holding the callee keeps its id from being reused.
+            callees[id(func)] = func
+        return func
+
+    def _prepare_call(self, expr: "FuncCall") -> tuple[FuncBase, Env]:
+        func = self._lookup_callee(expr)
+        return func, self._fill_frame(expr)
+
+    def _fill_frame(self, expr: "FuncCall") -> Env:
+        # Arguments are evaluated in the caller's frame, straight into the
+        # callee's parameter slots.
+        frame = self._state.new_frame(len(expr.args))
+        params = frame.scopes[0]
+        for slot, arg in enumerate(expr.args):
+            params[slot] = self.interpret(arg)
+        return frame
+
+    def _call_inlined(self, expr: "FuncCall", body: Expr) -> Any:
+        # The arguments become the scope the renamed parameters point at.
+        args = [self.interpret(arg) for arg in expr.args]
+        scopes = self._state.env_list[-1].scopes
+        scopes.append(args)
+        try:
+            return self.interpret(body)
+        finally:
+            scopes.pop()
+
+    def visit_func_call(self, expr: "FuncCall"):
+        inlined = expr.inlined
+        version = self._state.globals_version
+        if inlined is not None and expr.inline_version != version:
+            if self._state.get(expr.name.lexeme) is expr.ic_func:
+                # Another function global was rebound; this callee was not.
+                expr.inline_version = expr.ic_version = version
             else:
-                val_args[param] = self.interpret(arg)
-        with self._state.func_scope(id_args, val_args):
+                # The callee's name was rebound: back to a call.
+                expr.inlined = inlined = None
+                self.uninlined += 1
+        if inlined is None:
+            func = self._lookup_callee(expr)
+            inlined = expr.inlined
+        if inlined is not None:
+            return self._call_inlined(expr, inlined)
+        frame = self._fill_frame(expr)
+        # Cache entries to fill once the chain of tail calls has a result.
+        pending = []
+        while True:
+            cache = func.cache if func.__class__ is Func else None
+            if cache is not None:
+                key = cache.make_key(frame.scopes[0])
+                if key is not None:
+                    res = cache.get(key)
+                    if res is not MISSING:
+                        self.memo_hits += 1
+                        self._state.release_frame(frame)
+                        break
+                    self.memo_misses += 1
+                    pending.append((cache, key))
+            self._state.push_frame(frame)
             try:
-                return func(self)
-            except ValueError as e:
-                return e.args[0]
+                res = func(self)
+            finally:
+                self._state.pop_frame()
+            if self._signal is Signal.TAIL_CALL:
+                self._signal = None
+                (func, frame), self._tail_call = self._tail_call, None
+                continue
+            if self._signal is Signal.RETURN:
+                self._signal = None
+                res, self._return_value = self._return_value, None
+            break
+        for cache, key in pending:
+            cache.put(key, res)
+        return res
 
     def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if len(self._state.env_list) == 1:
+            raise ValueError("Return outside of a function")
+        expr = stmt.expr
+        while isinstance(expr, GroupingExpr):
+            expr = expr.expr
+        if isinstance(expr, FuncCall) and expr.tail and expr.inlined is None:
+            self._tail_call = self._prepare_call(expr)
+            self._signal = Signal.TAIL_CALL
+            return
         res = None
         if stmt.expr is not None:
             res = self.interpret(stmt.expr)
-        raise ValueError(res)
+        self._return_value = res
+        self._signal = Signal.RETURN
 
 
 def test_interpreter():
@@ -330,6 +674,44 @@ def test_interpreter():
         return fib(n - 1) + fib(n - 2);
     }
     print fib(10);
+    """,
+        # Return from inside a loop
+        """
+    def first_over(limit) {
+        for (var i = 0; i < 100; i = i + 1;) {
+            while (true or i < 100) {
+                if i * i > limit {
+                    return i;
+                }
+                i = i + 1;
+            }
+        }
+        return -1;
+    }
+    print first_over(50);
+    """,
+        # Tail calls run in constant Python stack depth
+        """
+    def sum_to(n, acc) {
+        if (n <= 0) {
+            return acc;
+        }
+        return sum_to(n - 1, acc + n);
+    }
+    def is_even(n) {
+        if (n == 0) {
+            return true or 1 > 0;
+        }
+        return is_odd(n - 1);
+    }
+    def is_odd(n) {
+        if (n == 0) {
+            return 1 < 0;
+        }
+        return is_even(n - 1);
+    }
+    print sum_to(20000, 0);
+    print is_even(10001);
     """,
         # Passing functions as arguments
         """
@@ -344,6 +726,16 @@ def test_interpreter():
         print fn2(a, b);
     }
     mix(add, minus, 1, 2);
+    """,
+        # Functions share the global table
+        """
+    var counter = 0;
+    def bump() {
+        counter = counter + 1;
+    }
+    bump();
+    bump();
+    print counter;
     """,
         # Native functions
         """
@@ -397,6 +789,219 @@ def test_interpreter():
         interpreter = Interpreter()
         interpreter.interpret(expr)
 
+    # Pure functions are memoized; `@memo` forces it on an impure one.
+    source = """
+    def fib(n) {
+        if (n <= 1) {
+            return n;
+        }
+        return fib(n - 1) + fib(n - 2);
+    }
+    @memo
+    def square(x) {
+        print "computing square";
+        return x * x;
+    }
+    print fib(60);
+    print square(3) + square(3);
+    """
+    print("-" * 80)
+    print(f"Testing memoization: {source}")
+    interpreter = Interpreter()
+    interpreter.interpret(Parser(Scanner(source).scan()).parse())
+    print(f"hits={interpreter.memo_hits} misses={interpreter.memo_misses}")
+    assert interpreter.memo_misses == 61 + 1, interpreter.memo_misses
+    assert interpreter.memo_hits == 58 + 1, interpreter.memo_hits
+
+    interpreter = Interpreter(memoize=False)
+    interpreter.interpret(Parser(Scanner(sources[5]).scan()).parse())
+    assert interpreter.memo_hits == interpreter.memo_misses == 0
+
+    # Streaming runs each top-level statement as soon as it is parsed.
+    import contextlib
+    import io
+
+    from parser import StreamingParser
+
+    for source in sources[:6] + sources[8:10]:
+        outputs = []
+        for stream in (False, True):
+            buf = io.StringIO()
+            with contextlib.redirect_stdout(buf):
+                if stream:
+                    tokens = Scanner(io.StringIO(source), chunk_size=16).tokens()
+                    Interpreter().interpret_stream(StreamingParser(tokens).statements())
+                else:
+                    Interpreter().interpret(Parser(Scanner(source).scan()).parse())
+            outputs.append(buf.getvalue())
+        assert outputs[0] == outputs[1], f"Streaming output differs:\n{outputs}"
+
+    # Call sites cache their callee; rebinding a global function name
+    # invalidates the cache and parameters may see several callees.
+    source = """
+    def add(a, b) {
+        return a + b;
+    }
+    def minus(a, b) {
+        return a - b;
+    }
+    def mix(fn1, a, b) {
+        return fn1(a, b);
+    }
+    var op = add;
+    for (var i = 0; i < 10; i = i + 1;) {
+        mix(add, i, 1);
+        mix(minus, i, 1);
+    }
+    print op(1, 2);
+    op = minus;
+    print op(1, 2);
+    """
+    print("-" * 80)
+    print(f"Testing inline caches: {source}")
+    interpreter = Interpreter(memoize=False)
+    interpreter.interpret(Parser(Scanner(source).scan()).parse())
+    print(f"ic_hits={interpreter.ic_hits} ic_misses={interpreter.ic_misses}")
+    # Two `mix` sites, `fn1` with two callees, `op` before and after `op = minus`.
+    assert interpreter.ic_misses == 2 + 2 + 2, interpreter.ic_misses
+    assert interpreter.ic_hits == 18 + 18, interpreter.ic_hits
+
+    # `+` sites specialize on their operand types and deoptimize when a
+    # later call brings different ones.
+    source = """
+    def add(a, b) {
+        return a + b;
+    }
+    var total = 0;
+    for (var i = 0; i < 5; i = i + 1;) {
+        total = add(total, -i);
+    }
+    print total;
+    print add("tiny", "-interpreter");
+    print -total;
+    """
+    print("-" * 80)
+    print(f"Testing quickening: {source}")
+    interpreter = Interpreter()
+    interpreter.interpret(Parser(Scanner(source).scan()).parse())
+    print(f"quickened={interpreter.quickened} deoptimized={interpreter.deoptimized}")
+    # `a + b`, `i < 5`, `i + 1` and `-i`; only `a + b` sees strings.
+    assert interpreter.quickened == 4, interpreter.quickened
+    assert interpreter.deoptimized == 1, interpreter.deoptimized
+
+    # Calls to small leaf functions are inlined with their parameters renamed,
+    # so caller variables with the same names are untouched; rebinding the
+    # name sends its sites back to calling.
+    source = """
+    var scale = 10;
+    def add(a, b) {
+        return a + b * scale;
+    }
+    def minus(a, b) {
+        return a - b;
+    }
+    var op = add;
+    def run(a, b) {
+        var total = 0;
+        for (var i = 0; i < 3; i = i + 1;) {
+            total = total + add(b, a) + op(i, 1);
+        }
+        return total;
+    }
+    print run(1, 2);
+    op = minus;
+    print run(1, 2);
+    """
+    print("-" * 80)
+    print(f"Testing inlining: {source}")
+    outputs = []
+    for inline in (False, True):
+        interpreter = Interpreter(inline=inline)
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            interpreter.interpret(Parser(Scanner(source).scan()).parse())
+        outputs.append(buf.getvalue())
+    print(outputs[1], end="")
+    print(f"inlined={interpreter.inlined} uninlined={interpreter.uninlined}")
+    assert outputs[0] == outputs[1], f"Inlined output differs:\n{outputs}"
+    # `add(b, a)` and `op(i, 1)`, then `op(i, 1)` again: `op = minus` moves
+    # the globals version, but `add` is still bound to the inlined function.
+    assert interpreter.inlined == 3, interpreter.inlined
+    assert interpreter.uninlined == 1, interpreter.uninlined
+
+    # Rebinding an unrelated function global in a loop keeps `add` inlined.
+    source = """
+    def add(a, b) {
+        return a + b;
+    }
+    def one() {
+        return 1;
+    }
+    var cb = one;
+    var total = 0;
+    for (var i = 0; i < 4; i = i + 1;) {
+        cb = add;
+        total = add(total, i);
+        cb = one;
+    }
+    print total;
+    """
+    interpreter = Interpreter()
+    interpreter.interpret(Parser(Scanner(source).scan()).parse())
+    assert interpreter.inlined == 1, interpreter.inlined
+    assert interpreter.uninlined == 0, interpreter.uninlined
+
+    # Counted loops run over a `range` and leave the loop variable where the
+    # generic loop would; other shapes and values fall back to it.
+    source = """
+    def count(n) {
+        var total = 0;
+        for (var i = 1; i <= n; i = i + 1;) {
+            var sq = i * i;
+            total = total + sq;
+        }
+        print i;
+        for (var j = n; j > 0.5; j = j - 3;) {
+            total = total - j;
+        }
+        print j;
+        for (var k = 0; k < n; k = k + 1;) {
+            if (k == 2) {
+                return total + k;
+            }
+        }
+        return total;
+    }
+    print count(5);
+    print count(2.5);
+    for (var g = 0; g < 3; g = g + 2;) {
+        print g;
+    }
+    print g;
+    for (var s = "a"; s < "c"; s = s + 1;) {
+        print s;
+    }
+    """
+    print("-" * 80)
+    print(f"Testing counted loops: {source}")
+    outputs = []
+    for counted_loops in (False, True):
+        interpreter = Interpreter(counted_loops=counted_loops)
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            try:
+                interpreter.interpret(Parser(Scanner(source).scan()).parse())
+            except AssertionError as exc:
+                print(f"error: {exc}")
+        outputs.append(buf.getvalue())
+    print(outputs[1], end="")
+    print(f"counted_loops={interpreter.counted_loops}")
+    assert outputs[0] == outputs[1], f"Counted-loop output differs:\n{outputs}"
+    assert "error: " in outputs[1], outputs[1]
+    # All three loops of `count(5)` (`k` returns early), all but the one
+    # starting `j` at 2.5 in `count(2.5)`, and `g`; the string loop falls back.
+    assert interpreter.counted_loops == 3 + 2 + 1, interpreter.counted_loops
+
 
 if __name__ == "__main__":
     test_interpreter()
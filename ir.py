@@ -0,0 +1,727 @@
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Iterator
+
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    UnaryExpr,
+    WhileStmt,
+)
+from tok import TokenType
+
+
+class Op(IntEnum):
+    CONST = 0  # dest = attr
+    COPY = 1  # dest = args[0]
+    PARAM = 2  # dest = argument number attr
+    UNARY = 3  # dest = attr args[0]
+    BINARY = 4  # dest = args[0] attr args[1]
+    PHI = 5  # dest = args[i] when entered from preds[i]
+    LOAD_GLOBAL = 6  # dest = globals[attr]
+    STORE_GLOBAL = 7  # globals[attr] = args[0], which must exist
+    DEFINE_GLOBAL = 8  # globals[attr] = args[0], which must not exist
+    FUNC = 9  # dest = function object for the IRFunction attr
+    CALL = 10  # dest = args[0](*args[1:]); attr is the callee's name
+    PRINT = 11
+    CHECK = 12  # re-raises the error of a speculated args[0] (see ir_passes)
+    JUMP = 13  # to succs[0]
+    BRANCH = 14  # to succs[0] if args[0] is truthy, else succs[1]
+    RETURN = 15  # returns args[0]
+
+
+TERMINATORS = frozenset((Op.JUMP, Op.BRANCH, Op.RETURN))
+
+# Operations whose result depends only on their operands.
+PURE_OPS = frozenset((Op.CONST, Op.COPY, Op.UNARY, Op.BINARY, Op.PHI))
+
+# Value of variables read on a path that never assigned them.
+UNDEF = "%undef"
+
+
+@dataclass(slots=True, eq=False)
+class Instr:
+    op: Op
+    dest: str | None = None
+    args: list[str] = field(default_factory=list)
+    attr: Any = None
+    lineno: int = 0
+    # Hoisted out of its loop by LICM: errors are kept for its CHECK.
+    speculative: bool = False
+
+    def __str__(self) -> str:
+        text = self.op.name.lower()
+        if self.dest is not None:
+            text = f"{self.dest} = {text}"
+        if self.attr is not None or self.op == Op.CONST:
+            attr = self.attr
+            if isinstance(attr, TokenType):
+                attr = attr.value
+            elif isinstance(attr, IRFunction):
+                attr = f"<fn {attr.name}>"
+            else:
+                attr = repr(attr)
+            text += f" {attr}"
+        if self.args:
+            text += " " + ", ".join(self.args)
+        if self.speculative:
+            text += " (speculative)"
+        return text
+
+
+@dataclass(eq=False)
+class BasicBlock:
+    """
+    Straight-line code: `phis` run in parallel on entry, then `instrs`, the
+    last of which is a terminator. Phi arguments line up with `preds`; a
+    BRANCH goes to `succs[0]` or `succs[1]`.
+    """
+
+    label: str
+    phis: list[Instr] = field(default_factory=list)
+    instrs: list[Instr] = field(default_factory=list)
+    preds: list["BasicBlock"] = field(default_factory=list, repr=False)
+    succs: list["BasicBlock"] = field(default_factory=list, repr=False)
+
+    @property
+    def terminator(self) -> Instr | None:
+        if self.instrs and self.instrs[-1].op in TERMINATORS:
+            return self.instrs[-1]
+        return None
+
+
+@dataclass(eq=False)
+class IRFunction:
+    name: str
+    params: list[str]
+    blocks: list[BasicBlock] = field(default_factory=list)
+
+    @property
+    def entry(self) -> BasicBlock:
+        return self.blocks[0]
+
+    def instructions(self) -> Iterator[tuple[BasicBlock, Instr]]:
+        for block in self.blocks:
+            for instr in block.phis:
+                yield block, instr
+            for instr in block.instrs:
+                yield block, instr
+
+    def functions(self) -> Iterator["IRFunction"]:
+        """This function and every function nested in it."""
+        yield self
+        for _, instr in self.instructions():
+            if instr.op == Op.FUNC:
+                yield from instr.attr.functions()
+
+
+def _link(block: BasicBlock, succ: BasicBlock):
+    block.succs.append(succ)
+    succ.preds.append(block)
+
+
+class Lowering(Visitor):
+    """
+    Lowers a Program into a control-flow graph of basic blocks, one
+    `IRFunction` per `def` plus `<script>` for the top level.
+
+    Top-level declarations stay globals, accessed by name through
+    LOAD/STORE/DEFINE_GLOBAL like in `Compiler`. Every other declaration
+    becomes a variable with a unique name, assigned with COPY; `and`/`or`
+    results are variables too. `to_ssa()` then renames variables into SSA
+    values. Expressions return the name of the value holding their result.
+    """
+
+    def __init__(self):
+        self._function: IRFunction | None = None
+        self._block: BasicBlock | None = None
+        self._scopes: list[dict[str, str]] = []
+        self._counter = 0
+        self._lineno = 0
+
+    def lower(self, expr: Expr) -> IRFunction:
+        script = self._lower_function("<script>", [], [], expr)
+        for function in script.functions():
+            to_ssa(function)
+        return script
+
+    def _lower_function(
+        self, name: str, params: list[str], scopes: list[dict], body: Expr
+    ) -> IRFunction:
+        enclosing = self._function, self._block, self._scopes
+        self._function = IRFunction(name=name, params=params)
+        self._scopes = scopes
+        self._block = self._new_block("entry")
+        for idx, param in enumerate(params):
+            self._emit(Op.PARAM, self._declare(param), attr=idx)
+        self._statement(body)
+        if self._block.terminator is None:
+            self._emit(Op.RETURN, args=[self._const(None)])
+        function = self._function
+        _remove_unreachable(function)
+        self._function, self._block, self._scopes = enclosing
+        return function
+
+    def _fresh(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+    def _new_block(self, hint: str) -> BasicBlock:
+        block = BasicBlock(label=self._fresh(hint + "."))
+        self._function.blocks.append(block)
+        return block
+
+    def _emit(
+        self, op: Op, dest: str | None = None, args: list[str] | None = None, attr=None
+    ) -> str | None:
+        if self._block.terminator is not None:
+            # Code after a `return` is unreachable; it gets its own block.
+            self._block = self._new_block("dead")
+        instr = Instr(op, dest, args or [], attr, self._lineno)
+        self._block.instrs.append(instr)
+        return dest
+
+    def _value(self, op: Op, args: list[str] | None = None, attr=None) -> str:
+        return self._emit(op, self._fresh("%"), args, attr)
+
+    def _const(self, value: Any) -> str:
+        return self._value(Op.CONST, attr=value)
+
+    def _jump(self, target: BasicBlock):
+        self._emit(Op.JUMP)
+        _link(self._block, target)
+
+    def _branch(self, cond: str, then_block: BasicBlock, else_block: BasicBlock):
+        self._emit(Op.BRANCH, args=[cond])
+        _link(self._block, then_block)
+        _link(self._block, else_block)
+
+    def _statement(self, stmt: Expr):
+        stmt.accept(self)
+
+    ########################################################
+    # Scopes
+    ########################################################
+    def _declare(self, name: str) -> str:
+        scope = self._scopes[-1]
+        if name in scope:
+            raise ValueError(f"Variable already defined: {name}")
+        var = scope[name] = self._fresh(name + ".")
+        return var
+
+    def _resolve(self, name: str) -> str | None:
+        for scope in reversed(self._scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def _load(self, name: str) -> str:
+        var = self._resolve(name)
+        if var is not None:
+            return var
+        return self._value(Op.LOAD_GLOBAL, attr=name)
+
+    def _define(self, name: str, value: str):
+        if self._scopes:
+            self._emit(Op.COPY, self._declare(name), [value])
+        else:
+            self._emit(Op.DEFINE_GLOBAL, args=[value], attr=name)
+
+    ########################################################
+    # Expressions
+    ########################################################
+    def visit_literal_expr(self, expr: "LiteralExpr") -> str:
+        token = expr.value
+        self._lineno = token.lineno
+        if token.token_type == TokenType.IDENTIFIER:
+            return self._load(token.lexeme)
+        return self._const(token.literal)
+
+    def visit_unary_expr(self, expr: "UnaryExpr") -> str:
+        right = expr.right.accept(self)
+        self._lineno = expr.op.lineno
+        return self._value(Op.UNARY, [right], expr.op.token_type)
+
+    def visit_binary_expr(self, expr: "BinaryExpr") -> str:
+        op = expr.op.token_type
+        if op not in (TokenType.AND, TokenType.OR):
+            left = expr.left.accept(self)
+            right = expr.right.accept(self)
+            self._lineno = expr.op.lineno
+            return self._value(Op.BINARY, [left, right], op)
+        # `a and b` is b when a is truthy, otherwise False; `a or b` is a
+        # when a is truthy, otherwise b.
+        result = self._fresh(f"%{op.value}.")
+        left = expr.left.accept(self)
+        rhs_block = self._new_block(op.value + ".rhs")
+        short_block = self._new_block(op.value + ".short")
+        merge_block = self._new_block(op.value + ".end")
+        if op == TokenType.AND:
+            self._branch(left, rhs_block, short_block)
+        else:
+            self._branch(left, short_block, rhs_block)
+        self._block = short_block
+        short = self._const(False) if op == TokenType.AND else left
+        self._emit(Op.COPY, result, [short])
+        self._jump(merge_block)
+        self._block = rhs_block
+        self._emit(Op.COPY, result, [expr.right.accept(self)])
+        self._jump(merge_block)
+        self._block = merge_block
+        return result
+
+    def visit_grouping_expr(self, expr: "GroupingExpr") -> str:
+        return expr.expr.accept(self)
+
+    def visit_func_call(self, expr: "FuncCall") -> str:
+        self._lineno = expr.name.lineno
+        callee = self._load(expr.name.lexeme)
+        args = [arg.accept(self) for arg in expr.args]
+        self._lineno = expr.name.lineno
+        return self._value(Op.CALL, [callee, *args], expr.name.lexeme)
+
+    ########################################################
+    # Statements
+    ########################################################
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        self._emit(Op.PRINT, args=[stmt.expr.accept(self)])
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        self._lineno = stmt.name.lineno
+        if stmt.expr is None:
+            value = self._const(None)
+        else:
+            value = stmt.expr.accept(self)
+        self._define(stmt.name.lexeme, value)
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        value = stmt.expr.accept(self)
+        self._lineno = stmt.name.lineno
+        name = stmt.name.lexeme
+        var = self._resolve(name)
+        if var is not None:
+            self._emit(Op.COPY, var, [value])
+        else:
+            self._emit(Op.STORE_GLOBAL, args=[value], attr=name)
+
+    def visit_block(self, block: "Block"):
+        self._scopes.append({})
+        for stmt in block.exprs:
+            self._statement(stmt)
+        self._scopes.pop()
+
+    def visit_program(self, program: "Program"):
+        for stmt in program.exprs:
+            self._statement(stmt)
+
+    def visit_lazy_body(self, body: "LazyBody"):
+        self._statement(body.materialize())
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        cond = stmt.condition.accept(self)
+        then_block = self._new_block("if.then")
+        merge_block = self._new_block("if.end")
+        else_block = merge_block
+        if stmt.else_branch is not None:
+            else_block = self._new_block("if.else")
+        self._branch(cond, then_block, else_block)
+        self._block = then_block
+        self._statement(stmt.then_branch)
+        self._jump(merge_block)
+        if stmt.else_branch is not None:
+            self._block = else_block
+            self._statement(stmt.else_branch)
+            self._jump(merge_block)
+        self._block = merge_block
+
+    def _loop(self, condition: Expr, body: Expr, update: Expr | None, hint: str):
+        # Loops are entered through an empty preheader, the spot LICM hoists
+        # invariant code to.
+        preheader = self._new_block(hint + ".pre")
+        self._jump(preheader)
+        self._block = preheader
+        header = self._new_block(hint + ".cond")
+        self._jump(header)
+        self._block = header
+        cond = condition.accept(self)
+        body_block = self._new_block(hint + ".body")
+        exit_block = self._new_block(hint + ".end")
+        self._branch(cond, body_block, exit_block)
+        self._block = body_block
+        self._statement(body)
+        if update is not None:
+            self._statement(update)
+        self._jump(header)
+        self._block = exit_block
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        self._loop(stmt.condition, stmt.body, None, "while")
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        # The loop variable lives in the enclosing scope, as in the tree-walker.
+        self._statement(stmt.init)
+        self._loop(stmt.condition, stmt.body, stmt.update, "for")
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        self._lineno = stmt.name.lineno
+        params = [param.lexeme for param in stmt.params]
+        # Functions do not capture their enclosing scopes.
+        function = self._lower_function(stmt.name.lexeme, params, [{}], stmt.body)
+        self._lineno = stmt.name.lineno
+        self._define(stmt.name.lexeme, self._value(Op.FUNC, attr=function))
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if self._function.name == "<script>":
+            raise ValueError("Return outside of a function")
+        if stmt.expr is None:
+            value = self._const(None)
+        else:
+            value = stmt.expr.accept(self)
+        self._emit(Op.RETURN, args=[value])
+
+
+def _remove_unreachable(function: IRFunction):
+    reachable = set(reverse_postorder(function))
+    for block in function.blocks:
+        if block not in reachable:
+            for succ in block.succs:
+                idx = succ.preds.index(block)
+                del succ.preds[idx]
+                for phi in succ.phis:
+                    del phi.args[idx]
+    function.blocks = [block for block in function.blocks if block in reachable]
+
+
+def lower(expr: Expr) -> IRFunction:
+    """Lowers `expr` into SSA form; see `Lowering` and `to_ssa()`."""
+    return Lowering().lower(expr)
+
+
+########################################################
+# Control-flow analyses
+########################################################
+def reverse_postorder(function: IRFunction) -> list[BasicBlock]:
+    order = []
+    seen = {function.entry}
+    stack = [(function.entry, iter(function.entry.succs))]
+    while stack:
+        block, succs = stack[-1]
+        for succ in succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, iter(succ.succs)))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+
+def dominators(function: IRFunction) -> dict[BasicBlock, BasicBlock | None]:
+    """
+    Immediate dominator of every reachable block (None for the entry), with
+    the iterative algorithm of Cooper, Harvey and Kennedy.
+    """
+    order = reverse_postorder(function)
+    index = {block: idx for idx, block in enumerate(order)}
+    idom: dict[BasicBlock, BasicBlock | None] = {order[0]: order[0]}
+
+    def intersect(a: BasicBlock, b: BasicBlock) -> BasicBlock:
+        while a is not b:
+            while index[a] > index[b]:
+                a = idom[a]
+            while index[b] > index[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new_idom = None
+            for pred in block.preds:
+                if pred in idom:
+                    new_idom = pred if new_idom is None else intersect(pred, new_idom)
+            if idom.get(block) is not new_idom:
+                idom[block] = new_idom
+                changed = True
+    idom[order[0]] = None
+    return idom
+
+
+def dominator_tree(
+    idom: dict[BasicBlock, BasicBlock | None]
+) -> dict[BasicBlock, list[BasicBlock]]:
+    children = {block: [] for block in idom}
+    for block, parent in idom.items():
+        if parent is not None:
+            children[parent].append(block)
+    return children
+
+
+def dominates(
+    idom: dict[BasicBlock, BasicBlock | None], a: BasicBlock, b: BasicBlock
+) -> bool:
+    while b is not None:
+        if b is a:
+            return True
+        b = idom[b]
+    return False
+
+
+def dominance_frontiers(
+    idom: dict[BasicBlock, BasicBlock | None]
+) -> dict[BasicBlock, set[BasicBlock]]:
+    frontiers = {block: set() for block in idom}
+    for block in idom:
+        if len(block.preds) < 2:
+            continue
+        for pred in block.preds:
+            runner = pred
+            while runner is not idom[block]:
+                frontiers[runner].add(block)
+                runner = idom[runner]
+    return frontiers
+
+
+@dataclass(eq=False)
+class Loop:
+    header: BasicBlock
+    blocks: set[BasicBlock]
+    # The only block outside the loop that enters it, or None.
+    preheader: BasicBlock | None
+
+
+def natural_loops(function: IRFunction) -> list[Loop]:
+    """Loops found through back edges, innermost (smallest) first."""
+    idom = dominators(function)
+    bodies: dict[BasicBlock, set[BasicBlock]] = {}
+    for block in idom:
+        for succ in block.succs:
+            if dominates(idom, succ, block):
+                body = bodies.setdefault(succ, {succ})
+                stack = [block]
+                while stack:
+                    member = stack.pop()
+                    if member not in body:
+                        body.add(member)
+                        stack.extend(member.preds)
+    loops = []
+    for header, body in bodies.items():
+        outside = [pred for pred in header.preds if pred not in body]
+        preheader = None
+        if len(outside) == 1 and outside[0].succs == [header]:
+            preheader = outside[0]
+        loops.append(Loop(header, body, preheader))
+    loops.sort(key=lambda loop: len(loop.blocks))
+    return loops
+
+
+########################################################
+# SSA
+########################################################
+def to_ssa(function: IRFunction):
+    """
+    Renames the variables of a freshly lowered function into SSA values
+    (Cytron et al.): phis go on the iterated dominance frontier of every
+    block assigning a variable, then a walk of the dominator tree gives each
+    assignment a new name and rewrites uses to the reaching one. Variables
+    read on a path that never assigned them read UNDEF, which is nil.
+    """
+    idom = dominators(function)
+    children = dominator_tree(idom)
+    frontiers = dominance_frontiers(idom)
+
+    def_blocks: dict[str, set[BasicBlock]] = {}
+    for block, instr in function.instructions():
+        if instr.op in (Op.COPY, Op.PARAM):
+            def_blocks.setdefault(instr.dest, set()).add(block)
+    for var, blocks in def_blocks.items():
+        work = list(blocks)
+        has_phi = set()
+        while work:
+            block = work.pop()
+            for frontier in frontiers[block]:
+                if frontier not in has_phi:
+                    has_phi.add(frontier)
+                    phi = Instr(Op.PHI, var, [var] * len(frontier.preds))
+                    frontier.phis.append(phi)
+                    if frontier not in blocks:
+                        work.append(frontier)
+
+    versions = {var: 0 for var in def_blocks}
+    stacks: dict[str, list[str]] = {var: [] for var in def_blocks}
+
+    def rename_def(instr: Instr) -> str:
+        var = instr.dest
+        versions[var] += 1
+        instr.dest = f"{var}.{versions[var]}"
+        stacks[var].append(instr.dest)
+        return var
+
+    def current(var: str) -> str:
+        if var not in stacks:
+            return var
+        return stacks[var][-1] if stacks[var] else UNDEF
+
+    # Iterative walk: (block, None) renames a block, (None, vars) pops the
+    # names it pushed once its dominator subtree is done.
+    work: list[tuple[BasicBlock | None, list[str] | None]] = [(function.entry, None)]
+    while work:
+        block, pushed = work.pop()
+        if block is None:
+            for var in pushed:
+                stacks[var].pop()
+            continue
+        pushed = []
+        for phi in block.phis:
+            pushed.append(rename_def(phi))
+        for instr in block.instrs:
+            instr.args = [current(arg) for arg in instr.args]
+            if instr.op in (Op.COPY, Op.PARAM):
+                pushed.append(rename_def(instr))
+        for succ in block.succs:
+            idx = succ.preds.index(block)
+            for phi in succ.phis:
+                phi.args[idx] = current(phi.args[idx])
+        work.append((None, pushed))
+        for child in reversed(children[block]):
+            work.append((child, None))
+    function.entry.instrs.insert(0, Instr(Op.CONST, UNDEF, attr=None))
+
+
+def verify(function: IRFunction):
+    """Checks the SSA invariants: one definition per value, dominating its uses."""
+    idom = dominators(function)
+    def_site: dict[str, tuple[BasicBlock, int]] = {}
+    for block in function.blocks:
+        assert block in idom, f"{function.name}: unreachable block {block.label}"
+        for idx, instr in enumerate(block.phis + block.instrs):
+            if instr.dest is not None:
+                assert instr.dest not in def_site, f"{instr.dest} defined twice"
+                def_site[instr.dest] = (block, idx)
+        assert block.terminator is not None, f"{block.label} is not terminated"
+        for instr in block.instrs[:-1]:
+            assert instr.op not in TERMINATORS, f"{block.label}: {instr} mid-block"
+        for phi in block.phis:
+            assert len(phi.args) == len(block.preds), f"{block.label}: {phi}"
+    for block in function.blocks:
+        for idx, instr in enumerate(block.phis + block.instrs):
+            for pos, arg in enumerate(instr.args):
+                assert arg in def_site, f"{block.label}: {instr} uses undefined {arg}"
+                def_block, def_idx = def_site[arg]
+                if instr.op == Op.PHI:
+                    use_block, use_idx = block.preds[pos], None
+                else:
+                    use_block, use_idx = block, idx
+                if def_block is use_block:
+                    assert use_idx is None or def_idx < use_idx, f"{instr}: {arg}"
+                else:
+                    assert dominates(idom, def_block, use_block), f"{instr}: {arg}"
+
+
+def format_ir(function: IRFunction) -> str:
+    lines = [f"== {function.name}({', '.join(function.params)}) =="]
+    for block in function.blocks:
+        preds = ", ".join(pred.label for pred in block.preds)
+        lines.append(f"{block.label}:" + (f"  ; preds {preds}" if preds else ""))
+        for instr in block.phis + block.instrs:
+            text = str(instr)
+            if instr.op in (Op.JUMP, Op.BRANCH):
+                text += " -> " + ", ".join(succ.label for succ in block.succs)
+            lines.append(f"    {text}")
+    for function in list(function.functions())[1:]:
+        lines.append(format_ir(function))
+    return "\n".join(lines)
+
+
+def test_ir():
+    from parser import Parser
+    from scanner import Scanner
+
+    def lower_source(source: str) -> IRFunction:
+        script = lower(Parser(Scanner(source).scan()).parse())
+        for function in script.functions():
+            verify(function)
+        return script
+
+    sources = [
+        """
+        var a = 1;
+        {
+            var a = 2;
+            {
+                var a = a + 1;
+                print a;
+            }
+        }
+        print a > 0 and a < 2 or a;
+        """,
+        """
+        def count(n) {
+            var total = 0;
+            var i = 0;
+            while (i < n) {
+                var sq = i * i;
+                if (sq > 10) {
+                    total = total + sq;
+                } else {
+                    total = total - 1;
+                }
+                i = i + 1;
+            }
+            return total;
+            print "unreachable";
+        }
+        print count(5);
+        """,
+    ]
+    for source in sources:
+        print("-" * 80)
+        print(f"Testing source: {source}")
+        print(format_ir(lower_source(source)))
+
+    # Every assignment of a local is its own value, merged by phis.
+    count = list(lower_source(sources[1]).functions())[1]
+    header = count.blocks[2]
+    assert header.label.startswith("while.cond"), header.label
+    phis = sorted(phi.dest.split(".")[0] for phi in header.phis)
+    assert phis == ["i", "sq", "total"], phis
+    defs = [instr.dest for _, instr in count.instructions() if instr.dest]
+    assert len(defs) == len(set(defs)), defs
+    # Code after `return` is dropped with its block.
+    assert all(instr.op != Op.PRINT for _, instr in count.instructions())
+
+    loops = natural_loops(count)
+    assert len(loops) == 1 and loops[0].header is header
+    assert loops[0].preheader is not None and loops[0].preheader not in loops[0].blocks
+
+    # Top-level variables stay globals.
+    script = lower_source(sources[0])
+    ops = [instr.op for _, instr in script.instructions()]
+    assert ops.count(Op.DEFINE_GLOBAL) == 1 and Op.PHI in ops, ops
+
+    try:
+        lower_source("return 1;")
+    except ValueError:
+        pass
+    else:
+        assert False, "Expected a top-level return to be rejected"
+
+
+if __name__ == "__main__":
+    test_ir()
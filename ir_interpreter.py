@@ -0,0 +1,351 @@
+from dataclasses import dataclass, field
+import logging
+from typing import Any, Sequence
+
+from func import FuncBase, NativeFunc, build_native_func_sleep, build_native_func_time
+from interface import Expr
+from interpreter import binary_op, unary_op
+from ir import BasicBlock, IRFunction, Op, lower
+from ir_passes import DEFAULT_PIPELINE, PassManager, PassReport
+from utils import color_print
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IRFunc(FuncBase):
+    function: IRFunction = field(repr=False)
+
+
+@dataclass(slots=True)
+class _Poison:
+    """Value of a speculative instruction that failed; its CHECK raises `error`."""
+
+    error: Exception
+
+
+# Instructions are run as (op, dest, args, instr) tuples; speculative ones get
+# their own op so the common path never checks for poison.
+_SPECULATE = len(Op)
+
+
+@dataclass(slots=True, eq=False)
+class _Block:
+    code: list[tuple]
+    # Phis as (dest, args), run in parallel on entry.
+    phis: list[tuple[str, list[str]]]
+    # Phi argument index of each predecessor, by id().
+    pred_index: dict[int, int] = field(default_factory=dict)
+    succs: list["_Block"] = field(default_factory=list)
+
+
+class IRInterpreter:
+    """
+    Runs a script through the middle end: `ir.lower()` builds SSA IR, the
+    `PassManager` pipeline optimizes it (no passes when `passes` is empty)
+    and `run()` executes the IR directly. `report` holds the pass counts of
+    the last script.
+
+    Values live in a dict per call, keyed by SSA name; entering a block runs
+    its phis for the edge taken. Like `VM`, calls push a frame instead of
+    recursing in Python.
+    """
+
+    def __init__(self, passes: Sequence[str] = DEFAULT_PIPELINE):
+        self.passes = passes
+        self.report: PassReport | None = None
+        self._globals: dict[str, Any] = {}
+        self._prepared: dict[IRFunction, _Block] = {}
+        self._load_native_funcs()
+
+    def _load_native_funcs(self):
+        for native in (build_native_func_time(), build_native_func_sleep()):
+            self._globals[native.name] = native
+
+    def interpret(self, expr: Expr) -> Any:
+        script = lower(expr)
+        self.report = PassManager(self.passes).run(script)
+        logger.debug(f"IR passes: {self.report}")
+        return self.run(script)
+
+    def _prepare(self, function: IRFunction) -> _Block:
+        entry = self._prepared.get(function)
+        if entry is not None:
+            return entry
+        blocks: dict[BasicBlock, _Block] = {}
+        for block in function.blocks:
+            code = []
+            for instr in block.instrs:
+                op = _SPECULATE if instr.speculative else instr.op.value
+                code.append((op, instr.dest, instr.args, instr))
+            blocks[block] = _Block(
+                code=code,
+                phis=[(phi.dest, phi.args) for phi in block.phis],
+            )
+        for block, prepared in blocks.items():
+            prepared.succs = [blocks[succ] for succ in block.succs]
+            for idx, pred in enumerate(block.preds):
+                prepared.pred_index[id(blocks[pred])] = idx
+        # Keyed by the prepared block, so the graph must not change afterwards.
+        self._prepared[function] = entry = blocks[function.entry]
+        return entry
+
+    def _check_callee(self, name: str, callee: Any, args: list[Any]):
+        assert isinstance(callee, FuncBase), f"FuncCall: {name} is not a function"
+        assert len(args) == len(
+            callee.params
+        ), f"FuncCall: {name} has {len(args)} arguments, but {len(callee.params)} parameters"
+
+    def run(self, script: IRFunction) -> Any:
+        CONST = Op.CONST.value
+        COPY = Op.COPY.value
+        PARAM = Op.PARAM.value
+        UNARY = Op.UNARY.value
+        BINARY = Op.BINARY.value
+        LOAD_GLOBAL = Op.LOAD_GLOBAL.value
+        STORE_GLOBAL = Op.STORE_GLOBAL.value
+        DEFINE_GLOBAL = Op.DEFINE_GLOBAL.value
+        FUNC = Op.FUNC.value
+        CALL = Op.CALL.value
+        PRINT = Op.PRINT.value
+        CHECK = Op.CHECK.value
+        JUMP = Op.JUMP.value
+        BRANCH = Op.BRANCH.value
+        RETURN = Op.RETURN.value
+
+        globals_ = self._globals
+        frames: list[tuple] = []
+        values: dict[str, Any] = {}
+        call_args: list[Any] = []
+        block = self._prepare(script)
+        code = block.code
+        ip = 0
+        while True:
+            op, dest, args, instr = code[ip]
+            ip += 1
+            if op == BINARY:
+                values[dest] = binary_op(instr.attr, values[args[0]], values[args[1]])
+            elif op == CONST:
+                values[dest] = instr.attr
+            elif op == JUMP or op == BRANCH:
+                prev = id(block)
+                if op == JUMP or values[args[0]]:
+                    block = block.succs[0]
+                else:
+                    block = block.succs[1]
+                code = block.code
+                ip = 0
+                if block.phis:
+                    idx = block.pred_index[prev]
+                    incoming = [values[phi_args[idx]] for _, phi_args in block.phis]
+                    for (phi_dest, _), value in zip(block.phis, incoming):
+                        values[phi_dest] = value
+            elif op == LOAD_GLOBAL:
+                name = instr.attr
+                if name not in globals_:
+                    raise ValueError(f"Undefined variable: {name}")
+                values[dest] = globals_[name]
+            elif op == STORE_GLOBAL:
+                name = instr.attr
+                if name not in globals_:
+                    raise ValueError(f"Undefined variable: {name}")
+                globals_[name] = values[args[0]]
+            elif op == UNARY:
+                values[dest] = unary_op(instr.attr, values[args[0]])
+            elif op == CALL:
+                callee = values[args[0]]
+                arg_values = [values[arg] for arg in args[1:]]
+                self._check_callee(instr.attr, callee, arg_values)
+                if isinstance(callee, NativeFunc):
+                    kwargs = dict(zip(callee.params, arg_values))
+                    values[dest] = callee.func(self, **kwargs)
+                    continue
+                frames.append((block, code, ip, values, call_args, dest))
+                block = self._prepare(callee.function)
+                code = block.code
+                ip = 0
+                values = {}
+                call_args = arg_values
+            elif op == PARAM:
+                values[dest] = call_args[instr.attr]
+            elif op == RETURN:
+                value = values[args[0]]
+                if not frames:
+                    return value
+                block, code, ip, values, call_args, dest = frames.pop()
+                values[dest] = value
+            elif op == PRINT:
+                print(color_print(f"[interpreter] {values[args[0]]}", "yellow"))
+            elif op == CHECK:
+                value = values[args[0]]
+                if value.__class__ is _Poison:
+                    raise value.error
+            elif op == COPY:
+                values[dest] = values[args[0]]
+            elif op == DEFINE_GLOBAL:
+                name = instr.attr
+                assert name not in globals_, f"Variable already defined: {name}"
+                globals_[name] = values[args[0]]
+            elif op == FUNC:
+                function = instr.attr
+                values[dest] = IRFunc(function.name, function.params, function)
+            elif op == _SPECULATE:
+                values[dest] = self._speculate(instr, values)
+            else:
+                assert False, f"Unknown IR op: {op}"
+
+    def _speculate(self, instr, values: dict[str, Any]) -> Any:
+        operands = [values[arg] for arg in instr.args]
+        for operand in operands:
+            if operand.__class__ is _Poison:
+                return operand
+        try:
+            if instr.op == Op.LOAD_GLOBAL:
+                if instr.attr not in self._globals:
+                    raise ValueError(f"Undefined variable: {instr.attr}")
+                return self._globals[instr.attr]
+            if instr.op == Op.UNARY:
+                return unary_op(instr.attr, *operands)
+            return binary_op(instr.attr, *operands)
+        except Exception as exc:
+            return _Poison(exc)
+
+
+def test_ir_interpreter():
+    import contextlib
+    import io
+
+    from interpreter import Interpreter
+    from parser import Parser
+    from scanner import Scanner
+
+    sources = [
+        """
+        var a = 1;
+        var b = 2;
+        print a + b;
+        {
+            var c = 8;
+            var a = 4;
+            print a + b + c;
+        }
+        print (a + 2) * 3 / 4 - 1;
+        print "con" + "cat";
+        print a > b or a < b;
+        print a > b and a < b;
+        print a and b;
+        print nil or "fallback";
+        print a != b;
+        """,
+        """
+        var itr = 0;
+        var total = 0;
+        while (itr < 5) {
+            var sq = itr * itr;
+            if sq > 4 {
+                total = total + sq;
+            } else {
+                print -sq;
+            }
+            itr = itr + 1;
+        }
+        print total;
+        for (var i = 0; i < 3; i = i + 1;) {
+            var limit = itr * 2;
+            for (var j = 0; j < limit; j = j + 1;) {
+                total = total + i * limit;
+            }
+        }
+        print total;
+        """,
+        """
+        var g = 10;
+        def fib(n) {
+            if (n <= 1) {
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+        def touch() {
+            g = g + 1;
+            return g;
+        }
+        def poly(x, n) {
+            var acc = 0;
+            var i = 0;
+            while (i < n) {
+                acc = acc + x * x + g;
+                if (touch() > 12) {
+                    acc = acc - 1;
+                }
+                i = i + 1;
+            }
+            return acc;
+        }
+        def mix(fn1, a, b) {
+            def twice(x) {
+                return x * 2;
+            }
+            print twice(fn1(a, b));
+        }
+        def sum_to(n, acc) {
+            if (n <= 0) {
+                return acc;
+            }
+            return sum_to(n - 1, acc + n);
+        }
+        print fib(12);
+        print poly(3, 4);
+        print g;
+        mix(sum_to, 3, 0);
+        print sum_to(3000, 0);
+        """,
+    ]
+    engines = [
+        Interpreter,
+        lambda: IRInterpreter(passes=()),
+        lambda: IRInterpreter(passes=("copyprop",)),
+        IRInterpreter,
+    ]
+    for source in sources:
+        print("-" * 80)
+        print(f"Testing source: {source}")
+        outputs = []
+        for engine in engines:
+            program = Parser(Scanner(source).scan()).parse()
+            buf = io.StringIO()
+            with contextlib.redirect_stdout(buf):
+                engine().interpret(program)
+            outputs.append(buf.getvalue())
+        print(outputs[-1], end="")
+        for output in outputs[1:]:
+            assert output == outputs[0], f"IR output differs:\n{outputs}"
+
+    # Calls push frames instead of recursing in Python.
+    source = """
+    def down(n) {
+        if (n == 0) {
+            return 0;
+        }
+        return 1 + down(n - 1);
+    }
+    print down(20000);
+    """
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        IRInterpreter().interpret(Parser(Scanner(source).scan()).parse())
+    assert "20000.0" in buf.getvalue(), buf.getvalue()
+
+    # Runtime errors match the tree-walker's.
+    for source in ["print undefined_name;", "print 1 + nil;", "var f = 1; f();"]:
+        errors = []
+        for engine in (Interpreter, IRInterpreter):
+            try:
+                engine().interpret(Parser(Scanner(source).scan()).parse())
+            except (AssertionError, ValueError) as exc:
+                errors.append((type(exc), str(exc)))
+        assert len(errors) == 2 and errors[0] == errors[1], errors
+
+
+if __name__ == "__main__":
+    test_ir_interpreter()
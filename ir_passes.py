@@ -0,0 +1,563 @@
+from dataclasses import dataclass, field
+import logging
+from typing import Any, Callable, Sequence
+
+from ir import (
+    UNDEF,
+    BasicBlock,
+    Instr,
+    IRFunction,
+    Op,
+    dominator_tree,
+    dominators,
+    natural_loops,
+    reverse_postorder,
+    verify,
+)
+from tok import TokenType
+
+logger = logging.getLogger(__name__)
+
+_ARITHMETIC_OPS = (TokenType.MINUS, TokenType.STAR, TokenType.SLASH)
+_ORDER_OPS = (
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+)
+_COMMUTATIVE_OPS = (TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL)
+
+# Types that order against each other without raising.
+_ORDERED_TYPES = {float: "number", bool: "number", str: "string"}
+
+
+########################################################
+# Analyses
+########################################################
+def infer_types(function: IRFunction) -> dict[str, type | None]:
+    """
+    Python type of every value, None where it is unknown. Most operators
+    raise unless they produce a fixed type, so only `+`, phis and copies
+    depend on their operands; phis start optimistic and the types are
+    iterated to a fixed point.
+    """
+    types: dict[str, type | None] = {}
+    order = reverse_postorder(function)
+    changed = True
+    while changed:
+        changed = False
+        for block in order:
+            for instr in block.phis + block.instrs:
+                if instr.dest is None:
+                    continue
+                new = _result_type(instr, types)
+                if new is _UNSEEN:
+                    continue
+                old = types.get(instr.dest, _UNSEEN)
+                if old is not _UNSEEN and old is not new:
+                    new = None
+                if old is not new:
+                    types[instr.dest] = new
+                    changed = True
+    return types
+
+
+# Type of a value whose definition has not been seen yet.
+_UNSEEN = object()
+
+
+def _result_type(instr: Instr, types: dict[str, type | None]) -> Any:
+    op = instr.op
+    if op == Op.CONST:
+        return type(instr.attr)
+    if op == Op.COPY:
+        return types.get(instr.args[0], _UNSEEN)
+    if op == Op.PHI:
+        seen = {types[arg] for arg in instr.args if arg in types}
+        if not seen:
+            return _UNSEEN
+        return seen.pop() if len(seen) == 1 else None
+    if op == Op.UNARY:
+        return float if instr.attr == TokenType.MINUS else bool
+    if op == Op.BINARY:
+        if instr.attr in _ARITHMETIC_OPS:
+            return float
+        if instr.attr != TokenType.PLUS:
+            return bool
+        left, right = (types.get(arg, _UNSEEN) for arg in instr.args)
+        if left is _UNSEEN or right is _UNSEEN:
+            return _UNSEEN
+        return left if left is right and left in (float, str) else None
+    return None
+
+
+def can_raise(instr: Instr, types: dict[str, type | None]) -> bool:
+    """Whether `instr` may fail at runtime, given the `infer_types()` result."""
+    op = instr.op
+    if op in (Op.CONST, Op.COPY, Op.PHI, Op.PARAM, Op.FUNC, Op.PRINT):
+        return False
+    if op in (Op.JUMP, Op.BRANCH, Op.RETURN):
+        return False
+    if op == Op.UNARY:
+        expected = float if instr.attr == TokenType.MINUS else bool
+        return types.get(instr.args[0]) is not expected
+    if op != Op.BINARY:
+        return True
+    left, right = (types.get(arg) for arg in instr.args)
+    if instr.attr in _COMMUTATIVE_OPS:
+        return False
+    if instr.attr == TokenType.PLUS:
+        return not (left is right and left in (float, str))
+    if instr.attr in _ORDER_OPS:
+        kind = _ORDERED_TYPES.get(left)
+        return kind is None or kind != _ORDERED_TYPES.get(right)
+    if left is not float or right is not float:
+        return True
+    # Division by zero raises too.
+    return instr.attr == TokenType.SLASH
+
+
+def _definitions(function: IRFunction) -> dict[str, Instr]:
+    return {
+        instr.dest: instr
+        for _, instr in function.instructions()
+        if instr.dest is not None
+    }
+
+
+def _known_globals(
+    idom: dict[BasicBlock, BasicBlock | None], block: BasicBlock
+) -> set[str]:
+    """Globals that exist at the end of `block`: one of its dominators used them."""
+    names = set()
+    while block is not None:
+        for instr in block.instrs:
+            if instr.speculative:
+                continue
+            if instr.op in (Op.LOAD_GLOBAL, Op.STORE_GLOBAL, Op.DEFINE_GLOBAL):
+                names.add(instr.attr)
+        block = idom[block]
+    return names
+
+
+def _rewrite_uses(function: IRFunction, replace: dict[str, str]):
+    """Renames every use of a key of `replace`, following chains."""
+
+    def resolve(name: str) -> str:
+        while name in replace:
+            name = replace[name]
+        return name
+
+    for _, instr in function.instructions():
+        instr.args = [resolve(arg) for arg in instr.args]
+
+
+########################################################
+# Passes
+########################################################
+def copy_propagation(function: IRFunction) -> int:
+    """
+    Replaces the uses of each COPY with its source and removes it, along with
+    phis whose arguments are all the same value (or the phi itself).
+    """
+    replace: dict[str, str] = {}
+
+    def resolve(name: str) -> str:
+        while name in replace:
+            name = replace[name]
+        return name
+
+    removed = 0
+    changed = True
+    while changed:
+        changed = False
+        for block in function.blocks:
+            for phi in list(block.phis):
+                sources = {resolve(arg) for arg in phi.args} - {phi.dest}
+                if len(sources) <= 1:
+                    replace[phi.dest] = sources.pop() if sources else UNDEF
+                    block.phis.remove(phi)
+                    removed += 1
+                    changed = True
+            for instr in list(block.instrs):
+                if instr.op == Op.COPY:
+                    replace[instr.dest] = resolve(instr.args[0])
+                    block.instrs.remove(instr)
+                    removed += 1
+                    changed = True
+    _rewrite_uses(function, replace)
+    return removed
+
+
+def _value_key(instr: Instr) -> tuple | None:
+    if instr.speculative:
+        # Its value may be a deferred error that only its CHECK guards.
+        return None
+    if instr.op == Op.CONST:
+        # repr() keeps 0.0 / -0.0 and 1.0 / True apart.
+        return (Op.CONST, type(instr.attr), repr(instr.attr))
+    if instr.op == Op.UNARY:
+        return (Op.UNARY, instr.attr, instr.args[0])
+    if instr.op == Op.BINARY:
+        args = instr.args
+        if instr.attr in _COMMUTATIVE_OPS:
+            args = sorted(args)
+        return (Op.BINARY, instr.attr, *args)
+    return None
+
+
+def global_value_numbering(function: IRFunction) -> int:
+    """
+    Removes computations of a value already computed in a dominating block:
+    constants, operators over the same operands and phis of one block with
+    the same arguments. A failing operator would have failed at the first
+    computation, so the later ones cannot. Within a block, global loads are
+    numbered too, and forwarded from the last store, until a call.
+    """
+    idom = dominators(function)
+    children = dominator_tree(idom)
+    replace: dict[str, str] = {}
+
+    def resolve(name: str) -> str:
+        while name in replace:
+            name = replace[name]
+        return name
+
+    removed = 0
+    table: dict[tuple, str] = {}
+    # Scoped table: (block, None) numbers a block, (None, keys) forgets the
+    # keys it added once its dominator subtree is done.
+    work: list[tuple[BasicBlock | None, list | None]] = [(function.entry, None)]
+    while work:
+        block, added = work.pop()
+        if block is None:
+            for key in added:
+                del table[key]
+            continue
+        added = []
+        for phi in list(block.phis):
+            key = (Op.PHI, block, *(resolve(arg) for arg in phi.args))
+            if key in table:
+                replace[phi.dest] = table[key]
+                block.phis.remove(phi)
+                removed += 1
+            else:
+                table[key] = phi.dest
+                added.append(key)
+        globals_seen: dict[str, str] = {}
+        kept = []
+        for instr in block.instrs:
+            instr.args = [resolve(arg) for arg in instr.args]
+            if instr.op == Op.LOAD_GLOBAL:
+                if instr.attr in globals_seen:
+                    replace[instr.dest] = globals_seen[instr.attr]
+                    removed += 1
+                    continue
+                globals_seen[instr.attr] = instr.dest
+            elif instr.op in (Op.STORE_GLOBAL, Op.DEFINE_GLOBAL):
+                globals_seen[instr.attr] = instr.args[0]
+            elif instr.op == Op.CALL:
+                globals_seen.clear()
+            key = _value_key(instr)
+            if key is not None:
+                if key in table:
+                    replace[instr.dest] = table[key]
+                    removed += 1
+                    continue
+                table[key] = instr.dest
+                added.append(key)
+            kept.append(instr)
+        block.instrs = kept
+        work.append((None, added))
+        for child in reversed(children[block]):
+            work.append((child, None))
+    _rewrite_uses(function, replace)
+    return removed
+
+
+def dead_store_elimination(function: IRFunction) -> int:
+    """
+    Removes global stores overwritten later in the same block before anything
+    could read them, then every definition that is never used and cannot fail.
+    Locals are SSA values, so a dead local store is an unused definition.
+    """
+    types = infer_types(function)
+    removed = 0
+    for block in function.blocks:
+        dead = set()
+        pending: dict[str, Instr] = {}
+        for instr in block.instrs:
+            if instr.op == Op.STORE_GLOBAL:
+                if instr.attr in pending:
+                    dead.add(pending[instr.attr])
+                pending[instr.attr] = instr
+            elif instr.op in (Op.LOAD_GLOBAL, Op.DEFINE_GLOBAL):
+                pending.pop(instr.attr, None)
+            elif can_raise(instr, types):
+                # Calls may read any global, and the store must have happened
+                # if the script stops here.
+                pending.clear()
+        if dead:
+            block.instrs = [instr for instr in block.instrs if instr not in dead]
+            removed += len(dead)
+
+    uses: dict[str, int] = {}
+    for _, instr in function.instructions():
+        for arg in instr.args:
+            uses[arg] = uses.get(arg, 0) + 1
+    definitions = _definitions(function)
+    removable = (Op.CONST, Op.COPY, Op.PHI, Op.FUNC, Op.UNARY, Op.BINARY)
+    work = [name for name in definitions if not uses.get(name)]
+    dead = set()
+    while work:
+        name = work.pop()
+        instr = definitions[name]
+        if name == UNDEF or instr in dead or instr.op not in removable:
+            continue
+        if can_raise(instr, types):
+            continue
+        dead.add(instr)
+        for arg in instr.args:
+            uses[arg] -= 1
+            if not uses[arg]:
+                work.append(arg)
+    for block in function.blocks:
+        block.phis = [phi for phi in block.phis if phi not in dead]
+        block.instrs = [instr for instr in block.instrs if instr not in dead]
+    return removed + len(dead)
+
+
+def loop_invariant_code_motion(function: IRFunction) -> int:
+    """
+    Hoists computations whose operands are all defined outside a loop into
+    its preheader: constants, operators and loads of globals the loop neither
+    stores nor could change through a call. Innermost loops go first, so
+    code can move out of several loops.
+
+    The preheader runs even when the loop body would not have reached the
+    computation, so one that may fail is hoisted as `speculative`: an error
+    becomes its value, and a CHECK left in its place raises it there. Loads
+    of globals a dominating block already used cannot fail. Errors pass on
+    through hoisted computations using a speculative value, which are
+    speculative too; the CHECK of that value guards them.
+    """
+    types = infer_types(function)
+    idom = dominators(function)
+    speculative = {
+        instr.dest for _, instr in function.instructions() if instr.speculative
+    }
+    order = {block: idx for idx, block in enumerate(reverse_postorder(function))}
+    hoisted = 0
+    for loop in natural_loops(function):
+        if loop.preheader is None:
+            continue
+        blocks = sorted(loop.blocks, key=order.__getitem__)
+        defined = set()
+        stored = set()
+        calls = False
+        for block in blocks:
+            for instr in block.phis + block.instrs:
+                if instr.dest is not None:
+                    defined.add(instr.dest)
+                if instr.op in (Op.STORE_GLOBAL, Op.DEFINE_GLOBAL):
+                    stored.add(instr.attr)
+                calls = calls or instr.op == Op.CALL
+
+        def invariant(instr: Instr) -> bool:
+            if instr.op == Op.LOAD_GLOBAL:
+                return not calls and instr.attr not in stored
+            if instr.op not in (Op.CONST, Op.UNARY, Op.BINARY):
+                return False
+            return not any(arg in defined for arg in instr.args)
+
+        target = loop.preheader.instrs
+        known_globals = _known_globals(idom, loop.preheader)
+        changed = True
+        while changed:
+            changed = False
+            for block in blocks:
+                kept = []
+                for instr in block.instrs:
+                    if not invariant(instr):
+                        kept.append(instr)
+                        continue
+                    if instr.op == Op.LOAD_GLOBAL and instr.attr in known_globals:
+                        pass
+                    elif not instr.speculative and can_raise(instr, types):
+                        instr.speculative = True
+                        kept.append(Instr(Op.CHECK, args=[instr.dest]))
+                    elif any(arg in speculative for arg in instr.args):
+                        instr.speculative = True
+                    if instr.speculative:
+                        speculative.add(instr.dest)
+                    target.insert(len(target) - 1, instr)
+                    defined.discard(instr.dest)
+                    hoisted += 1
+                    changed = True
+                block.instrs = kept
+    return hoisted
+
+
+PASSES: dict[str, Callable[[IRFunction], int]] = {
+    "copyprop": copy_propagation,
+    "gvn": global_value_numbering,
+    "licm": loop_invariant_code_motion,
+    "dse": dead_store_elimination,
+}
+
+# GVN runs again to merge what LICM brought together in preheaders.
+DEFAULT_PIPELINE = ("copyprop", "gvn", "licm", "gvn", "dse")
+
+
+@dataclass
+class PassReport:
+    # Instructions each pass removed or hoisted, by pass name.
+    counts: dict[str, int] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return " ".join(f"{name}={count}" for name, count in self.counts.items())
+
+
+class PassManager:
+    """
+    Runs a pipeline of `PASSES` over an SSA function and every function
+    nested in it. With `verify_each`, the SSA invariants are checked after
+    every pass.
+    """
+
+    def __init__(
+        self, passes: Sequence[str] = DEFAULT_PIPELINE, verify_each: bool = False
+    ):
+        for name in passes:
+            assert name in PASSES, f"Unknown pass: {name}"
+        self.passes = list(passes)
+        self.verify_each = verify_each
+
+    def run(self, script: IRFunction) -> PassReport:
+        report = PassReport({name: 0 for name in self.passes})
+        for function in list(script.functions()):
+            for name in self.passes:
+                count = PASSES[name](function)
+                report.counts[name] += count
+                if count:
+                    logger.debug(f"{name}: {count} in {function.name}")
+                if self.verify_each:
+                    verify(function)
+        return report
+
+
+def test_ir_passes():
+    import contextlib
+    import io
+
+    from ir import format_ir, lower
+    from ir_interpreter import IRInterpreter
+    from parser import Parser
+    from scanner import Scanner
+
+    def optimized(source: str, passes: Sequence[str]) -> tuple[list, PassReport]:
+        script = lower(Parser(Scanner(source).scan()).parse())
+        report = PassManager(passes, verify_each=True).run(script)
+        print(format_ir(script))
+        return list(script.functions()), report
+
+    def ops(function: IRFunction) -> list[Op]:
+        return [instr.op for _, instr in function.instructions()]
+
+    print("-" * 80)
+    print("Testing copy propagation and value numbering")
+    source = """
+    def f(a, b) {
+        var x = a * b;
+        var y = x;
+        var z = a * b;
+        print y + z;
+        print a == b;
+        print b == a;
+        return 1;
+    }
+    """
+    (_, f), report = optimized(source, ("copyprop", "gvn"))
+    assert Op.COPY not in ops(f), ops(f)
+    assert ops(f).count(Op.BINARY) == 3, ops(f)
+    assert ops(f).count(Op.CONST) == 2, ops(f)
+    # The third value numbered is the script's implicit `return nil`.
+    assert report.counts == {"copyprop": 3, "gvn": 3}, report
+
+    print("-" * 80)
+    print("Testing dead-store elimination")
+    source = """
+    var g = 0;
+    def f(s) {
+        var unused = 1 + 2;
+        var checked = s - 1;
+        g = 1;
+        g = 2;
+        print g;
+        return 0;
+    }
+    """
+    (script, f), report = optimized(source, ("copyprop", "dse"))
+    stores = [instr for _, instr in f.instructions() if instr.op == Op.STORE_GLOBAL]
+    assert len(stores) == 1, stores
+    # `1 + 2` goes; `s - 1` may fail, so it stays.
+    assert ops(f).count(Op.BINARY) == 1, ops(f)
+
+    print("-" * 80)
+    print("Testing loop-invariant code motion")
+    source = """
+    var n = 3;
+    def scale(k, m) {
+        var total = 0;
+        for (var i = 0; i < m; i = i + 1;) {
+            for (var j = 0; j < m; j = j + 1;) {
+                total = total + k * 2 + n;
+            }
+        }
+        return total;
+    }
+    print scale(2, n);
+    """
+    (_, scale), report = optimized(source, DEFAULT_PIPELINE)
+    loops = natural_loops(scale)
+    outer = loops[-1]
+    hoisted = [instr for instr in outer.preheader.instrs if instr.op == Op.BINARY]
+    assert [instr.attr for instr in hoisted] == [TokenType.STAR], hoisted
+    assert hoisted[0].speculative and Op.CHECK in ops(scale)
+    loads = [instr for instr in outer.preheader.instrs if instr.op == Op.LOAD_GLOBAL]
+    assert len(loads) == 1 and loads[0].speculative, loads
+    for loop in loops:
+        body_ops = [instr.op for block in loop.blocks for instr in block.instrs]
+        assert Op.LOAD_GLOBAL not in body_ops and Op.CONST not in body_ops
+    assert report.counts["licm"] > 0, report
+
+    # A hoisted computation that fails only fails where it used to, and
+    # not at all when the loop never reaches it.
+    source = """
+    def run(count, bad) {
+        for (var i = 0; i < count; i = i + 1;) {
+            print i;
+            print bad - 1;
+        }
+        return 0;
+    }
+    print run(0, "x");
+    print run(2, "x");
+    """
+    interpreter = IRInterpreter()
+    buf = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buf):
+            interpreter.interpret(Parser(Scanner(source).scan()).parse())
+    except AssertionError as exc:
+        assert "is not a number" in str(exc), exc
+    else:
+        assert False, "Expected `bad - 1` to fail"
+    # `run(0, "x")` returns 0, then `run(2, "x")` prints i before failing.
+    output = buf.getvalue()
+    assert output.count("[interpreter]") == output.count("] 0.0") == 2, output
+    assert interpreter.report.counts["licm"] > 0, interpreter.report
+
+
+if __name__ == "__main__":
+    test_ir_passes()
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+import sys
+from typing import Any
+
+# Default per-function cap on the estimated size of cached entries.
+DEFAULT_MEMO_MAX_BYTES = 1 << 20
+
+# Rough per-entry cost of the OrderedDict node and the (value, size) pair.
+_ENTRY_OVERHEAD = 120
+
+# Argument types that make a cache key. Keys carry the type so that `true`
+# and `1` (equal in Python) do not share an entry; floats are keyed by their
+# repr so that 0.0 and -0.0 stay apart.
+_KEY_TYPES = (float, str, bool, type(None))
+
+MISSING = object()
+
+
+def _sizeof(value: Any) -> int:
+    return sys.getsizeof(value)
+
+
+class MemoCache:
+    """
+    LRU cache of one function's results, keyed by its argument values.
+
+    The estimated size of the stored keys and results is kept under
+    `max_bytes`; the least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMO_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._entries: OrderedDict[tuple, tuple[Any, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(args: list[Any]) -> tuple | None:
+        """Returns the cache key for `args`, or None if they cannot be keyed."""
+        key = []
+        for arg in args:
+            if not isinstance(arg, _KEY_TYPES):
+                return None
+            key.append((arg.__class__, repr(arg) if arg.__class__ is float else arg))
+        return tuple(key)
+
+    def get(self, key: tuple) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: tuple, value: Any):
+        size = _ENTRY_OVERHEAD + _sizeof(key) + _sizeof(value)
+        size += sum(_sizeof(item[1]) for item in key)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.nbytes -= evicted
+            self.evictions += 1
+
+
+def test_memo():
+    print("-" * 80)
+    print("Testing memo cache")
+    assert MemoCache.make_key([1.0, "a"]) == MemoCache.make_key([1.0, "a"])
+    assert MemoCache.make_key([True]) != MemoCache.make_key([1.0])
+    assert MemoCache.make_key([0.0]) != MemoCache.make_key([-0.0])
+    assert MemoCache.make_key([[1.0]]) is None
+
+    cache = MemoCache(max_bytes=2000)
+    for idx in range(100):
+        cache.put(MemoCache.make_key([float(idx)]), float(idx * idx))
+        # Touch the first entry so it survives eviction.
+        assert cache.get(MemoCache.make_key([0.0])) == 0.0
+    print(f"entries={len(cache)} bytes={cache.nbytes} evictions={cache.evictions}")
+    assert cache.nbytes <= cache.max_bytes
+    assert 0 < len(cache) < 100 and cache.evictions == 100 - len(cache)
+    assert cache.get(MemoCache.make_key([99.0])) == 99.0 * 99.0
+    assert cache.get(MemoCache.make_key([1.0])) is MISSING
+
+
+if __name__ == "__main__":
+    test_memo()
@@ -0,0 +1,349 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    UnaryExpr,
+    WhileStmt,
+)
+from tok import Token, TokenType
+
+_COMPARE_OPS = {
+    TokenType.EQUAL_EQUAL: lambda l, r: l == r,
+    TokenType.BANG_EQUAL: lambda l, r: l != r,
+    TokenType.GREATER: lambda l, r: l > r,
+    TokenType.GREATER_EQUAL: lambda l, r: l >= r,
+    TokenType.LESS: lambda l, r: l < r,
+    TokenType.LESS_EQUAL: lambda l, r: l <= r,
+}
+
+
+class _NotConstant(Exception):
+    """The operation would fail at runtime, so it is left for the evaluator."""
+
+
+@dataclass
+class OptimizeReport:
+    folded: int = 0
+    branches_eliminated: int = 0
+    loops_removed: int = 0
+    groupings_stripped: int = 0
+    changes: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return (
+            f"folded={self.folded} branches_eliminated={self.branches_eliminated} "
+            f"loops_removed={self.loops_removed} "
+            f"groupings_stripped={self.groupings_stripped}"
+        )
+
+
+def _is_constant(expr: Expr | None) -> bool:
+    return (
+        isinstance(expr, LiteralExpr)
+        and expr.value.token_type != TokenType.IDENTIFIER
+    )
+
+
+def _lineno(expr: Expr) -> int:
+    if isinstance(expr, LiteralExpr):
+        return expr.value.lineno
+    if isinstance(expr, BinaryExpr | UnaryExpr):
+        return expr.op.lineno
+    if isinstance(expr, FuncCall):
+        return expr.name.lineno
+    return 0
+
+
+def _make_literal(value: Any, lineno: int) -> LiteralExpr:
+    if isinstance(value, bool):
+        token_type = TokenType.TRUE if value else TokenType.FALSE
+        lexeme = "true" if value else "false"
+    elif value is None:
+        token_type, lexeme = TokenType.NIL, "nil"
+    elif isinstance(value, float):
+        token_type, lexeme = TokenType.NUMBER, repr(value)
+    else:
+        token_type, lexeme = TokenType.STRING, f'"{value}"'
+    return LiteralExpr(value=Token(token_type, lexeme, value, lineno))
+
+
+def _fold_unary(op: TokenType, val: Any) -> Any:
+    if op == TokenType.MINUS and isinstance(val, float):
+        return -val
+    if op == TokenType.BANG and isinstance(val, bool):
+        return not val
+    raise _NotConstant()
+
+
+def _fold_binary(op: TokenType, left_val: Any, right_val: Any) -> Any:
+    if op in _COMPARE_OPS:
+        try:
+            return _COMPARE_OPS[op](left_val, right_val)
+        except TypeError:
+            raise _NotConstant()
+    if op == TokenType.PLUS:
+        if type(left_val) == type(right_val) and isinstance(left_val, float | str):
+            return left_val + right_val
+        raise _NotConstant()
+    if not isinstance(left_val, float) or not isinstance(right_val, float):
+        raise _NotConstant()
+    match op:
+        case TokenType.MINUS:
+            return left_val - right_val
+        case TokenType.STAR:
+            return left_val * right_val
+        case TokenType.SLASH:
+            if right_val == 0:
+                raise _NotConstant()
+            return left_val / right_val
+    raise _NotConstant()
+
+
+class Optimizer(Visitor):
+    """
+    Rewrites the AST between `Parser.parse()` and execution:
+
+    - folds unary/binary expressions and `and`/`or` over literal operands,
+      using the evaluator's semantics and leaving anything that would fail at
+      runtime untouched;
+    - replaces `if` statements with a constant condition by the taken branch;
+    - removes `while`/`for` loops whose condition is constantly falsy;
+    - strips `GroupingExpr` wrappers, which only matter while parsing.
+
+    Every visit returns the replacement node, or None for a removed statement.
+    """
+
+    def __init__(self):
+        self.report = OptimizeReport()
+
+    def optimize(self, expr: Expr) -> Expr:
+        return expr.accept(self)
+
+    def _record(self, kind: str, lineno: int, message: str):
+        setattr(self.report, kind, getattr(self.report, kind) + 1)
+        self.report.changes.append(f"line {lineno}: {message}")
+
+    def _statement(self, stmt: Expr) -> Expr:
+        # Statement positions that cannot be empty get an empty block.
+        res = stmt.accept(self)
+        return Block([]) if res is None else res
+
+    def _statements(self, stmts: list[Expr]) -> list[Expr]:
+        res = []
+        for stmt in stmts:
+            stmt = stmt.accept(self)
+            if stmt is not None:
+                res.append(stmt)
+        return res
+
+    ########################################################
+    # Expressions
+    ########################################################
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        return expr
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        inner = expr.expr.accept(self)
+        self._record("groupings_stripped", _lineno(inner), "stripped grouping")
+        return inner
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        expr.right = expr.right.accept(self)
+        if not _is_constant(expr.right):
+            return expr
+        try:
+            value = _fold_unary(expr.op.token_type, expr.right.value.literal)
+        except _NotConstant:
+            return expr
+        lineno = expr.op.lineno
+        self._record("folded", lineno, f"folded {expr.op.lexeme}{expr.right} -> {value!r}")
+        return _make_literal(value, lineno)
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        expr.left = expr.left.accept(self)
+        expr.right = expr.right.accept(self)
+        op = expr.op.token_type
+        lineno = expr.op.lineno
+
+        # `and`/`or` only need a constant left operand.
+        if op in (TokenType.AND, TokenType.OR) and _is_constant(expr.left):
+            left_val = expr.left.value.literal
+            if op == TokenType.AND:
+                res = expr.right if left_val else _make_literal(False, lineno)
+            else:
+                res = expr.left if left_val else expr.right
+            self._record("folded", lineno, f"folded {expr.op.lexeme} with constant left")
+            return res
+
+        if not (_is_constant(expr.left) and _is_constant(expr.right)):
+            return expr
+        left_val, right_val = expr.left.value.literal, expr.right.value.literal
+        try:
+            value = _fold_binary(op, left_val, right_val)
+        except _NotConstant:
+            return expr
+        self._record(
+            "folded",
+            lineno,
+            f"folded {left_val!r} {expr.op.lexeme} {right_val!r} -> {value!r}",
+        )
+        return _make_literal(value, lineno)
+
+    def visit_func_call(self, expr: "FuncCall"):
+        expr.args = [arg.accept(self) for arg in expr.args]
+        return expr
+
+    ########################################################
+    # Statements
+    ########################################################
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        stmt.expr = stmt.expr.accept(self)
+        return stmt
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        if stmt.expr is not None:
+            stmt.expr = stmt.expr.accept(self)
+        return stmt
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        stmt.expr = stmt.expr.accept(self)
+        return stmt
+
+    def visit_block(self, block: "Block"):
+        block.exprs = self._statements(block.exprs)
+        return block
+
+    def visit_program(self, program: "Program"):
+        program.exprs = self._statements(program.exprs)
+        # Slots may have moved; let the engines resolve again.
+        program.resolved = False
+        return program
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        stmt.condition = stmt.condition.accept(self)
+        if not _is_constant(stmt.condition):
+            stmt.then_branch = self._statement(stmt.then_branch)
+            if stmt.else_branch is not None:
+                stmt.else_branch = stmt.else_branch.accept(self)
+            return stmt
+        lineno = stmt.condition.value.lineno
+        if stmt.condition.value.literal:
+            self._record("branches_eliminated", lineno, "dropped else branch")
+            return stmt.then_branch.accept(self)
+        self._record("branches_eliminated", lineno, "dropped then branch")
+        if stmt.else_branch is None:
+            return None
+        return stmt.else_branch.accept(self)
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        stmt.condition = stmt.condition.accept(self)
+        if _is_constant(stmt.condition) and not stmt.condition.value.literal:
+            self._record("loops_removed", stmt.condition.value.lineno, "removed while loop")
+            return None
+        stmt.body = self._statement(stmt.body)
+        return stmt
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        stmt.init = self._statement(stmt.init)
+        stmt.condition = stmt.condition.accept(self)
+        if _is_constant(stmt.condition) and not stmt.condition.value.literal:
+            # The initializer still runs once.
+            self._record("loops_removed", stmt.condition.value.lineno, "removed for loop")
+            return stmt.init
+        stmt.body = self._statement(stmt.body)
+        stmt.update = self._statement(stmt.update)
+        return stmt
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        stmt.body = self._statement(stmt.body)
+        return stmt
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if stmt.expr is not None:
+            stmt.expr = stmt.expr.accept(self)
+        return stmt
+
+
+def optimize(program: Expr) -> tuple[Expr, OptimizeReport]:
+    optimizer = Optimizer()
+    program = optimizer.optimize(program)
+    if program is None:
+        program = Block([])
+    return program, optimizer.report
+
+
+def test_optimizer():
+    import contextlib
+    import io
+
+    from interpreter import Interpreter
+    from parser import Parser
+    from scanner import Scanner
+
+    source = """
+    var a = (1 + 2) * 3;
+    print a;
+    print "con" + "cat";
+    print 1 < 2 and a;
+    print 0 or "zero is falsy? no";
+    print nil or -(4 / 2);
+    if 2 > 1 {
+        print "then";
+    } else {
+        print "else";
+    }
+    if 1 == 2 print "never";
+    while (1 > 2) {
+        print "never";
+    }
+    for (var i = 0; 1 > 2; i = i + 1;) {
+        print "never";
+    }
+    print i;
+    def f(x) {
+        return x * (2 + 3);
+    }
+    print f(2);
+    """
+    print("-" * 80)
+    print(f"Testing optimizer: {source}")
+
+    def run(program: Expr) -> str:
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            Interpreter().interpret(program)
+        return buf.getvalue()
+
+    expected = run(Parser(Scanner(source).scan()).parse())
+    program, report = optimize(Parser(Scanner(source).scan()).parse())
+    print(report)
+    for change in report.changes:
+        print(f"  {change}")
+    output = run(program)
+    print(output, end="")
+    assert expected == output, f"Optimized output differs:\n{expected}\n{output}"
+    assert report.branches_eliminated == 2, report
+    assert report.loops_removed == 2, report
+    assert report.groupings_stripped == 3, report
+
+    # Operations that fail at runtime are left for the evaluator.
+    program, report = optimize(Parser(Scanner('print 1 / 0; print 1 + "a";').scan()).parse())
+    assert report.folded == 0, report
+
+
+if __name__ == "__main__":
+    test_optimizer()
@@ -1,3 +1,5 @@
+from typing import Iterable, Iterator
+
 from scanner import Token, TokenType
 import logging
 
@@ -13,6 +15,7 @@ from expr import (
     FuncCall,
     GroupingExpr,
     IfStmt,
+    LazyBody,
     LiteralExpr,
     PrintStmt,
     Program,
@@ -23,14 +26,72 @@ from expr import (
 )
 
 
+# Binding power of each binary operator; higher binds tighter.
+_BINARY_PRECEDENCE: dict[TokenType, int] = {
+    TokenType.OR: 1,
+    TokenType.AND: 2,
+    TokenType.BANG_EQUAL: 3,
+    TokenType.EQUAL_EQUAL: 3,
+    TokenType.GREATER: 4,
+    TokenType.GREATER_EQUAL: 4,
+    TokenType.LESS: 4,
+    TokenType.LESS_EQUAL: 4,
+    TokenType.MINUS: 5,
+    TokenType.PLUS: 5,
+    TokenType.SLASH: 6,
+    TokenType.STAR: 6,
+}
+
+_PRIMARY_TYPES = frozenset(
+    (
+        TokenType.FALSE,
+        TokenType.TRUE,
+        TokenType.NIL,
+        TokenType.NUMBER,
+        TokenType.STRING,
+        TokenType.IDENTIFIER,
+    )
+)
+
+_UNARY_TYPES = frozenset((TokenType.BANG, TokenType.MINUS))
+
+
 class Parser:
-    def __init__(self, tokens: list[Token]) -> None:
+    # Node constructors used by the grammar. They are plain class attributes
+    # (no bound-method overhead); `FlatParser` overrides them to emit rows of
+    # a flat AST instead.
+    _new_literal = LiteralExpr
+    _new_unary = UnaryExpr
+    _new_binary = BinaryExpr
+    _new_grouping = GroupingExpr
+    _new_print = PrintStmt
+    _new_decl = DeclStmt
+    _new_assign = AssignStmt
+    _new_block = Block
+    _new_program = Program
+    _new_if = IfStmt
+    _new_while = WhileStmt
+    _new_for = ForStmt
+    _new_func_decl = FuncDecl
+    _new_func_call = FuncCall
+    _new_return = ReturnStmt
+
+    def __init__(self, tokens: list[Token], lazy: bool = False) -> None:
         self._cur = 0
         self._tokens = tokens
+        # Lazy parsers only brace-match function bodies (see `LazyBody`).
+        self._lazy = lazy
 
     def parse(self) -> Expr:
         return self._program()
 
+    def statement_ranges(self) -> Iterator[tuple[Expr, int, int]]:
+        """Yields each top-level statement with the [start, end) of its tokens."""
+        while not self._is_at_end() and self._peek().token_type != TokenType.EOF:
+            start = self._cur
+            stmt = self._statement()
+            yield stmt, start, self._cur
+
     def _peek(self, offset: int = 0) -> Token:
         assert not self._is_at_end()
         assert self._cur + offset < len(self._tokens)
@@ -49,107 +110,42 @@ class Parser:
             ), f"Expected {expected_token_type} but got {token.token_type}"
         return token
 
-    def _expression(self) -> Expr:
-        return self._or()
-
-    def _or(self) -> Expr:
-        expr = self._and()
-
-        while not self._is_at_end() and self._peek().token_type == TokenType.OR:
-            op = self._advance(TokenType.OR)
-            right = self._and()
-            expr = BinaryExpr(left=expr, right=right, op=op)
-
-        return expr
-
-    def _and(self) -> Expr:
-        expr = self._equality()
-
-        while not self._is_at_end() and self._peek().token_type == TokenType.AND:
-            op = self._advance(TokenType.AND)
-            right = self._equality()
-            expr = BinaryExpr(left=expr, right=right, op=op)
-
-        return expr
-
-    def _equality(self) -> Expr:
-        expr = self._comparison()
-
-        while not self._is_at_end() and self._peek().token_type in (
-            TokenType.BANG_EQUAL,
-            TokenType.EQUAL_EQUAL,
-        ):
+    def _expression(self, min_precedence: int = 1) -> Expr:
+        """
+        Pratt parser: one loop per operand instead of one method per
+        precedence level. Binary operators bind as tight as their entry in
+        `_BINARY_PRECEDENCE` and are left-associative, so the right operand
+        only takes operators that bind tighter.
+        """
+        expr = self._prefix()
+        precedence = _BINARY_PRECEDENCE
+        while not self._is_at_end():
+            op_precedence = precedence.get(self._peek().token_type, 0)
+            if op_precedence < min_precedence:
+                break
             op = self._advance()
-            right = self._comparison()
-            expr = BinaryExpr(left=expr, right=right, op=op)
-
-        return expr
-
-    def _comparison(self) -> Expr:
-        expr = self._term()
-
-        while not self._is_at_end() and self._peek().token_type in (
-            TokenType.GREATER,
-            TokenType.GREATER_EQUAL,
-            TokenType.LESS,
-            TokenType.LESS_EQUAL,
-        ):
-            op = self._advance()
-            right = self._term()
-            expr = BinaryExpr(left=expr, right=right, op=op)
-
+            right = self._expression(op_precedence + 1)
+            expr = self._new_binary(left=expr, right=right, op=op)
         return expr
 
-    def _term(self) -> Expr:
-        expr = self._factor()
-
-        while not self._is_at_end() and self._peek().token_type in (
-            TokenType.MINUS,
-            TokenType.PLUS,
-        ):
-            op = self._advance()
-            right = self._factor()
-            expr = BinaryExpr(left=expr, right=right, op=op)
-
-        return expr
-
-    def _factor(self) -> Expr:
-        expr = self._unary()
-
-        while not self._is_at_end() and self._peek().token_type in (
-            TokenType.SLASH,
-            TokenType.STAR,
-        ):
-            op = self._advance()
-            right = self._unary()
-            expr = BinaryExpr(left=expr, right=right, op=op)
-
-        return expr
-
-    def _unary(self) -> Expr:
-        if not self._is_at_end() and self._peek().token_type in (
-            TokenType.BANG,
-            TokenType.MINUS,
-        ):
-            op = self._advance()
-            right = self._unary()
-            return UnaryExpr(right=right, op=op)
-
-        return self._func_call()
-
-    def _primary(self) -> Expr:
-        primary_token_types = (
-            TokenType.FALSE,
-            TokenType.TRUE,
-            TokenType.NIL,
-            TokenType.NUMBER,
-            TokenType.STRING,
-            TokenType.IDENTIFIER,
-        )
-        if not self._is_at_end() and self._peek().token_type in primary_token_types:
-            return LiteralExpr(value=self._advance())
+    def _prefix(self) -> Expr:
+        token = self._peek()
+        token_type = token.token_type
+        if token_type in _PRIMARY_TYPES:
+            self._advance()
+            if (
+                token_type == TokenType.IDENTIFIER
+                and not self._is_at_end()
+                and self._peek().token_type == TokenType.LEFT_PAREN
+            ):  # TODO: support fn()()
+                return self._call(token)
+            return self._new_literal(value=token)
+
+        if token_type in _UNARY_TYPES:
+            self._advance()
+            return self._new_unary(right=self._prefix(), op=token)
 
-        if not self._is_at_end() and self._peek().token_type == TokenType.LEFT_PAREN:
+        if token_type == TokenType.LEFT_PAREN:
             self._advance()
             expr = self._expression()
             assert (
@@ -157,22 +153,22 @@ class Parser:
                 and self._advance().token_type == TokenType.RIGHT_PAREN
             ), f"Expected ')' after expression"
 
-            return GroupingExpr(expr)
+            return self._new_grouping(expr)
 
-        raise ValueError(f"Unexpected token {self._peek()}")
+        raise ValueError(f"Unexpected token {token}")
 
     def _program(self) -> Expr:
         exprs = []
         while not self._is_at_end() and self._peek().token_type != TokenType.EOF:
             exprs.append(self._statement())
-        return Program(exprs)
+        return self._new_program(exprs)
 
     def _statement(self) -> Expr:
         if self._peek().token_type == TokenType.PRINT:
             return self._print_stmt()
         elif self._peek().token_type == TokenType.VAR:
             return self._decl_stmt()
-        elif self._peek().token_type == TokenType.FUNC:
+        elif self._peek().token_type in (TokenType.FUNC, TokenType.AT):
             return self._func_decl_stmt()
         elif self._peek().token_type == TokenType.LEFT_BRACE:
             return self._block_stmt()
@@ -199,7 +195,7 @@ class Parser:
         self._advance(TokenType.PRINT)
         expr = self._expression()
         self._advance(TokenType.SEMICOLON)
-        return PrintStmt(expr)
+        return self._new_print(expr)
 
     def _decl_stmt(self) -> Expr:
         self._advance(TokenType.VAR)
@@ -210,7 +206,7 @@ class Parser:
         else:
             expr = None
         self._advance(TokenType.SEMICOLON)
-        return DeclStmt(name=name, expr=expr)
+        return self._new_decl(name=name, expr=expr)
 
     def _assign_stmt(self) -> Expr:
         name = self._advance(
@@ -219,7 +215,7 @@ class Parser:
         self._advance(TokenType.EQUAL)
         expr = self._expression()
         self._advance(TokenType.SEMICOLON)
-        return AssignStmt(name=name, expr=expr)
+        return self._new_assign(name=name, expr=expr)
 
     def _block_stmt(self) -> Expr:
         self._advance(TokenType.LEFT_BRACE)
@@ -229,7 +225,7 @@ class Parser:
         ):
             exprs.append(self._statement())
         self._advance(TokenType.RIGHT_BRACE)
-        return Block(exprs)
+        return self._new_block(exprs)
 
     def _if_stmt(self) -> Expr:
         self._advance(TokenType.IF)
@@ -239,7 +235,7 @@ class Parser:
         if not self._is_at_end() and self._peek().token_type == TokenType.ELSE:
             self._advance(TokenType.ELSE)
             else_branch = self._statement()
-        return IfStmt(
+        return self._new_if(
             condition=condition, then_branch=then_branch, else_branch=else_branch
         )
 
@@ -249,7 +245,7 @@ class Parser:
         condition = self._expression()
         self._advance(TokenType.RIGHT_PAREN)
         body = self._statement()
-        return WhileStmt(condition=condition, body=body)
+        return self._new_while(condition=condition, body=body)
 
     def _for_stmt(self) -> Expr:
         self._advance(TokenType.FOR)
@@ -264,9 +260,15 @@ class Parser:
         update = self._assign_stmt()
         self._advance(TokenType.RIGHT_PAREN)
         body = self._statement()
-        return ForStmt(init=init, condition=condition, update=update, body=body)
+        return self._new_for(
+            init=init, condition=condition, update=update, body=body
+        )
 
     def _func_decl_stmt(self) -> Expr:
+        annotations = []
+        while self._peek().token_type == TokenType.AT:
+            self._advance(TokenType.AT)
+            annotations.append(self._advance(TokenType.IDENTIFIER).lexeme)
         self._advance(TokenType.FUNC)
         name = self._advance(TokenType.IDENTIFIER)
         self._advance(TokenType.LEFT_PAREN)
@@ -278,8 +280,230 @@ class Parser:
             if self._peek().token_type == TokenType.COMMA:
                 self._advance(TokenType.COMMA)
         self._advance(TokenType.RIGHT_PAREN)
-        body = self._block_stmt()
-        return FuncDecl(name=name, params=params, body=body)
+        if self._lazy:
+            body = self._skip_body(params)
+        else:
+            body = self._block_stmt()
+        return self._new_func_decl(
+            name=name, params=params, body=body, annotations=annotations
+        )
+
+    def _skip_body(self, params: list[Token]) -> Expr:
+        start = self._cur
+        self._advance(TokenType.LEFT_BRACE)
+        tokens = self._tokens
+        depth = 1
+        assigned = set()
+        cur = self._cur
+        while depth:
+            token_type = tokens[cur].token_type
+            if token_type == TokenType.LEFT_BRACE:
+                depth += 1
+            elif token_type == TokenType.RIGHT_BRACE:
+                depth -= 1
+            elif token_type == TokenType.EQUAL and cur > 0:
+                prev = tokens[cur - 1]
+                # `var x = ...` declares a local; only plain assignments can
+                # rebind a name the function does not own.
+                if prev.token_type == TokenType.IDENTIFIER and (
+                    cur < 2 or tokens[cur - 2].token_type != TokenType.VAR
+                ):
+                    assigned.add(prev.lexeme)
+            elif token_type == TokenType.EOF:
+                lineno = tokens[start].lineno
+                raise ValueError(f"Unterminated function body at line {lineno}")
+            cur += 1
+        self._cur = cur
+        return LazyBody(
+            parser=self, start=start, end=cur - 1, params=params, assigned=assigned
+        )
+
+    def parse_block_at(self, start: int) -> Expr:
+        """Parses the block whose `{` is the token at `start`."""
+        cur, self._cur = self._cur, start
+        try:
+            return self._block_stmt()
+        finally:
+            self._cur = cur
+
+    def _call(self, name: Token) -> Expr:
+        self._advance(TokenType.LEFT_PAREN)
+        args = []
+        while (
+            not self._is_at_end()
+            and self._peek().token_type != TokenType.RIGHT_PAREN
+        ):
+            args.append(self._expression())
+            if self._peek().token_type == TokenType.COMMA:
+                self._advance(TokenType.COMMA)
+        self._advance(TokenType.RIGHT_PAREN)
+        return self._new_func_call(name=name, args=args)
+
+    def _return_stmt(self) -> Expr:
+        self._advance(TokenType.RETURN)
+        if not self._is_at_end() and self._peek().token_type != TokenType.SEMICOLON:
+            expr = self._expression()
+        else:
+            expr = None
+        self._advance(TokenType.SEMICOLON)
+        return self._new_return(expr=expr)
+
+
+class StreamingParser(Parser):
+    """
+    Parses a token iterator one top-level statement at a time. Tokens are
+    pulled on demand and dropped once the statement that used them has been
+    yielded, so memory is bounded by the largest statement.
+    """
+
+    def __init__(self, tokens: Iterable[Token]) -> None:
+        super().__init__([])
+        self._stream = iter(tokens)
+
+    def _fill(self, offset: int):
+        while len(self._tokens) <= self._cur + offset:
+            token = next(self._stream, None)
+            if token is None:
+                return
+            self._tokens.append(token)
+
+    def _peek(self, offset: int = 0) -> Token:
+        self._fill(offset)
+        return super()._peek(offset)
+
+    def _is_at_end(self) -> bool:
+        self._fill(0)
+        return super()._is_at_end()
+
+    def _advance(self, expected_token_type: TokenType | None = None) -> Token:
+        self._fill(0)
+        return super()._advance(expected_token_type)
+
+    def statements(self) -> Iterator[Expr]:
+        while not self._is_at_end() and self._peek().token_type != TokenType.EOF:
+            stmt = self._statement()
+            del self._tokens[: self._cur]
+            self._cur = 0
+            yield stmt
+
+
+class DescentParser(Parser):
+    """
+    Original expression grammar with one method per precedence level, kept
+    as the reference that the Pratt `Parser._expression()` is tested against.
+    """
+
+    def _expression(self) -> Expr:
+        return self._or()
+
+    def _or(self) -> Expr:
+        expr = self._and()
+
+        while not self._is_at_end() and self._peek().token_type == TokenType.OR:
+            op = self._advance(TokenType.OR)
+            right = self._and()
+            expr = self._new_binary(left=expr, right=right, op=op)
+
+        return expr
+
+    def _and(self) -> Expr:
+        expr = self._equality()
+
+        while not self._is_at_end() and self._peek().token_type == TokenType.AND:
+            op = self._advance(TokenType.AND)
+            right = self._equality()
+            expr = self._new_binary(left=expr, right=right, op=op)
+
+        return expr
+
+    def _equality(self) -> Expr:
+        expr = self._comparison()
+
+        while not self._is_at_end() and self._peek().token_type in (
+            TokenType.BANG_EQUAL,
+            TokenType.EQUAL_EQUAL,
+        ):
+            op = self._advance()
+            right = self._comparison()
+            expr = self._new_binary(left=expr, right=right, op=op)
+
+        return expr
+
+    def _comparison(self) -> Expr:
+        expr = self._term()
+
+        while not self._is_at_end() and self._peek().token_type in (
+            TokenType.GREATER,
+            TokenType.GREATER_EQUAL,
+            TokenType.LESS,
+            TokenType.LESS_EQUAL,
+        ):
+            op = self._advance()
+            right = self._term()
+            expr = self._new_binary(left=expr, right=right, op=op)
+
+        return expr
+
+    def _term(self) -> Expr:
+        expr = self._factor()
+
+        while not self._is_at_end() and self._peek().token_type in (
+            TokenType.MINUS,
+            TokenType.PLUS,
+        ):
+            op = self._advance()
+            right = self._factor()
+            expr = self._new_binary(left=expr, right=right, op=op)
+
+        return expr
+
+    def _factor(self) -> Expr:
+        expr = self._unary()
+
+        while not self._is_at_end() and self._peek().token_type in (
+            TokenType.SLASH,
+            TokenType.STAR,
+        ):
+            op = self._advance()
+            right = self._unary()
+            expr = self._new_binary(left=expr, right=right, op=op)
+
+        return expr
+
+    def _unary(self) -> Expr:
+        if not self._is_at_end() and self._peek().token_type in (
+            TokenType.BANG,
+            TokenType.MINUS,
+        ):
+            op = self._advance()
+            right = self._unary()
+            return self._new_unary(right=right, op=op)
+
+        return self._func_call()
+
+    def _primary(self) -> Expr:
+        primary_token_types = (
+            TokenType.FALSE,
+            TokenType.TRUE,
+            TokenType.NIL,
+            TokenType.NUMBER,
+            TokenType.STRING,
+            TokenType.IDENTIFIER,
+        )
+        if not self._is_at_end() and self._peek().token_type in primary_token_types:
+            return self._new_literal(value=self._advance())
+
+        if not self._is_at_end() and self._peek().token_type == TokenType.LEFT_PAREN:
+            self._advance()
+            expr = self._expression()
+            assert (
+                not self._is_at_end()
+                and self._advance().token_type == TokenType.RIGHT_PAREN
+            ), f"Expected ')' after expression"
+
+            return self._new_grouping(expr)
+
+        raise ValueError(f"Unexpected token {self._peek()}")
 
     def _func_call(self) -> Expr:
         if (
@@ -297,18 +521,9 @@ class Parser:
                 if self._peek().token_type == TokenType.COMMA:
                     self._advance(TokenType.COMMA)
             self._advance(TokenType.RIGHT_PAREN)
-            return FuncCall(name=name, args=args)
+            return self._new_func_call(name=name, args=args)
         return self._primary()
 
-    def _return_stmt(self) -> Expr:
-        self._advance(TokenType.RETURN)
-        if not self._is_at_end() and self._peek().token_type != TokenType.SEMICOLON:
-            expr = self._expression()
-        else:
-            expr = None
-        self._advance(TokenType.SEMICOLON)
-        return ReturnStmt(expr=expr)
-
 
 def _test_expression(source: str) -> None:
     from scanner import Scanner
@@ -381,8 +596,119 @@ def test_expression():
     test_precedence()
 
 
+def test_slotted_nodes():
+    from scanner import Scanner
+
+    tokens = Scanner("print 1 + 2;").scan()
+    program = Parser(tokens).parse()
+    # Nodes and tokens are slotted and carry no per-instance dict.
+    for obj in (program, program.exprs[0].expr, tokens[0]):
+        assert not hasattr(obj, "__dict__"), type(obj)
+
+
+def test_streaming_parser():
+    from scanner import Scanner
+
+    source = """
+    var a = 1;
+    def f(x) {
+        return x + a;
+    }
+    print f(2);
+    """
+    tokens = Scanner(source).scan()
+    parser = StreamingParser(iter(tokens))
+    stmts = []
+    for stmt in parser.statements():
+        # Only the tokens of the statement in flight are buffered.
+        assert len(parser._tokens) <= 1, len(parser._tokens)
+        stmts.append(stmt)
+    assert Program(stmts) == Parser(tokens).parse()
+
+
+def test_lazy_parser():
+    import contextlib
+    import io
+
+    from interpreter import Interpreter
+    from scanner import Scanner
+    from vm import VM
+
+    source = """
+    var calls = 0;
+    def used(n) {
+        def helper(x) {
+            return x * 2;
+        }
+        calls = calls + 1;
+        if (n <= 0) {
+            return 0;
+        }
+        return helper(n) + used(n - 1);
+    }
+    def unused(a, b) {
+        { var c = a; { print c + b; } }
+        used = nil;
+    }
+    print used(3);
+    print calls;
+    """
+    tokens = Scanner(source).scan()
+    program = Parser(tokens, lazy=True).parse()
+    used, unused = program.exprs[1], program.exprs[2]
+    assert isinstance(used.body, LazyBody) and used.body.block is None
+    assert unused.body.assigned == {"used"}
+
+    outputs = []
+    for engine, lazy in ((Interpreter, False), (Interpreter, True), (VM, True)):
+        program = Parser(tokens, lazy=lazy).parse()
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            engine().interpret(program)
+        outputs.append(buf.getvalue())
+        if engine is Interpreter and lazy:
+            # Only the bodies that ran were parsed.
+            assert program.exprs[1].body.block is not None
+            assert program.exprs[2].body.block is None
+            # `unused` may rebind `used`, so purity analysis keeps it uncached.
+            assert not program.exprs[1].pure
+    assert outputs[0] == outputs[1] == outputs[2], outputs
+
+
+def test_pratt_parser():
+    from scanner import Scanner
+
+    print("-" * 80)
+    print("Testing Pratt expression parser")
+    source = """
+    print a + 2 * 3 - b / 4 * -c;
+    print (1 + 2) * (3 - (4 / x)) == 5 or y < 6 and --z >= 7 != false;
+    print f(1, g(2 + 3, h()), "s") * 2 - k(nil);
+    var v = a and b or c and d or e;
+    if (a <= b + 1) { v = -(a - b) * f(a); }
+    for (var i = 0; i < n * 2; i = i + 1;) { print i / 2 > 1 == true; }
+    """
+    tokens = Scanner(source).scan()
+    assert Parser(tokens).parse() == DescentParser(tokens).parse()
+
+    # Two Python frames per nesting level instead of ten.
+    nested = "print " + "(" * 300 + "1" + " + 1)" * 300 + ";"
+    tokens = Scanner(nested).scan()
+    assert isinstance(Parser(tokens).parse().exprs[0].expr, GroupingExpr)
+    try:
+        DescentParser(tokens).parse()
+    except RecursionError:
+        pass
+    else:
+        assert False, "Expected the descent parser to run out of stack"
+
+
 def test_parser():
     test_program()
+    test_slotted_nodes()
+    test_pratt_parser()
+    test_streaming_parser()
+    test_lazy_parser()
 
 
 if __name__ == "__main__":
@@ -84,7 +84,8 @@ class ExprPrinter(Visitor):
         return str
 
     def visit_func_decl(self, stmt: "FuncDecl"):
-        str = f"def {stmt.name.lexeme}\n"
+        str = "".join(f"@{annotation}\n" for annotation in stmt.annotations)
+        str += f"def {stmt.name.lexeme}\n"
         str += f"\t({self.print(stmt.params)})\n"
         str += f"\t{self.print(stmt.body)}\n"
         return str
@@ -0,0 +1,242 @@
+from dataclasses import dataclass, field
+
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    UnaryExpr,
+    WhileStmt,
+)
+from resolver import Resolver
+from tok import TokenType
+
+
+@dataclass
+class _FuncFacts:
+    decl: FuncDecl
+    impure: bool = False
+    # Global names called from the body.
+    callees: set[str] = field(default_factory=set)
+
+
+class PurityAnalyzer(Visitor):
+    """
+    Decides which functions are pure, i.e. whose result only depends on their
+    argument values, and sets `FuncDecl.pure` accordingly.
+
+    A function is pure when its body (ignoring nested function bodies, which
+    are analyzed on their own):
+    - does not `print`;
+    - does not read or assign globals, except for calling global functions;
+    - does not call parameters or other local names;
+    - only calls global functions that are pure themselves and that are
+      declared once and never reassigned. Natives (`time`, `sleep`) are not
+      declared in the program and therefore never count as pure.
+
+    Calls between functions are resolved by a fixed point, so (mutually)
+    recursive functions such as `fib` are pure. Requires a resolved program.
+    """
+
+    def __init__(self):
+        self._facts: list[_FuncFacts] = []
+        self._current: _FuncFacts | None = None
+        self._global_funcs: dict[str, list[FuncDecl]] = {}
+        self._unstable_names: set[str] = set()
+
+    def analyze(self, program: Expr) -> list[FuncDecl]:
+        if isinstance(program, Program) and not program.resolved:
+            Resolver().resolve(program)
+        program.accept(self)
+
+        stable = {
+            name: decls[0]
+            for name, decls in self._global_funcs.items()
+            if len(decls) == 1 and name not in self._unstable_names
+        }
+        pure = {id(facts.decl) for facts in self._facts if not facts.impure}
+        changed = True
+        while changed:
+            changed = False
+            for facts in self._facts:
+                if id(facts.decl) not in pure:
+                    continue
+                for callee in facts.callees:
+                    if callee not in stable or id(stable[callee]) not in pure:
+                        pure.discard(id(facts.decl))
+                        changed = True
+                        break
+
+        for facts in self._facts:
+            facts.decl.pure = id(facts.decl) in pure
+        return [facts.decl for facts in self._facts if facts.decl.pure]
+
+    def _mark_impure(self):
+        if self._current is not None:
+            self._current.impure = True
+
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        if expr.value.token_type == TokenType.IDENTIFIER and expr.depth is None:
+            self._mark_impure()
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        expr.right.accept(self)
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        expr.expr.accept(self)
+
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        self._mark_impure()
+        stmt.expr.accept(self)
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        if stmt.expr is not None:
+            stmt.expr.accept(self)
+        if stmt.slot is None:
+            self._unstable_names.add(stmt.name.lexeme)
+            self._mark_impure()
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        stmt.expr.accept(self)
+        if stmt.depth is None:
+            self._unstable_names.add(stmt.name.lexeme)
+            self._mark_impure()
+
+    def visit_block(self, block: "Block"):
+        for stmt in block.exprs:
+            stmt.accept(self)
+
+    def visit_program(self, program: "Program"):
+        for stmt in program.exprs:
+            stmt.accept(self)
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        stmt.condition.accept(self)
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        stmt.condition.accept(self)
+        stmt.body.accept(self)
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        stmt.init.accept(self)
+        stmt.condition.accept(self)
+        stmt.body.accept(self)
+        stmt.update.accept(self)
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        if stmt.slot is None:
+            self._global_funcs.setdefault(stmt.name.lexeme, []).append(stmt)
+        enclosing = self._current
+        self._current = _FuncFacts(decl=stmt)
+        self._facts.append(self._current)
+        stmt.body.accept(self)
+        self._current = enclosing
+
+    def visit_lazy_body(self, body: "LazyBody"):
+        if body.block is not None:
+            body.block.accept(self)
+            return
+        # Not parsed yet: assume the worst rather than force parsing.
+        self._mark_impure()
+        self._unstable_names.update(body.assigned)
+
+    def visit_func_call(self, expr: "FuncCall"):
+        if self._current is not None:
+            if expr.depth is None:
+                self._current.callees.add(expr.name.lexeme)
+            else:
+                self._current.impure = True
+        for arg in expr.args:
+            arg.accept(self)
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if stmt.expr is not None:
+            stmt.expr.accept(self)
+
+
+def analyze_purity(program: Expr) -> list[FuncDecl]:
+    """Marks `FuncDecl.pure` across `program` and returns the pure functions."""
+    return PurityAnalyzer().analyze(program)
+
+
+def test_purity():
+    from parser import Parser
+    from scanner import Scanner
+
+    source = """
+    var counter = 0;
+    def fib(n) {
+        if (n <= 1) {
+            return n;
+        }
+        return fib(n - 1) + fib(n - 2);
+    }
+    def is_even(n) {
+        if (n == 0) {
+            return 1 > 0;
+        }
+        return is_odd(n - 1);
+    }
+    def is_odd(n) {
+        if (n == 0) {
+            return 1 < 0;
+        }
+        return is_even(n - 1);
+    }
+    def loud(n) {
+        print n;
+        return n;
+    }
+    def bump() {
+        counter = counter + 1;
+        return counter;
+    }
+    def reads_global() {
+        return counter;
+    }
+    def calls_loud(n) {
+        return loud(n) + 1;
+    }
+    def calls_native() {
+        return time();
+    }
+    def apply(fn, x) {
+        return fn(x);
+    }
+    def helper(x) {
+        var y = x * 2;
+        {
+            var z = y + 1;
+            y = z;
+        }
+        return y;
+    }
+    """
+    print("-" * 80)
+    print(f"Testing purity: {source}")
+    program = Parser(Scanner(source).scan()).parse()
+    pure = {decl.name.lexeme for decl in analyze_purity(program)}
+    print(f"pure: {sorted(pure)}")
+    assert pure == {"fib", "is_even", "is_odd", "helper"}, pure
+
+
+if __name__ == "__main__":
+    test_purity()
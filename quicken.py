@@ -0,0 +1,98 @@
+import operator
+from typing import TYPE_CHECKING, Any, Callable
+
+from tok import TokenType
+
+if TYPE_CHECKING:
+    from expr import BinaryExpr, UnaryExpr
+    from interpreter import Interpreter
+
+# Executions with the same operand types before a site is specialized.
+QUICKEN_THRESHOLD = 2
+
+# A specialized visit: evaluates the operands, checks its guard and either
+# computes the result directly or deoptimizes the node.
+Variant = Callable[["Interpreter", Any], Any]
+
+_FLOAT_OPS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.SLASH: operator.truediv,
+    TokenType.EQUAL_EQUAL: operator.eq,
+    TokenType.BANG_EQUAL: operator.ne,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+}
+
+_STR_OPS = {
+    TokenType.PLUS: operator.add,
+    TokenType.EQUAL_EQUAL: operator.eq,
+    TokenType.BANG_EQUAL: operator.ne,
+}
+
+
+def _binary_variant(op: Callable[[Any, Any], Any], cls: type) -> Variant:
+    def run(interpreter: "Interpreter", expr: "BinaryExpr") -> Any:
+        left_val = interpreter.interpret(expr.left)
+        right_val = interpreter.interpret(expr.right)
+        if left_val.__class__ is cls and right_val.__class__ is cls:
+            return op(left_val, right_val)
+        return interpreter._deoptimize_binary(expr, left_val, right_val)
+
+    run.__name__ = f"{cls.__name__}_{op.__name__}"
+    return run
+
+
+def _float_neg(interpreter: "Interpreter", expr: "UnaryExpr") -> Any:
+    val = interpreter.interpret(expr.right)
+    if val.__class__ is float:
+        return -val
+    return interpreter._deoptimize_unary(expr, val)
+
+
+def _bool_not(interpreter: "Interpreter", expr: "UnaryExpr") -> Any:
+    val = interpreter.interpret(expr.right)
+    if val.__class__ is bool:
+        return not val
+    return interpreter._deoptimize_unary(expr, val)
+
+
+_BINARY_VARIANTS: dict[tuple[TokenType, type], Variant] = {
+    **{(op, float): _binary_variant(fn, float) for op, fn in _FLOAT_OPS.items()},
+    **{(op, str): _binary_variant(fn, str) for op, fn in _STR_OPS.items()},
+}
+
+_UNARY_VARIANTS: dict[tuple[TokenType, type], Variant] = {
+    (TokenType.MINUS, float): _float_neg,
+    (TokenType.BANG, bool): _bool_not,
+}
+
+
+def binary_variant(op: TokenType, left_type: type, right_type: type) -> Variant | None:
+    """Returns the specialization of `op` for the observed operand types, if any."""
+    if left_type is not right_type:
+        return None
+    return _BINARY_VARIANTS.get((op, left_type))
+
+
+def unary_variant(op: TokenType, operand_type: type) -> Variant | None:
+    return _UNARY_VARIANTS.get((op, operand_type))
+
+
+def test_quicken():
+    print("-" * 80)
+    print("Testing quickening variants")
+    assert binary_variant(TokenType.PLUS, float, float).__name__ == "float_add"
+    assert binary_variant(TokenType.PLUS, str, str).__name__ == "str_add"
+    assert binary_variant(TokenType.MINUS, str, str) is None
+    assert binary_variant(TokenType.PLUS, float, str) is None
+    assert binary_variant(TokenType.AND, bool, bool) is None
+    assert unary_variant(TokenType.MINUS, float) is _float_neg
+    assert unary_variant(TokenType.BANG, float) is None
+
+
+if __name__ == "__main__":
+    test_quicken()
@@ -0,0 +1,264 @@
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    UnaryExpr,
+    WhileStmt,
+)
+from tok import Token, TokenType
+
+
+def _declares(stmt: Expr) -> bool:
+    """Whether `stmt` declares a name in the scope it runs in."""
+    if isinstance(stmt, (DeclStmt, FuncDecl)):
+        return True
+    if isinstance(stmt, IfStmt):
+        return _declares(stmt.then_branch) or (
+            stmt.else_branch is not None and _declares(stmt.else_branch)
+        )
+    if isinstance(stmt, WhileStmt):
+        return _declares(stmt.body)
+    if isinstance(stmt, ForStmt):
+        return _declares(stmt.init) or _declares(stmt.body)
+    return False
+
+
+class Resolver(Visitor):
+    """
+    Static pass that binds every identifier to a (depth, slot) pair.
+
+    `depth` counts scopes outward from the innermost one at the use site and
+    `slot` indexes into that scope's array. Names that are not declared in the
+    enclosing function's scopes are globals and keep `depth=None`; they are
+    looked up by name at runtime because top-level declarations are dynamic.
+
+    The scopes mirror the runtime exactly: one per `Block` that declares
+    something, plus one for the parameters of each function. Blocks without
+    declarations get `num_slots == 0` and run in the enclosing scope.
+    Functions do not capture their enclosing scopes, so resolution restarts
+    from scratch in every function body.
+
+    It also marks calls in tail position (`return f(...)` inside a function)
+    so the interpreter can run them without growing the Python stack.
+    """
+
+    def __init__(self):
+        self._scopes: list[dict[str, int]] = []
+        self._func_depth = 0
+
+    def resolve(self, expr: Expr) -> Expr:
+        expr.accept(self)
+        if isinstance(expr, Program):
+            expr.resolved = True
+        return expr
+
+    def _declare(self, name: str) -> tuple[int | None, int | None]:
+        if not self._scopes:
+            return None, None
+        scope = self._scopes[-1]
+        if name in scope:
+            raise ValueError(f"Variable already defined: {name}")
+        scope[name] = len(scope)
+        return 0, scope[name]
+
+    def _lookup(self, name: str) -> tuple[int | None, int | None]:
+        for depth, scope in enumerate(reversed(self._scopes)):
+            if name in scope:
+                return depth, scope[name]
+        return None, None
+
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        if expr.value.token_type == TokenType.IDENTIFIER:
+            expr.depth, expr.slot = self._lookup(expr.value.lexeme)
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        expr.right.accept(self)
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        expr.expr.accept(self)
+
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        stmt.expr.accept(self)
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        # The initializer is evaluated before the name exists.
+        if stmt.expr is not None:
+            stmt.expr.accept(self)
+        stmt.depth, stmt.slot = self._declare(stmt.name.lexeme)
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        stmt.expr.accept(self)
+        stmt.depth, stmt.slot = self._lookup(stmt.name.lexeme)
+
+    def visit_block(self, block: "Block"):
+        if not any(_declares(stmt) for stmt in block.exprs):
+            for stmt in block.exprs:
+                stmt.accept(self)
+            block.num_slots = 0
+            return
+        self._scopes.append({})
+        for stmt in block.exprs:
+            stmt.accept(self)
+        block.num_slots = len(self._scopes.pop())
+
+    def visit_program(self, program: "Program"):
+        for stmt in program.exprs:
+            stmt.accept(self)
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        stmt.condition.accept(self)
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        stmt.condition.accept(self)
+        stmt.body.accept(self)
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        stmt.init.accept(self)
+        stmt.condition.accept(self)
+        stmt.body.accept(self)
+        stmt.update.accept(self)
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        stmt.depth, stmt.slot = self._declare(stmt.name.lexeme)
+        self.resolve_function_body(stmt.params, stmt.body)
+
+    def resolve_function_body(self, params: list[Token], body: Expr):
+        enclosing = self._scopes
+        self._scopes = [{}]
+        for param in params:
+            self._declare(param.lexeme)
+        self._func_depth += 1
+        body.accept(self)
+        self._func_depth -= 1
+        self._scopes = enclosing
+
+    def visit_lazy_body(self, body: "LazyBody"):
+        # An unparsed body is resolved by `LazyBody.materialize()`.
+        if body.block is not None:
+            body.block.accept(self)
+
+    def visit_func_call(self, expr: "FuncCall"):
+        expr.depth, expr.slot = self._lookup(expr.name.lexeme)
+        for arg in expr.args:
+            arg.accept(self)
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if stmt.expr is None:
+            return
+        stmt.expr.accept(self)
+        expr = stmt.expr
+        while isinstance(expr, GroupingExpr):
+            expr = expr.expr
+        if isinstance(expr, FuncCall) and self._func_depth > 0:
+            expr.tail = True
+
+
+def test_resolver():
+    from scanner import Scanner
+    from parser import Parser
+
+    source = """
+    var a = 1;
+    {
+        var b = a;
+        {
+            var c = b;
+            print a + b + c;
+        }
+    }
+    def add(x, y) {
+        var z = x + y;
+        return z;
+    }
+    """
+    print("-" * 80)
+    print(f"Testing resolver: {source}")
+    program = Parser(Scanner(source).scan()).parse()
+    Resolver().resolve(program)
+
+    outer = program.exprs[1]
+    inner = outer.exprs[1]
+    print_expr = inner.exprs[1].expr
+    a, b, c = print_expr.left.left, print_expr.left.right, print_expr.right
+    for literal in (a, b, c):
+        print(f"{literal.value.lexeme}: depth={literal.depth} slot={literal.slot}")
+    assert (a.depth, a.slot) == (None, None)
+    assert (b.depth, b.slot) == (1, 0)
+    assert (c.depth, c.slot) == (0, 0)
+    assert outer.num_slots == 1 and inner.num_slots == 1
+
+    func = program.exprs[2]
+    decl_z, ret = func.body.exprs
+    x, y = decl_z.expr.left, decl_z.expr.right
+    assert (x.depth, x.slot) == (1, 0) and (y.depth, y.slot) == (1, 1)
+    assert (decl_z.depth, decl_z.slot) == (0, 0)
+    assert (ret.expr.depth, ret.expr.slot) == (0, 0)
+
+    source = """
+    def loop(n, acc) {
+        if (n <= 0) {
+            return acc;
+        }
+        return loop(n - 1, acc + loop2(n));
+    }
+    """
+    program = Parser(Scanner(source).scan()).parse()
+    Resolver().resolve(program)
+    tail_call = program.exprs[0].body.exprs[1].expr
+    assert tail_call.tail, "return f(...) is a tail call"
+    assert not tail_call.args[1].right.tail, "nested call is not a tail call"
+
+    # Blocks that declare nothing get no scope; a `for` initializer or a
+    # bare declaration under `if` declares in the enclosing block.
+    source = """
+    def count(n) {
+        var total = 0;
+        while (n > 0) {
+            {
+                total = total + n;
+            }
+            n = n - 1;
+        }
+        {
+            for (var i = 0; i < n; i = i + 1;) {}
+        }
+        {
+            if (n) var m = n;
+        }
+        return total;
+    }
+    """
+    program = Parser(Scanner(source).scan()).parse()
+    Resolver().resolve(program)
+    body = program.exprs[0].body
+    loop_body, for_block, if_block = body.exprs[1].body, body.exprs[2], body.exprs[3]
+    inner = loop_body.exprs[0]
+    assert loop_body.num_slots == 0 and inner.num_slots == 0
+    total = inner.exprs[0].expr.left
+    assert (total.depth, total.slot) == (0, 0), (total.depth, total.slot)
+    n = loop_body.exprs[1].expr.left
+    assert (n.depth, n.slot) == (1, 0), (n.depth, n.slot)
+    assert for_block.num_slots == 1 and if_block.num_slots == 1
+
+
+if __name__ == "__main__":
+    test_resolver()
@@ -0,0 +1,126 @@
+import argparse
+import logging
+from typing import Any, TextIO
+
+from cache import ProgramCache
+from closure_compiler import CompiledInterpreter
+from flat_ast import FlatInterpreter, FlatParser
+from interpreter import Interpreter
+from ir_interpreter import IRInterpreter
+from optimizer import optimize
+from parser import Parser, StreamingParser
+from scanner import BufferScanner, Scanner
+from source import Source
+from stack_interpreter import StackInterpreter
+from tok import Token
+from transpiler import TranspiledInterpreter
+from vm import VM
+
+logger = logging.getLogger(__name__)
+
+ENGINES = {
+    "tree": Interpreter,
+    "stack": StackInterpreter,
+    "closure": CompiledInterpreter,
+    "vm": VM,
+    "ir": IRInterpreter,
+    "python": TranspiledInterpreter,
+}
+
+
+def run_source(
+    source: str,
+    engine: str = "tree",
+    optimized: bool = False,
+    flat: bool = False,
+    cache_dir: str | None = None,
+    lazy: bool = False,
+) -> Any:
+    if cache_dir is not None:
+        assert engine in ENGINES, f"Unknown engine: {engine}"
+        assert not flat, "--cache-dir stores tree ASTs, not --flat ones"
+        assert not lazy, "--cache-dir stores eagerly parsed programs, not --lazy ones"
+        program = ProgramCache(cache_dir).get_or_parse(source, optimized)
+        return ENGINES[engine]().interpret(program)
+    return run_tokens(Scanner(source).scan(), engine, optimized, flat, lazy)
+
+
+def run_tokens(
+    tokens: list[Token],
+    engine: str = "tree",
+    optimized: bool = False,
+    flat: bool = False,
+    lazy: bool = False,
+) -> Any:
+    assert engine in ENGINES, f"Unknown engine: {engine}"
+    if flat:
+        assert engine == "tree" and not optimized, "--flat runs the plain tree engine"
+        return FlatInterpreter().interpret(FlatParser(tokens).parse())
+    program = Parser(tokens, lazy=lazy).parse()
+    if optimized:
+        program, report = optimize(program)
+        logger.info(f"Optimizer: {report}")
+        for change in report.changes:
+            logger.debug(change)
+    return ENGINES[engine]().interpret(program)
+
+
+def run_stream(stream: TextIO):
+    """Scans, parses and runs a script one top-level statement at a time."""
+    tokens = Scanner(stream).tokens()
+    Interpreter().interpret_stream(StreamingParser(tokens).statements())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run a tiny-interpreter script")
+    arg_parser.add_argument("path", help="path to the script")
+    arg_parser.add_argument(
+        "--engine", choices=sorted(ENGINES), default="tree", help="execution engine"
+    )
+    arg_parser.add_argument(
+        "--optimize", action="store_true", help="run the AST optimizer first"
+    )
+    arg_parser.add_argument(
+        "--flat", action="store_true", help="parse into and run a flat AST"
+    )
+    arg_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="run each top-level statement as soon as it is read (tree engine)",
+    )
+    arg_parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="scan the memory-mapped file into offset-based tokens",
+    )
+    arg_parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="parse each function body on its first call",
+    )
+    arg_parser.add_argument(
+        "--cache-dir", help="reuse parsed programs stored in this directory"
+    )
+    args = arg_parser.parse_args()
+    if args.mmap:
+        assert args.cache_dir is None, "--mmap scans tokens, --cache-dir skips them"
+        assert not args.stream, "--mmap scans the whole file before parsing"
+        # Tokens decode their text from the mapping, so it stays open for the run.
+        with Source.open(args.path) as source:
+            tokens = BufferScanner(source).scan()
+            run_tokens(tokens, args.engine, args.optimize, args.flat, args.lazy)
+        return
+    with open(args.path) as f:
+        if args.stream:
+            assert args.engine == "tree" and not (args.optimize or args.flat)
+            assert not args.lazy and args.cache_dir is None
+            run_stream(f)
+            return
+        source = f.read()
+    run_source(
+        source, args.engine, args.optimize, args.flat, args.cache_dir, args.lazy
+    )
+
+
+if __name__ == "__main__":
+    main()
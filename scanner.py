@@ -1,11 +1,253 @@
 from enum import Enum
 from dataclasses import dataclass
-from typing import Any
-from tok import KEYWORDS, Token, TokenType
+import re
+from typing import Any, Iterator, TextIO
+from source import Source
+from tok import KEYWORDS, TOKEN_CODES, SpanToken, SpanTokenList, Token, TokenType
 from utils import is_digit, is_alpha, is_alpha_digit
 
+# One alternative per token class, tried in order at every position. The
+# final `other` catches any character the language does not use, which the
+# scanner skips just like `CharScanner` does.
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>[ \t\r\n]+)
+  | (?P<comment>//[^\n]*)
+  | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<number>[0-9]+(?:\.[0-9]*)?)
+  | (?P<op>[!=<>]=|[(){},.\-+;*/@!=<>])
+  | (?P<string>"[^"]*")
+  | (?P<unterminated>")
+  | (?P<other>.)
+    """,
+    re.VERBOSE,
+)
+
+# Characters read at a time when scanning a text stream.
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+_OPERATORS: dict[str, TokenType] = {
+    "(": TokenType.LEFT_PAREN,
+    ")": TokenType.RIGHT_PAREN,
+    "{": TokenType.LEFT_BRACE,
+    "}": TokenType.RIGHT_BRACE,
+    ",": TokenType.COMMA,
+    ".": TokenType.DOT,
+    "-": TokenType.MINUS,
+    "+": TokenType.PLUS,
+    ";": TokenType.SEMICOLON,
+    "*": TokenType.STAR,
+    "/": TokenType.SLASH,
+    "@": TokenType.AT,
+    "!=": TokenType.BANG_EQUAL,
+    # Matches `CharScanner`, which scans a lone `!` as EQUAL.
+    "!": TokenType.EQUAL,
+    "==": TokenType.EQUAL_EQUAL,
+    "=": TokenType.EQUAL,
+    "<=": TokenType.LESS_EQUAL,
+    "<": TokenType.LESS,
+    ">=": TokenType.GREATER_EQUAL,
+    ">": TokenType.GREATER,
+}
+
 
 class Scanner:
+    """
+    Tokenizer driven by one compiled master regex: every match is a whole
+    token (or a run of whitespace / a comment, skipped without allocating a
+    token), numbers are parsed with `float()`. Produces the same tokens as
+    the character-at-a-time `CharScanner`.
+    """
+
+    def __init__(self, source: str | TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self._source = source
+        self._chunk_size = chunk_size
+
+    def scan(self) -> list[Token]:
+        return list(self.tokens())
+
+    def _chunks(self) -> Iterator[str]:
+        if isinstance(self._source, str):
+            yield self._source
+            return
+        read = self._source.read
+        while chunk := read(self._chunk_size):
+            yield chunk
+
+    def tokens(self) -> Iterator[Token]:
+        """
+        Yields tokens as the source is read. For a text stream, only the
+        current chunk plus an unfinished token carried over from the previous
+        one are held in memory.
+        """
+        lineno = 1
+        buffer = ""
+        chunks = self._chunks()
+        at_end = False
+        while not at_end:
+            chunk = next(chunks, None)
+            if chunk is None:
+                at_end = True
+            elif buffer:
+                buffer += chunk
+            else:
+                buffer = chunk
+            pos = 0
+            for match in _TOKEN_RE.finditer(buffer):
+                kind = match.lastgroup
+                if not at_end and (
+                    match.end() == len(buffer) or kind == "unterminated"
+                ):
+                    # The token may continue in the next chunk.
+                    break
+                pos = match.end()
+                if kind == "ws":
+                    lineno += buffer.count("\n", match.start(), pos)
+                elif kind == "identifier":
+                    lexeme = match.group()
+                    token_type = KEYWORDS.get(lexeme, TokenType.IDENTIFIER)
+                    yield Token(token_type, lexeme, None, lineno)
+                elif kind == "op":
+                    lexeme = match.group()
+                    yield Token(_OPERATORS[lexeme], lexeme, None, lineno)
+                elif kind == "number":
+                    lexeme = match.group()
+                    yield Token(TokenType.NUMBER, lexeme, float(lexeme), lineno)
+                elif kind == "string":
+                    lexeme = match.group()
+                    # Like `CharScanner`, a string token carries the line it ends on.
+                    lineno += lexeme.count("\n")
+                    yield Token(TokenType.STRING, lexeme, lexeme[1:-1], lineno)
+                elif kind == "unterminated":
+                    raise ValueError(f"Unterminated string at line {lineno}")
+            buffer = buffer[pos:]
+        yield Token(TokenType.EOF, "", None, lineno)
+
+    def spans(
+        self, pos: int = 0, lineno: int = 1
+    ) -> Iterator[tuple[Token, int, int]]:
+        """
+        Yields `(token, start, end)` for a `str` source, starting at offset
+        `pos` (a token boundary) on line `lineno`; no EOF token. Offsets let
+        `incremental.Document` re-scan just the edited part of a text.
+        """
+        text = self._source
+        assert isinstance(text, str), "spans() needs the whole text"
+        for match in _TOKEN_RE.finditer(text, pos):
+            kind = match.lastgroup
+            if kind == "ws":
+                lineno += text.count("\n", match.start(), match.end())
+                continue
+            if kind == "comment" or kind == "other":
+                continue
+            lexeme = match.group()
+            if kind == "identifier":
+                token_type = KEYWORDS.get(lexeme, TokenType.IDENTIFIER)
+                token = Token(token_type, lexeme, None, lineno)
+            elif kind == "op":
+                token = Token(_OPERATORS[lexeme], lexeme, None, lineno)
+            elif kind == "number":
+                token = Token(TokenType.NUMBER, lexeme, float(lexeme), lineno)
+            elif kind == "string":
+                lineno += lexeme.count("\n")
+                token = Token(TokenType.STRING, lexeme, lexeme[1:-1], lineno)
+            else:
+                raise ValueError(f"Unterminated string at line {lineno}")
+            yield token, match.start(), match.end()
+
+
+def _build_bytes_token_re() -> tuple[re.Pattern, dict[str, TokenType]]:
+    """
+    Bytes counterpart of `_TOKEN_RE` with one group per keyword and operator,
+    so the token type comes from `lastgroup` without slicing the lexeme.
+    """
+    alternatives = [rb"(?P<ws>[ \t\r\n]+)", rb"(?P<comment>//[^\n]*)"]
+    group_types = {}
+    for idx, (keyword, token_type) in enumerate(KEYWORDS.items()):
+        group = f"kw{idx}"
+        alternatives.append(
+            b"(?P<%s>%s(?![A-Za-z0-9_]))" % (group.encode(), keyword.encode())
+        )
+        group_types[group] = token_type
+    alternatives.append(rb"(?P<identifier>[A-Za-z_][A-Za-z0-9_]*)")
+    alternatives.append(rb"(?P<number>[0-9]+(?:\.[0-9]*)?)")
+    group_types["identifier"] = TokenType.IDENTIFIER
+    group_types["number"] = TokenType.NUMBER
+    # Two-character operators first.
+    operators = sorted(_OPERATORS.items(), key=lambda item: -len(item[0]))
+    for idx, (lexeme, token_type) in enumerate(operators):
+        group = f"op{idx}"
+        alternatives.append(
+            b"(?P<%s>%s)" % (group.encode(), re.escape(lexeme.encode()))
+        )
+        group_types[group] = token_type
+    alternatives.append(rb'(?P<string>"[^"]*")')
+    alternatives.append(rb'(?P<unterminated>")')
+    alternatives.append(rb"(?P<other>.)")
+    group_types["string"] = TokenType.STRING
+    return re.compile(b"|".join(alternatives)), group_types
+
+
+_BYTES_TOKEN_RE, _GROUP_TYPES = _build_bytes_token_re()
+
+
+class BufferScanner:
+    """
+    Zero-copy scanner over a `Source` (e.g. an `mmap`-ed file). Tokens are
+    offsets into the shared buffer; lines come from the source's line-start
+    index instead of counting newlines per token. `scan()` packs them into a
+    `SpanTokenList`, `tokens()` yields `SpanToken`s one by one. Produces the
+    same token stream as `Scanner` on the decoded text.
+    """
+
+    def __init__(self, source: Source):
+        self._source = source
+
+    def scan(self) -> SpanTokenList:
+        tokens = SpanTokenList(self._source)
+        types, starts = tokens.types.append, tokens.starts.append
+        lengths, lines = tokens.lengths.append, tokens.lines.append
+        for token_type, start, end, lineno in self._spans():
+            types(TOKEN_CODES[token_type])
+            starts(start)
+            lengths(end - start)
+            lines(lineno)
+        return tokens
+
+    def tokens(self) -> Iterator[SpanToken]:
+        source = self._source
+        for token_type, start, end, lineno in self._spans():
+            yield SpanToken(token_type, start, end, lineno, source)
+
+    def _spans(self) -> Iterator[tuple[TokenType, int, int, int]]:
+        source = self._source
+        line_starts = source.line_starts
+        num_lines = len(line_starts)
+        lineno = 1
+        group_types = _GROUP_TYPES
+        for match in _BYTES_TOKEN_RE.finditer(source.data):
+            token_type = group_types.get(match.lastgroup)
+            if token_type is None:
+                if match.lastgroup == "unterminated":
+                    line, _ = source.position(match.start())
+                    raise ValueError(f"Unterminated string at line {line}")
+                continue
+            start, end = match.span()
+            # Like `CharScanner`, a string token carries the line it ends on.
+            last = end - 1 if token_type is TokenType.STRING else start
+            while lineno < num_lines and line_starts[lineno] <= last:
+                lineno += 1
+            yield token_type, start, end, lineno
+        end = len(source)
+        yield TokenType.EOF, end, end, num_lines
+
+
+class CharScanner:
+    """
+    Original character-at-a-time scanner, kept as the reference that
+    `Scanner` is tested against.
+    """
+
     def __init__(self, source: str):
         self._start = 0
         self._cur = 0
@@ -103,6 +345,8 @@ class Scanner:
                 return self._gen_token(TokenType.SEMICOLON)
             case "*":
                 return self._gen_token(TokenType.STAR)
+            case "@":
+                return self._gen_token(TokenType.AT)
             case "!":
                 if self._match("="):
                     return self._gen_token(TokenType.BANG_EQUAL)
@@ -154,6 +398,8 @@ class Scanner:
 
 
 def test_scan():
+    import io
+
     source = """
     // this is a comment
     (()) {} // groups
@@ -168,6 +414,27 @@ def test_scan():
     print(f"Scanner: {len(tokens)} tokens")
     for i, token in enumerate(tokens):
         print(f"{i}: {token}")
+    assert tokens == CharScanner(source).scan()
+
+    # The regex scanner must match the reference token for token.
+    for source in (
+        'var a = 1.5; if a >= 2 { print "multi\nline" + "x"; } // tail',
+        "a!=b != !c == 3. <= 1.25.7 # $ _x1\r\n\t@memo\ndef f(){}",
+        "",
+        "// only a comment",
+    ):
+        assert Scanner(source).scan() == CharScanner(source).scan(), source
+        # Offset tokens over the encoded bytes decode to the same stream.
+        scanner = BufferScanner(Source(source.encode()))
+        for span_tokens in (scanner.scan(), scanner.tokens()):
+            assert [
+                Token(t.token_type, t.lexeme, t.literal, t.lineno) for t in span_tokens
+            ] == CharScanner(source).scan(), source
+        # Tokens may straddle chunk boundaries of a stream.
+        for chunk_size in (1, 3, 7):
+            stream = io.StringIO(source)
+            tokens = Scanner(stream, chunk_size=chunk_size).scan()
+            assert tokens == CharScanner(source).scan(), (source, chunk_size)
 
 
 def main():
@@ -0,0 +1,89 @@
+from array import array
+from bisect import bisect_right
+import mmap
+import re
+
+_NEWLINE_RE = re.compile(rb"\n")
+
+
+class Source:
+    """
+    Script text as a shared byte buffer, typically a read-only `mmap` of the
+    file. Tokens refer to it by offsets (`tok.SpanToken`) and decode their
+    text only on demand.
+
+    `line_starts[i]` is the offset where line `i + 1` begins, so `position()`
+    maps an offset to a (line, column) pair with one binary search.
+    """
+
+    def __init__(self, data: bytes | mmap.mmap, name: str = "<source>"):
+        self.data = data
+        self.name = name
+        self.line_starts = array("q", [0])
+        self.line_starts.extend(match.end() for match in _NEWLINE_RE.finditer(data))
+        self._mmap = data if isinstance(data, mmap.mmap) else None
+
+    @classmethod
+    def open(cls, path: str) -> "Source":
+        with open(path, "rb") as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped.
+                data = b""
+        return cls(data, name=path)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self) -> "Source":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def num_lines(self) -> int:
+        return len(self.line_starts)
+
+    def text(self, start: int, end: int) -> str:
+        return str(self.data[start:end], "utf-8")
+
+    def position(self, offset: int) -> tuple[int, int]:
+        """1-based (line, column) of a byte offset."""
+        line = bisect_right(self.line_starts, offset)
+        return line, offset - self.line_starts[line - 1] + 1
+
+
+def test_source():
+    import os
+    import tempfile
+
+    print("-" * 80)
+    print("Testing source")
+    source = Source(b"var a;\n\nprint a;\n")
+    assert source.num_lines == 4
+    assert source.position(0) == (1, 1)
+    assert source.position(7) == (2, 1)
+    assert source.position(14) == (3, 7)
+    assert source.text(8, 13) == "print"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "script.txt")
+        with open(path, "wb") as f:
+            f.write("print \"héllo\";\n".encode())
+        with Source.open(path) as source:
+            assert isinstance(source.data, mmap.mmap)
+            assert source.text(6, 14) == '"héllo"'
+        path = os.path.join(tmp, "empty.txt")
+        open(path, "wb").close()
+        with Source.open(path) as source:
+            assert len(source) == 0 and source.num_lines == 1
+
+
+if __name__ == "__main__":
+    test_source()
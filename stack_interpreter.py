@@ -0,0 +1,414 @@
+from typing import Any, Callable, Generator
+
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    UnaryExpr,
+    WhileStmt,
+)
+from func import Func
+from interface import Expr
+from interpreter import Interpreter, Signal, binary_op, unary_op
+from memo import DEFAULT_MEMO_MAX_BYTES, MISSING
+from purity import analyze_purity
+from resolver import Resolver
+from tok import TokenType
+from utils import color_print
+
+# Default cap on the memory held by pending evaluations.
+DEFAULT_STACK_MAX_BYTES = 256 << 20
+
+# Rough size of one pending evaluation: a suspended generator with its frame
+# and locals, plus the share of call frames and block scopes it keeps alive.
+_CONTINUATION_BYTES = 512
+
+# Evaluates a node: yields child nodes, receives their values and returns
+# its own.
+Evaluation = Generator[Expr, Any, Any]
+
+
+class StackInterpreter(Interpreter):
+    """
+    Tree-walking evaluator that never recurses in Python.
+
+    Each node is evaluated by a generator that yields the child nodes it
+    needs and is sent back their values. `interpret()` drives the generators
+    from one loop over an explicit stack, so a script's nesting and call
+    depth only cost heap memory: evaluation stops with `RecursionError` once
+    the pending generators would take more than `max_stack_bytes`. Literals
+    and `def`s are evaluated inline without a generator.
+
+    Calls, scopes, inline caches, memoization and the RETURN / TAIL_CALL
+    signals work as in `Interpreter`. Nodes are not quickened, calls are not
+    inlined and counted `for` loops take no fast path: specialized variants,
+    inlined bodies and the `range` loop evaluate their operands recursively.
+    """
+
+    def __init__(
+        self,
+        memoize: bool = True,
+        memo_max_bytes: int = DEFAULT_MEMO_MAX_BYTES,
+        max_stack_bytes: int = DEFAULT_STACK_MAX_BYTES,
+    ):
+        super().__init__(
+            memoize, memo_max_bytes, quicken=False, inline=False, counted_loops=False
+        )
+        self.max_stack_bytes = max_stack_bytes
+        self._leaves: dict[type, Callable[[Any], Any]] = {
+            LiteralExpr: self.visit_literal_expr,
+            FuncDecl: self.visit_func_decl,
+        }
+        self._evaluators: dict[type, Callable[[Any], Evaluation]] = {
+            UnaryExpr: self._eval_unary,
+            BinaryExpr: self._eval_binary,
+            GroupingExpr: self._eval_grouping,
+            PrintStmt: self._eval_print,
+            DeclStmt: self._eval_decl,
+            AssignStmt: self._eval_assign,
+            Block: self._eval_block,
+            Program: self._eval_program,
+            IfStmt: self._eval_if,
+            WhileStmt: self._eval_while,
+            ForStmt: self._eval_for,
+            FuncCall: self._eval_func_call,
+            ReturnStmt: self._eval_return,
+            LazyBody: self._eval_lazy_body,
+        }
+
+    def interpret(self, expr: Expr) -> Any:
+        leaves, evaluators = self._leaves, self._evaluators
+        leaf = leaves.get(expr.__class__)
+        if leaf is not None:
+            return leaf(expr)
+        max_depth = max(1, self.max_stack_bytes // _CONTINUATION_BYTES)
+        stack = [evaluators[expr.__class__](expr)]
+        value = None
+        error = None
+        while True:
+            evaluation = stack[-1]
+            try:
+                if error is None:
+                    child = evaluation.send(value)
+                else:
+                    # Unwinds like a Python exception: each pending
+                    # evaluation may handle it or clean up in `finally`.
+                    child = evaluation.throw(error)
+                    error = None
+            except StopIteration as stop:
+                stack.pop()
+                if not stack:
+                    return stop.value
+                value = stop.value
+                continue
+            except BaseException as exc:
+                stack.pop()
+                if not stack:
+                    raise
+                error = exc
+                continue
+            leaf = leaves.get(child.__class__)
+            if leaf is not None:
+                try:
+                    value = leaf(child)
+                except BaseException as exc:
+                    error = exc
+                continue
+            if len(stack) >= max_depth:
+                error = RecursionError(
+                    f"Evaluation needs more than {self.max_stack_bytes} bytes of stack"
+                )
+                continue
+            stack.append(evaluators[child.__class__](child))
+            value = None
+
+    def _eval_unary(self, expr: "UnaryExpr") -> Evaluation:
+        val = yield expr.right
+        return unary_op(expr.op.token_type, val)
+
+    def _eval_binary(self, expr: "BinaryExpr") -> Evaluation:
+        op_type = expr.op.token_type
+        left_val = yield expr.left
+        if op_type == TokenType.AND:
+            return (yield expr.right) if left_val else False
+        if op_type == TokenType.OR:
+            return left_val if left_val else (yield expr.right)
+        right_val = yield expr.right
+        return binary_op(op_type, left_val, right_val)
+
+    def _eval_grouping(self, expr: "GroupingExpr") -> Evaluation:
+        return (yield expr.expr)
+
+    def _eval_print(self, stmt: "PrintStmt") -> Evaluation:
+        val = yield stmt.expr
+        print(color_print(f"[interpreter] {val}", "yellow"))
+
+    def _eval_decl(self, stmt: "DeclStmt") -> Evaluation:
+        val = None if stmt.expr is None else (yield stmt.expr)
+        if stmt.slot is None:
+            self._state.define(stmt.name.lexeme, val)
+        else:
+            self._state.define_at(stmt.slot, val)
+
+    def _eval_assign(self, stmt: "AssignStmt") -> Evaluation:
+        val = yield stmt.expr
+        if stmt.depth is None:
+            self._state.assign(stmt.name.lexeme, val)
+        else:
+            self._state.assign_at(stmt.depth, stmt.slot, val)
+
+    def _eval_block(self, block: "Block") -> Evaluation:
+        if block.num_slots:
+            yield from self._eval_block_in(block, [None] * block.num_slots)
+            return
+        # Declares nothing, so the resolver gave it no scope.
+        for stmt in block.exprs:
+            yield stmt
+            if self._signal is not None:
+                break
+
+    def _eval_block_in(self, block: "Block", scope: list[Any]) -> Evaluation:
+        scopes = self._state.env_list[-1].scopes
+        scopes.append(scope)
+        try:
+            for stmt in block.exprs:
+                yield stmt
+                if self._signal is not None:
+                    break
+        finally:
+            scopes.pop()
+
+    def _eval_program(self, program: "Program") -> Evaluation:
+        if not program.resolved:
+            Resolver().resolve(program)
+        if self._memoize:
+            analyze_purity(program)
+        for stmt in program.exprs:
+            yield stmt
+
+    def _eval_if(self, stmt: "IfStmt") -> Evaluation:
+        if (yield stmt.condition):
+            yield stmt.then_branch
+        elif stmt.else_branch is not None:
+            yield stmt.else_branch
+
+    def _eval_while(self, stmt: "WhileStmt") -> Evaluation:
+        body = stmt.body
+        # One scope per loop for a declaring body block, as in `Interpreter`.
+        scope = self._loop_scope(body)
+        cleared = None if scope is None else scope.copy()
+        while (yield stmt.condition):
+            if scope is None:
+                yield body
+            else:
+                scope[:] = cleared
+                yield from self._eval_block_in(body, scope)
+            if self._signal is not None:
+                break
+
+    def _eval_for(self, stmt: "ForStmt") -> Evaluation:
+        yield stmt.init
+        body = stmt.body
+        scope = self._loop_scope(body)
+        cleared = None if scope is None else scope.copy()
+        while (yield stmt.condition):
+            if scope is None:
+                yield body
+            else:
+                scope[:] = cleared
+                yield from self._eval_block_in(body, scope)
+            if self._signal is not None:
+                break
+            yield stmt.update
+
+    def _eval_lazy_body(self, body: "LazyBody") -> Evaluation:
+        return (yield body.materialize())
+
+    def _eval_call_args(self, expr: "FuncCall") -> Generator[Expr, Any, tuple]:
+        func = self._lookup_callee(expr)
+        frame = self._state.new_frame(len(expr.args))
+        params = frame.scopes[0]
+        for slot, arg in enumerate(expr.args):
+            params[slot] = yield arg
+        return func, frame
+
+    def _eval_func_call(self, expr: "FuncCall") -> Evaluation:
+        func, frame = yield from self._eval_call_args(expr)
+        state = self._state
+        pending = []
+        while True:
+            cache = func.cache if func.__class__ is Func else None
+            if cache is not None:
+                key = cache.make_key(frame.scopes[0])
+                if key is not None:
+                    res = cache.get(key)
+                    if res is not MISSING:
+                        self.memo_hits += 1
+                        state.release_frame(frame)
+                        break
+                    self.memo_misses += 1
+                    pending.append((cache, key))
+            state.push_frame(frame)
+            try:
+                if isinstance(func, Func):
+                    res = yield func.body
+                else:
+                    res = func(self)
+            finally:
+                state.pop_frame()
+            if self._signal is Signal.TAIL_CALL:
+                self._signal = None
+                (func, frame), self._tail_call = self._tail_call, None
+                continue
+            if self._signal is Signal.RETURN:
+                self._signal = None
+                res, self._return_value = self._return_value, None
+            break
+        for cache, key in pending:
+            cache.put(key, res)
+        return res
+
+    def _eval_return(self, stmt: "ReturnStmt") -> Evaluation:
+        if len(self._state.env_list) == 1:
+            raise ValueError("Return outside of a function")
+        expr = stmt.expr
+        while isinstance(expr, GroupingExpr):
+            expr = expr.expr
+        if isinstance(expr, FuncCall) and expr.tail:
+            self._tail_call = yield from self._eval_call_args(expr)
+            self._signal = Signal.TAIL_CALL
+            return
+        res = None
+        if stmt.expr is not None:
+            res = yield stmt.expr
+        self._return_value = res
+        self._signal = Signal.RETURN
+
+
+def test_stack_interpreter():
+    import contextlib
+    import io
+
+    from parser import Parser
+    from scanner import Scanner
+
+    sources = [
+        """
+        var a = 1;
+        var b = 2;
+        print a + b;
+        {
+            var a = 4;
+            print a + b;
+        }
+        print (a + 2) * 3 / 4 - 1;
+        print "con" + "cat";
+        print a > b or a < b;
+        print a > b and a < b;
+        print -a;
+        """,
+        """
+        var itr = 0;
+        while (itr < 5) {
+            var sq = itr * itr;
+            if sq > 4 {
+                print sq;
+            } else {
+                print -sq;
+            }
+            itr = itr + 1;
+        }
+        for (var i = 0; i < 3; i = i + 1;) {
+            print i == 1;
+        }
+        """,
+        """
+        def fib(n) {
+            if (n <= 1) {
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+        def first_over(limit) {
+            for (var i = 0; i < 100; i = i + 1;) {
+                if i * i > limit {
+                    return i;
+                }
+            }
+            return -1;
+        }
+        def sum_to(n, acc) {
+            if (n <= 0) {
+                return acc;
+            }
+            return sum_to(n - 1, acc + n);
+        }
+        def mix(fn1, a, b) {
+            def twice(x) {
+                return x * 2;
+            }
+            print twice(fn1(a, b));
+        }
+        print fib(15);
+        print first_over(50);
+        print sum_to(5000, 0);
+        mix(sum_to, 3, 0);
+        """,
+    ]
+    for source in sources:
+        print("-" * 80)
+        print(f"Testing source: {source}")
+        outputs = []
+        for engine in (Interpreter, StackInterpreter):
+            program = Parser(Scanner(source).scan()).parse()
+            buf = io.StringIO()
+            with contextlib.redirect_stdout(buf):
+                engine().interpret(program)
+            outputs.append(buf.getvalue())
+        print(outputs[1], end="")
+        assert outputs[0] == outputs[1], f"Stack output differs:\n{outputs}"
+
+    # Non-tail recursion far deeper than the Python stack allows.
+    source = """
+    def down(n) {
+        if (n == 0) {
+            return 0;
+        }
+        return 1 + down(n - 1);
+    }
+    print down(20000);
+    """
+    program = Parser(Scanner(source).scan()).parse()
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        StackInterpreter(memoize=False).interpret(program)
+    assert "20000.0" in buf.getvalue(), buf.getvalue()
+
+    # Past the memory budget evaluation unwinds with `RecursionError` and
+    # leaves the interpreter usable.
+    interpreter = StackInterpreter(memoize=False, max_stack_bytes=64 << 10)
+    try:
+        interpreter.interpret(program)
+    except RecursionError:
+        pass
+    else:
+        assert False, "Expected the stack budget to run out"
+    assert len(interpreter._state.env_list) == 1
+    tokens = Scanner("print down(10);").scan()
+    with contextlib.redirect_stdout(buf):
+        interpreter.interpret(Parser(tokens).parse())
+
+
+if __name__ == "__main__":
+    test_stack_interpreter()
@@ -1,7 +1,26 @@
 from printer import test_ast_printer
 from parser import test_parser
 from scanner import test_scan
+from source import test_source
+from resolver import test_resolver
+from optimizer import test_optimizer
+from ir import test_ir
+from ir_passes import test_ir_passes
+from ir_interpreter import test_ir_interpreter
+from cache import test_cache
+from incremental import test_incremental
+from purity import test_purity
+from inliner import test_inliner
+from counted_loop import test_counted_loop
+from memo import test_memo
+from quicken import test_quicken
 from interpreter import test_interpreter
+from stack_interpreter import test_stack_interpreter
+from flat_ast import test_flat_ast
+from closure_compiler import test_closure_compiler
+from compiler import test_compiler
+from vm import test_vm
+from transpiler import test_transpiler
 from utils import color_print
 
 def test_all_runnable():
@@ -11,6 +30,10 @@ def test_all_runnable():
     print(color_print("Test scanner...", "green"))
     test_scan()
 
+    print("-" * 80)
+    print(color_print("Test source...", "green"))
+    test_source()
+
     print("-" * 80)
     print(color_print("Test printer...", "green"))
     test_ast_printer()
@@ -19,10 +42,82 @@ def test_all_runnable():
     print(color_print("Test parser...", "green"))
     test_parser()
 
+    print("-" * 80)
+    print(color_print("Test resolver...", "green"))
+    test_resolver()
+
+    print("-" * 80)
+    print(color_print("Test optimizer...", "green"))
+    test_optimizer()
+
+    print("-" * 80)
+    print(color_print("Test IR lowering...", "green"))
+    test_ir()
+
+    print("-" * 80)
+    print(color_print("Test IR passes...", "green"))
+    test_ir_passes()
+
+    print("-" * 80)
+    print(color_print("Test IR interpreter...", "green"))
+    test_ir_interpreter()
+
+    print("-" * 80)
+    print(color_print("Test program cache...", "green"))
+    test_cache()
+
+    print("-" * 80)
+    print(color_print("Test incremental re-parsing...", "green"))
+    test_incremental()
+
+    print("-" * 80)
+    print(color_print("Test purity analysis...", "green"))
+    test_purity()
+
+    print("-" * 80)
+    print(color_print("Test inlining analysis...", "green"))
+    test_inliner()
+
+    print("-" * 80)
+    print(color_print("Test counted-loop recognition...", "green"))
+    test_counted_loop()
+
+    print("-" * 80)
+    print(color_print("Test memo cache...", "green"))
+    test_memo()
+
+    print("-" * 80)
+    print(color_print("Test quickening...", "green"))
+    test_quicken()
+
     print("-" * 80)
     print(color_print("Test interpreter...", "green"))
     test_interpreter()
 
+    print("-" * 80)
+    print(color_print("Test stack interpreter...", "green"))
+    test_stack_interpreter()
+
+    print("-" * 80)
+    print(color_print("Test flat AST...", "green"))
+    test_flat_ast()
+
+    print("-" * 80)
+    print(color_print("Test closure compiler...", "green"))
+    test_closure_compiler()
+
+    print("-" * 80)
+    print(color_print("Test compiler...", "green"))
+    test_compiler()
+
+    print("-" * 80)
+    print(color_print("Test vm...", "green"))
+    test_vm()
+
+    print("-" * 80)
+    print(color_print("Test transpiler...", "green"))
+    test_transpiler()
+
 
 def main():
     test_all_runnable()
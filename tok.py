@@ -1,6 +1,11 @@
+from array import array
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any
+import sys
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from source import Source
 
 
 class TokenType(Enum):
@@ -15,6 +20,7 @@ class TokenType(Enum):
     SEMICOLON = ";"
     SLASH = "/"
     STAR = "*"
+    AT = "@"
     # One or two character tokens.
     BANG = "!"
     BANG_EQUAL = "!="
@@ -70,12 +76,124 @@ KEYWORDS: dict[str, TokenType] = {
     "debug": TokenType.DEBUG,
 }
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     token_type: TokenType
     lexeme: str
     literal: Any
     lineno: int
 
+    def __reduce__(self):
+        return Token, (self.token_type, self.lexeme, self.literal, self.lineno)
+
     def __str__(self) -> str:
-        return f"[{self.token_type}] {self.lexeme=}, {self.literal=} {self.lineno=}"
\ No newline at end of file
+        return f"[{self.token_type}] {self.lexeme=}, {self.literal=} {self.lineno=}"
+
+
+_UNSET = object()
+
+
+class SpanToken:
+    """
+    Token that refers to its text by offset into a shared `Source` instead of
+    holding a copied lexeme. Text is decoded on demand; an identifier's name
+    (interned) or a number/string literal is kept after the first access.
+    The source must stay open while the tokens (and the AST holding them)
+    are in use.
+
+    Only `start` is stored as a full int: the length is almost always a
+    small, shared int object and the line number object is shared by every
+    token on the line.
+    """
+
+    __slots__ = ("token_type", "start", "length", "lineno", "source", "_value")
+
+    def __init__(
+        self, token_type: TokenType, start: int, end: int, lineno: int, source: "Source"
+    ):
+        self.token_type = token_type
+        self.start = start
+        self.length = end - start
+        self.lineno = lineno
+        self.source = source
+        self._value = _UNSET
+
+    @property
+    def end(self) -> int:
+        return self.start + self.length
+
+    @property
+    def lexeme(self) -> str:
+        if self.token_type != TokenType.IDENTIFIER:
+            return self.source.text(self.start, self.end)
+        if self._value is _UNSET:
+            self._value = sys.intern(self.source.text(self.start, self.end))
+        return self._value
+
+    @property
+    def literal(self) -> Any:
+        if self._value is _UNSET:
+            if self.token_type == TokenType.NUMBER:
+                self._value = float(self.source.data[self.start : self.end])
+            elif self.token_type == TokenType.STRING:
+                self._value = self.source.text(self.start + 1, self.end - 1)
+            else:
+                return None
+        if self.token_type == TokenType.IDENTIFIER:
+            return None
+        return self._value
+
+    def __str__(self) -> str:
+        line, column = self.source.position(self.start)
+        return f"[{self.token_type}] {self.lexeme=}, {self.literal=} at {line}:{column}"
+
+
+_TOKEN_TYPES = list(TokenType)
+TOKEN_CODES = {token_type: code for code, token_type in enumerate(_TOKEN_TYPES)}
+
+
+class SpanTokenList:
+    """
+    Scanned tokens of a `Source` as columns (type code, start, length, line)
+    rather than one object per token. Indexing creates a `SpanToken` view on
+    demand, so only the tokens kept by the AST (names, literals, operators)
+    ever exist as objects. Supports the `len()`/`[]` access `Parser` uses.
+    """
+
+    def __init__(self, source: "Source"):
+        self.source = source
+        self.types = array("B")
+        self.starts = array("q")
+        self.lengths = array("I")
+        self.lines = array("i")
+        # The parser peeks at the same token several times before consuming
+        # it, so the last view is reused.
+        self._last_idx = -1
+        self._last: SpanToken | None = None
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def __getitem__(self, idx: int) -> SpanToken:
+        if idx == self._last_idx:
+            return self._last
+        start = self.starts[idx]
+        token = SpanToken(
+            _TOKEN_TYPES[self.types[idx]],
+            start,
+            start + self.lengths[idx],
+            self.lines[idx],
+            self.source,
+        )
+        self._last_idx, self._last = idx, token
+        return token
+
+    def __iter__(self):
+        for idx in range(len(self.types)):
+            yield self[idx]
+
+    def append(self, token_type: TokenType, start: int, end: int, lineno: int):
+        self.types.append(TOKEN_CODES[token_type])
+        self.starts.append(start)
+        self.lengths.append(end - start)
+        self.lines.append(lineno)
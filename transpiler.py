@@ -0,0 +1,473 @@
+from collections import OrderedDict
+import hashlib
+from types import CodeType
+from typing import Any, Callable
+
+from func import NativeFunc, build_native_func_sleep, build_native_func_time
+from interface import Expr, Visitor
+from expr import (
+    AssignStmt,
+    BinaryExpr,
+    Block,
+    DeclStmt,
+    ForStmt,
+    FuncCall,
+    FuncDecl,
+    GroupingExpr,
+    IfStmt,
+    LazyBody,
+    LiteralExpr,
+    PrintStmt,
+    Program,
+    ReturnStmt,
+    STATEMENT_TYPES,
+    UnaryExpr,
+    WhileStmt,
+)
+from interpreter import add_values, div_values, mul_values, sub_values
+from tok import TokenType
+from utils import color_print
+
+_COMPARE_OPS = {
+    TokenType.EQUAL_EQUAL: "==",
+    TokenType.BANG_EQUAL: "!=",
+    TokenType.GREATER: ">",
+    TokenType.GREATER_EQUAL: ">=",
+    TokenType.LESS: "<",
+    TokenType.LESS_EQUAL: "<=",
+}
+
+_MATH_OPS = {
+    TokenType.PLUS: ("+", "_add"),
+    TokenType.MINUS: ("-", "_sub"),
+    TokenType.STAR: ("*", "_mul"),
+    TokenType.SLASH: ("/", "_div"),
+}
+
+# Most code objects kept by `compile_program()`.
+CODE_CACHE_MAX_ENTRIES = 256
+
+# Code objects keyed by the sha256 of the generated Python source, least
+# recently used first.
+_CODE_CACHE: OrderedDict[str, CodeType] = OrderedDict()
+
+
+########################################################
+# Runtime helpers, the slow paths of the generated code
+########################################################
+# `_add`/`_sub`/`_mul`/`_div` are `interpreter`'s checked arithmetic helpers.
+
+
+def _neg(val: Any) -> Any:
+    assert isinstance(val, float), f"UnaryExpr: {val} is not a number"
+    return -val
+
+
+def _not(val: Any) -> Any:
+    assert isinstance(val, bool), f"UnaryExpr: {val} is not a boolean"
+    return not val
+
+
+def _undefined(name: str):
+    raise ValueError(f"Undefined variable: {name}")
+
+
+class Transpiler(Visitor):
+    """
+    Emits Python source for a whole Program.
+
+    The generated module defines `__program__(G)`, where `G` is the globals
+    table. Block and function locals become Python locals, renamed so that
+    every declaration gets its own name; functions become nested `def`s taking
+    `G` as their first argument. Arithmetic keeps the tree-walker's type
+    checks via an inline float fast path and the `_add`/`_sub`/... helpers.
+
+    Calls are plain Python calls, so calling a non-function or passing the
+    wrong number of arguments raises `TypeError` instead of `AssertionError`.
+    """
+
+    def __init__(self):
+        self._lines: list[str] = []
+        self._indent = 0
+        self._scopes: list[dict[str, str]] = []
+        self._counter = 0
+        self._func_depth = 0
+
+    def transpile(self, expr: Expr) -> str:
+        self._emit("def __program__(G):")
+        self._indent += 1
+        start = len(self._lines)
+        self._statement(expr)
+        if len(self._lines) == start:
+            self._emit("pass")
+        self._indent -= 1
+        return "\n".join(self._lines) + "\n"
+
+    def _emit(self, line: str):
+        self._lines.append("    " * self._indent + line)
+
+    def _fresh(self, prefix: str, name: str = "") -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}_{name}" if name else f"{prefix}{self._counter}"
+
+    def _statement(self, stmt: Expr):
+        if isinstance(stmt, STATEMENT_TYPES):
+            stmt.accept(self)
+        else:
+            self._emit(stmt.accept(self))
+
+    def _body(self, stmt: Expr):
+        self._indent += 1
+        start = len(self._lines)
+        self._statement(stmt)
+        if len(self._lines) == start:
+            self._emit("pass")
+        self._indent -= 1
+
+    ########################################################
+    # Names
+    ########################################################
+    def _declare(self, name: str) -> str | None:
+        if not self._scopes:
+            return None
+        scope = self._scopes[-1]
+        if name in scope:
+            raise ValueError(f"Variable already defined: {name}")
+        scope[name] = self._fresh("v", name)
+        return scope[name]
+
+    def _lookup(self, name: str) -> str | None:
+        for scope in reversed(self._scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def _load(self, name: str) -> str:
+        local = self._lookup(name)
+        return local if local is not None else f"G[{name!r}]"
+
+    def _store(self, name: str, value: str, define: bool):
+        local = self._declare(name) if define else self._lookup(name)
+        if local is not None:
+            self._emit(f"{local} = {value}")
+            return
+        self._emit(f"_v = {value}")
+        if define:
+            self._emit(f"assert {name!r} not in G, 'Variable already defined: {name}'")
+        else:
+            self._emit(f"if {name!r} not in G: _undefined({name!r})")
+        self._emit(f"G[{name!r}] = _v")
+
+    ########################################################
+    # Expressions
+    ########################################################
+    def visit_literal_expr(self, expr: "LiteralExpr"):
+        token = expr.value
+        if token.token_type == TokenType.IDENTIFIER:
+            return self._load(token.lexeme)
+        value = token.literal
+        if isinstance(value, float) and value in (float("inf"), float("-inf")):
+            return f"float({str(value)!r})"
+        return repr(value)
+
+    def visit_unary_expr(self, expr: "UnaryExpr"):
+        right = expr.right.accept(self)
+        match expr.op.token_type:
+            case TokenType.MINUS:
+                tmp = self._fresh("_t")
+                return f"(-{tmp} if ({tmp} := {right}).__class__ is float else _neg({tmp}))"
+            case TokenType.BANG:
+                return f"_not({right})"
+        assert False, f"UnaryExpr: {expr.op.token_type} is not accepted"
+
+    def _operand(self, expr: Expr, code: str) -> tuple[str, str]:
+        # Locals and constants can be read twice; anything else is evaluated
+        # once into a temporary by the type guard.
+        if isinstance(expr, LiteralExpr):
+            if expr.value.token_type != TokenType.IDENTIFIER:
+                return f"({code})", code
+            if self._lookup(expr.value.lexeme) is not None:
+                return code, code
+        tmp = self._fresh("_t")
+        return f"({tmp} := {code})", tmp
+
+    def visit_binary_expr(self, expr: "BinaryExpr"):
+        op = expr.op.token_type
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if op == TokenType.AND:
+            return f"(({right}) if ({left}) else False)"
+        if op == TokenType.OR:
+            return f"(({left}) or ({right}))"
+        if op in _COMPARE_OPS:
+            return f"(({left}) {_COMPARE_OPS[op]} ({right}))"
+        assert op in _MATH_OPS, f"BinaryExpr: {op} is not handled"
+        py_op, helper = _MATH_OPS[op]
+        left_setup, lhs = self._operand(expr.left, left)
+        right_setup, rhs = self._operand(expr.right, right)
+        if (
+            isinstance(expr.right, LiteralExpr)
+            and expr.right.value.literal.__class__ is float
+        ):
+            guard = f"{left_setup}.__class__ is float"
+        else:
+            guard = f"{left_setup}.__class__ is {right_setup}.__class__ is float"
+        return f"({lhs} {py_op} {rhs} if {guard} else {helper}({lhs}, {rhs}))"
+
+    def visit_grouping_expr(self, expr: "GroupingExpr"):
+        return expr.expr.accept(self)
+
+    def visit_func_call(self, expr: "FuncCall"):
+        callee = self._load(expr.name.lexeme)
+        args = ", ".join(["G"] + [arg.accept(self) for arg in expr.args])
+        return f"{callee}({args})"
+
+    ########################################################
+    # Statements
+    ########################################################
+    def visit_print_stmt(self, stmt: "PrintStmt"):
+        self._emit(f"_print({stmt.expr.accept(self)})")
+
+    def visit_decl_stmt(self, stmt: "DeclStmt"):
+        value = "None" if stmt.expr is None else stmt.expr.accept(self)
+        self._store(stmt.name.lexeme, value, define=True)
+
+    def visit_assign_stmt(self, stmt: "AssignStmt"):
+        self._store(stmt.name.lexeme, stmt.expr.accept(self), define=False)
+
+    def visit_block(self, block: "Block"):
+        self._scopes.append({})
+        for stmt in block.exprs:
+            self._statement(stmt)
+        self._scopes.pop()
+
+    def visit_program(self, program: "Program"):
+        for stmt in program.exprs:
+            self._statement(stmt)
+
+    def visit_if_stmt(self, stmt: "IfStmt"):
+        self._emit(f"if {stmt.condition.accept(self)}:")
+        self._body(stmt.then_branch)
+        # Flatten `else if` chains so they do not nest Python indentation.
+        else_branch = stmt.else_branch
+        while isinstance(else_branch, IfStmt):
+            self._emit(f"elif {else_branch.condition.accept(self)}:")
+            self._body(else_branch.then_branch)
+            else_branch = else_branch.else_branch
+        if else_branch is not None:
+            self._emit("else:")
+            self._body(else_branch)
+
+    def visit_while_stmt(self, stmt: "WhileStmt"):
+        self._emit(f"while {stmt.condition.accept(self)}:")
+        self._body(stmt.body)
+
+    def visit_for_stmt(self, stmt: "ForStmt"):
+        self._statement(stmt.init)
+        self._emit(f"while {stmt.condition.accept(self)}:")
+        self._indent += 1
+        self._statement(stmt.body)
+        self._statement(stmt.update)
+        self._indent -= 1
+
+    def visit_func_decl(self, stmt: "FuncDecl"):
+        py_name = self._fresh("f", stmt.name.lexeme)
+        # Functions do not capture enclosing scopes: the body only sees its
+        # parameters, its own locals and G.
+        enclosing = self._scopes
+        self._scopes = [{}]
+        params = [self._declare(param.lexeme) for param in stmt.params]
+        self._emit(f"def {py_name}({', '.join(['G'] + params)}):")
+        self._indent += 1
+        self._func_depth += 1
+        self._statement(stmt.body)
+        self._func_depth -= 1
+        if self._lines[-1].endswith(":"):
+            self._emit("pass")
+        self._indent -= 1
+        self._scopes = enclosing
+        self._store(stmt.name.lexeme, py_name, define=True)
+
+    def visit_return_stmt(self, stmt: "ReturnStmt"):
+        if self._func_depth == 0:
+            raise ValueError("Return outside of a function")
+        if stmt.expr is None:
+            self._emit("return None")
+        else:
+            self._emit(f"return {stmt.expr.accept(self)}")
+
+
+def compile_program(expr: Expr) -> CodeType:
+    """
+    Transpiles `expr` and compiles the result. The cache is keyed by the
+    generated source, so a hit still transpiles and only skips `compile()`;
+    it keeps the `CODE_CACHE_MAX_ENTRIES` most recently used code objects.
+    """
+    source = Transpiler().transpile(expr)
+    key = hashlib.sha256(source.encode()).hexdigest()
+    code = _CODE_CACHE.get(key)
+    if code is not None:
+        _CODE_CACHE.move_to_end(key)
+        return code
+    code = compile(source, f"<transpiled {key[:12]}>", "exec")
+    _CODE_CACHE[key] = code
+    if len(_CODE_CACHE) > CODE_CACHE_MAX_ENTRIES:
+        _CODE_CACHE.popitem(last=False)
+    return code
+
+
+class TranspiledInterpreter:
+    """
+    Runs programs by transpiling them to Python and executing the cached code
+    object. Printed values go to `sink`, which defaults to `print`.
+    """
+
+    def __init__(self, sink: Callable[[str], Any] = print):
+        self._sink = sink
+        self._globals: dict[str, Any] = {}
+        self._load_native_funcs()
+
+    def _load_native_funcs(self):
+        for native in (build_native_func_time(), build_native_func_sleep()):
+            self._globals[native.name] = self._wrap_native(native)
+
+    def _wrap_native(self, native: NativeFunc) -> Callable:
+        def call_native(G, *args):
+            assert len(args) == len(
+                native.params
+            ), f"FuncCall: {native.name} has {len(args)} arguments, but {len(native.params)} parameters"
+            return native.func(self, **dict(zip(native.params, args)))
+
+        return call_native
+
+    def _print(self, val: Any):
+        str = f"[interpreter] {val}"
+        str = color_print(str, "yellow")
+        self._sink(str)
+
+    def interpret(self, expr: Expr) -> Any:
+        namespace = {
+            "_add": add_values,
+            "_sub": sub_values,
+            "_mul": mul_values,
+            "_div": div_values,
+            "_neg": _neg,
+            "_not": _not,
+            "_undefined": _undefined,
+            "_print": self._print,
+        }
+        exec(compile_program(expr), namespace)
+        try:
+            return namespace["__program__"](self._globals)
+        except KeyError as e:
+            # Globals are read as `G[name]`.
+            raise ValueError(f"Undefined variable: {e.args[0]}") from e
+
+
+def test_transpiler():
+    import contextlib
+    import io
+
+    from interpreter import Interpreter
+    from parser import Parser
+    from scanner import Scanner
+
+    sources = [
+        """
+        var a = 1;
+        var b = 2;
+        print a + b;
+        {
+            var a = 4;
+            print a + b;
+        }
+        print (a + 2) * 3 / 4 - 1;
+        print "con" + "cat";
+        print a > b or a < b;
+        print a > b and a < b;
+        print nil or "fallback";
+        print -a;
+        """,
+        """
+        var itr = 0;
+        while (itr < 5) {
+            var sq = itr * itr;
+            if sq > 8 {
+                print sq;
+            } else if sq > 3 {
+                print -sq;
+            } else {
+                print "small";
+            }
+            itr = itr + 1;
+        }
+        for (var i = 0; i < 3; i = i + 1;) {
+            print i == 1;
+        }
+        """,
+        """
+        var g = 10;
+        def fib(n) {
+            if (n <= 1) {
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+        def touch() {
+            g = 20;
+            return g;
+        }
+        def add(a, b) {
+            return a + b;
+        }
+        def mix(fn1, a, b) {
+            print fn1(a, b);
+        }
+        print fib(15);
+        print touch();
+        print g;
+        mix(add, 1, 2);
+        def fn() {
+            def inner_fn() {
+                print "running inner_fn";
+            }
+            inner_fn();
+        }
+        fn();
+        """,
+    ]
+
+    for source in sources:
+        print("-" * 80)
+        print(f"Testing source: {source}")
+        program = Parser(Scanner(source).scan()).parse()
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            Interpreter().interpret(program)
+        expected = buf.getvalue()
+        lines = []
+        TranspiledInterpreter(sink=lines.append).interpret(program)
+        output = "".join(line + "\n" for line in lines)
+        print(output, end="")
+        assert expected == output, f"Transpiled output differs:\n{expected}\n{output}"
+
+    # Type checks survive transpilation.
+    program = Parser(Scanner('print 1 + "a";').scan()).parse()
+    try:
+        TranspiledInterpreter(sink=lambda _: None).interpret(program)
+        assert False, "Expected a type error"
+    except AssertionError as e:
+        assert "not the same type" in str(e), e
+
+    # The code cache keeps only the most recently used entries.
+    first = compile_program(Parser(Scanner("print 0;").scan()).parse())
+    for idx in range(CODE_CACHE_MAX_ENTRIES):
+        compile_program(Parser(Scanner(f"print {idx + 1};").scan()).parse())
+    assert len(_CODE_CACHE) == CODE_CACHE_MAX_ENTRIES, len(_CODE_CACHE)
+    assert first not in _CODE_CACHE.values()
+
+    print(Transpiler().transpile(Parser(Scanner(sources[2]).scan()).parse()))
+
+
+if __name__ == "__main__":
+    test_transpiler()
@@ -0,0 +1,312 @@
+from typing import Any
+
+from compiler import Compiler, Function, OpCode
+from func import NativeFunc, build_native_func_sleep, build_native_func_time
+from interface import Expr
+from interpreter import add_values, check_numbers
+from utils import color_print
+
+
+class VM:
+    """
+    Stack-based virtual machine that runs bytecode produced by `Compiler`.
+
+    Language-level calls push a frame onto `frames` instead of recursing in
+    Python, so the whole program runs inside a single dispatch loop.
+    """
+
+    def __init__(self):
+        self._globals: dict[str, Any] = {}
+        self._load_native_funcs()
+
+    def _load_native_funcs(self):
+        for native in (build_native_func_time(), build_native_func_sleep()):
+            self._globals[native.name] = native
+
+    def interpret(self, expr: Expr) -> Any:
+        return self.run(Compiler().compile(expr))
+
+    def _call_native(self, func: NativeFunc, args: list[Any]) -> Any:
+        assert len(args) == len(
+            func.params
+        ), f"FuncCall: {func.name} has {len(args)} arguments, but {len(func.params)} parameters"
+        return func.func(self, **dict(zip(func.params, args)))
+
+    def run(self, script: Function) -> Any:
+        CONST = OpCode.CONST.value
+        POP = OpCode.POP.value
+        GET_LOCAL = OpCode.GET_LOCAL.value
+        SET_LOCAL = OpCode.SET_LOCAL.value
+        GET_GLOBAL = OpCode.GET_GLOBAL.value
+        SET_GLOBAL = OpCode.SET_GLOBAL.value
+        DEFINE_GLOBAL = OpCode.DEFINE_GLOBAL.value
+        ADD = OpCode.ADD.value
+        SUBTRACT = OpCode.SUBTRACT.value
+        MULTIPLY = OpCode.MULTIPLY.value
+        DIVIDE = OpCode.DIVIDE.value
+        NEGATE = OpCode.NEGATE.value
+        NOT = OpCode.NOT.value
+        EQUAL = OpCode.EQUAL.value
+        NOT_EQUAL = OpCode.NOT_EQUAL.value
+        GREATER = OpCode.GREATER.value
+        GREATER_EQUAL = OpCode.GREATER_EQUAL.value
+        LESS = OpCode.LESS.value
+        LESS_EQUAL = OpCode.LESS_EQUAL.value
+        JUMP = OpCode.JUMP.value
+        JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+        JUMP_IF_TRUE_OR_POP = OpCode.JUMP_IF_TRUE_OR_POP.value
+        PRINT = OpCode.PRINT.value
+        CALL = OpCode.CALL.value
+        RETURN = OpCode.RETURN.value
+
+        # A frame owns stack[base:base + num_slots] for its locals, with the
+        # callee itself sitting at stack[base - 1].
+        stack: list[Any] = [script] + [None] * script.num_slots
+        frames: list[tuple] = []
+        push = stack.append
+        pop = stack.pop
+
+        code = script.chunk.code
+        consts = script.chunk.constants
+        glb = self._globals
+        base = 1
+        ip = 0
+
+        while True:
+            op = code[ip]
+            arg = code[ip + 1]
+            ip += 2
+
+            if op == GET_LOCAL:
+                push(stack[base + arg])
+            elif op == CONST:
+                push(consts[arg])
+            elif op == GET_GLOBAL:
+                name = consts[arg]
+                if name not in glb:
+                    raise ValueError(f"Undefined variable: {name}")
+                push(glb[name])
+            elif op == ADD:
+                right_val = pop()
+                left_val = stack[-1]
+                if left_val.__class__ is float and right_val.__class__ is float:
+                    stack[-1] = left_val + right_val
+                else:
+                    stack[-1] = add_values(left_val, right_val)
+            elif op == SUBTRACT:
+                right_val = pop()
+                left_val = stack[-1]
+                if left_val.__class__ is not float or right_val.__class__ is not float:
+                    check_numbers(left_val, right_val)
+                stack[-1] = left_val - right_val
+            elif op == LESS:
+                right_val = pop()
+                stack[-1] = stack[-1] < right_val
+            elif op == LESS_EQUAL:
+                right_val = pop()
+                stack[-1] = stack[-1] <= right_val
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    ip = arg
+            elif op == JUMP:
+                ip = arg
+            elif op == SET_LOCAL:
+                stack[base + arg] = pop()
+            elif op == CALL:
+                callee = stack[-arg - 1]
+                if callee.__class__ is Function:
+                    assert arg == len(
+                        callee.params
+                    ), f"FuncCall: {callee.name} has {arg} arguments, but {len(callee.params)} parameters"
+                    frames.append((code, consts, ip, base))
+                    base = len(stack) - arg
+                    if callee.num_slots > arg:
+                        stack.extend([None] * (callee.num_slots - arg))
+                    code = callee.chunk.code
+                    consts = callee.chunk.constants
+                    ip = 0
+                elif isinstance(callee, NativeFunc):
+                    args = stack[len(stack) - arg :]
+                    del stack[len(stack) - arg - 1 :]
+                    push(self._call_native(callee, args))
+                else:
+                    assert False, f"FuncCall: {callee} is not a function"
+            elif op == RETURN:
+                result = pop()
+                if not frames:
+                    return result
+                del stack[base - 1 :]
+                push(result)
+                code, consts, ip, base = frames.pop()
+            elif op == POP:
+                pop()
+            elif op == MULTIPLY:
+                right_val = pop()
+                left_val = stack[-1]
+                if left_val.__class__ is not float or right_val.__class__ is not float:
+                    check_numbers(left_val, right_val)
+                stack[-1] = left_val * right_val
+            elif op == DIVIDE:
+                right_val = pop()
+                left_val = stack[-1]
+                if left_val.__class__ is not float or right_val.__class__ is not float:
+                    check_numbers(left_val, right_val)
+                stack[-1] = left_val / right_val
+            elif op == GREATER:
+                right_val = pop()
+                stack[-1] = stack[-1] > right_val
+            elif op == GREATER_EQUAL:
+                right_val = pop()
+                stack[-1] = stack[-1] >= right_val
+            elif op == EQUAL:
+                right_val = pop()
+                stack[-1] = stack[-1] == right_val
+            elif op == NOT_EQUAL:
+                right_val = pop()
+                stack[-1] = stack[-1] != right_val
+            elif op == JUMP_IF_TRUE_OR_POP:
+                if stack[-1]:
+                    ip = arg
+                else:
+                    pop()
+            elif op == SET_GLOBAL:
+                name = consts[arg]
+                if name not in glb:
+                    raise ValueError(f"Undefined variable: {name}")
+                glb[name] = pop()
+            elif op == DEFINE_GLOBAL:
+                name = consts[arg]
+                assert name not in glb, f"Variable already defined: {name}"
+                glb[name] = pop()
+            elif op == PRINT:
+                str = f"[interpreter] {pop()}"
+                str = color_print(str, "yellow")
+                print(str)
+            elif op == NEGATE:
+                val = stack[-1]
+                assert isinstance(val, float), f"UnaryExpr: {val} is not a number"
+                stack[-1] = -val
+            elif op == NOT:
+                val = stack[-1]
+                assert isinstance(val, bool), f"UnaryExpr: {val} is not a boolean"
+                stack[-1] = not val
+            else:
+                assert False, f"VM: unknown opcode {op}"
+
+
+def test_vm():
+    import contextlib
+    import io
+
+    from interpreter import Interpreter
+    from parser import Parser
+    from scanner import Scanner
+
+    sources = [
+        """
+        var a = 1;
+        var b = 2;
+        print a + b;
+        {
+            var c = 8;
+            print c;
+        }
+        {
+            var a = 4;
+            print a + b;
+        }
+        print a + 2 * 3;
+        print (a + 2) * 3 / 4;
+        print "con" + "cat";
+        """,
+        """
+        var a = 1;
+        var b = 2;
+        if a > b {
+            print "a is greater than b";
+        } else {
+            print "a is less than or equal to b";
+        }
+        print a > b or a < b;
+        print a > b and a < b;
+        print a and b;
+        print nil or "fallback";
+        """,
+        """
+        var itr = 0;
+        while (itr < 5) {
+            var sq = itr * itr;
+            print sq;
+            itr = itr + 1;
+        }
+        for (var i = 0; i < 3; i = i + 1;) {
+            print -i;
+        }
+        """,
+        """
+        var g = 10;
+        def fib(n) {
+            if (n <= 1) {
+                return n;
+            }
+            return fib(n - 1) + fib(n - 2);
+        }
+        def touch() {
+            g = 20;
+            return g;
+        }
+        print fib(15);
+        print touch();
+        print g;
+        """,
+        """
+        def add(a, b) {
+            return a + b;
+        }
+        def minus(a, b) {
+            return a - b;
+        }
+        def mix(fn1, fn2, a, b) {
+            print fn1(a, b);
+            print fn2(a, b);
+        }
+        mix(add, minus, 1, 2);
+        def fn() {
+            print "running fn";
+            def inner_fn() {
+                print "running inner_fn";
+            }
+            inner_fn();
+        }
+        fn();
+        """,
+    ]
+
+    for source in sources:
+        print("-" * 80)
+        print(f"Testing source: {source}")
+        outputs = []
+        for engine in (Interpreter, VM):
+            program = Parser(Scanner(source).scan()).parse()
+            buf = io.StringIO()
+            with contextlib.redirect_stdout(buf):
+                engine().interpret(program)
+            outputs.append(buf.getvalue())
+        print(outputs[1], end="")
+        assert outputs[0] == outputs[1], f"VM output differs:\n{outputs}"
+
+    # Deep recursion runs in the VM's own frame stack, not Python's.
+    source = """
+    def count(n) {
+        if (n <= 0) {
+            return 0;
+        }
+        return 1 + count(n - 1);
+    }
+    print count(5000);
+    """
+    VM().interpret(Parser(Scanner(source).scan()).parse())
+
+
+if __name__ == "__main__":
+    test_vm()